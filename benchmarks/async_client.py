@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""Compares the rate of getDataset calls made one after another by the
+IngesterPlatformAPI with the AsyncIngesterPlatformAPI at several
+concurrencies, against a local stand-in server adding a latency to each
+request.
+
+Usage: async_client.py [number of calls]
+"""
+import sys
+
+from jcudc24ingesterapi.async_client import AsyncIngesterPlatformAPI, gather
+from jcudc24ingesterapi.ingester_platform_api import IngesterPlatformAPI, Marshaller
+from jcudc24ingesterapi.models.dataset import Dataset
+from jcudc24ingesterapi.models.locations import LocationOffset
+from jcudc24ingesterapi.standin_server import StandInServer
+
+from workloads import best_of
+
+LATENCY = 0.005
+CONCURRENCIES = (1, 8, 32, 64)
+
+def main(count):
+    dataset = Dataset(1, location=2, schema=3, location_offset=LocationOffset(0, 0, 1))
+    dataset.version = 1
+    encoded = Marshaller().obj_to_dict(dataset)
+    server = StandInServer({"getDataset": lambda ds_id: encoded}).start()
+    server.latency = LATENCY
+    try:
+        print "%d calls, %.0fms latency" % (count, LATENCY * 1000)
+        print "%-24s %10s %10s" % ("client", "seconds", "calls/s")
+        client = IngesterPlatformAPI(server.url)
+        seconds = best_of(lambda: [client.getDataset(i) for i in xrange(count)])
+        print "%-24s %9.3fs %10.0f" % ("blocking", seconds, count / seconds)
+        client.close()
+        for concurrency in CONCURRENCIES:
+            client = AsyncIngesterPlatformAPI(server.url, concurrency=concurrency)
+            seconds = best_of(lambda: gather([client.getDataset(i) for i in xrange(count)]))
+            print "%-24s %9.3fs %10.0f" % ("async, concurrency %d" % concurrency, seconds, count / seconds)
+            client.close()
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
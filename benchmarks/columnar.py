@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+"""Compares row and columnar encoding of a SearchResults page of data entries.
+
+Reports the payload size for each codec, and the time to decode the response
+back into domain objects.
+
+Usage: columnar.py [number of entries]
+"""
+import sys
+
+from jcudc24ingesterapi.codec import get_codec
+from jcudc24ingesterapi.ingester_platform_api import Marshaller
+
+from workloads import build_results, best_of
+
+def main(count):
+    results = build_results(count)
+    print "%d entries" % count
+    print "%-18s %12s %10s" % ("payload", "bytes", "decode")
+    for layout, marshaller in (("rows", Marshaller()), ("columns", Marshaller(batch_threshold=1))):
+        results_dict = marshaller.obj_to_dict(results)
+        for name in ("xmlrpc", "json"):
+            codec = get_codec(name)
+            data = codec.dumps_response(results_dict)
+            decode = best_of(lambda: marshaller.dict_to_obj(codec.loads_response(data)))
+            print "%-18s %12d %9.3fs" % ("%s/%s" % (layout, name), len(data), decode)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""Compares the bytes sent and the latency of committing a unit of work, and
+of fetching search results, with and without gzip against a local stand-in
+server. The time the transfer would take on slower links is estimated from
+the bytes, and added to the measured time.
+
+Usage: compression.py [number of entries]
+"""
+import sys
+
+from jcudc24ingesterapi.codec import get_codec
+from jcudc24ingesterapi.ingester_platform_api import IngesterPlatformAPI, Marshaller
+from jcudc24ingesterapi.search import DataEntrySearchCriteria
+from jcudc24ingesterapi.standin_server import StandInServer
+from jcudc24ingesterapi.transport import gzip_encode
+
+from workloads import best_of, build_unit, build_results
+
+# Link speeds in Mbit/s
+LINKS = (10, 100)
+
+def report(name, size, seconds):
+    estimates = ["%9.3fs" % (seconds + size * 8 / (mbits * 1e6)) for mbits in LINKS]
+    print "%-22s %12d %9.3fs %s" % (name, size, seconds, " ".join(estimates))
+
+def main(count):
+    marshaller = Marshaller()
+    unit = build_unit(count)
+    results = marshaller.obj_to_dict(build_results(count))
+    codec = get_codec("xmlrpc")
+    server = StandInServer({"precommit": lambda unit: 1, "commit": lambda transaction_id: [],
+                            "search": lambda criteria, offset, limit: results}).start()
+    try:
+        print "%d entries" % count
+        print "%-22s %12s %10s %s" % ("", "bytes", "local", " ".join(["%7d Mb" % mbits for mbits in LINKS]))
+        request = codec.dumps_request("precommit", (marshaller.obj_to_dict(unit),))
+        for level in (None, 1, 6, 9):
+            client = IngesterPlatformAPI(server.url, compress_threshold=None if level == None else 1024,
+                                         compress_level=level or 6)
+            size = len(request) if level == None else len(gzip_encode(request, level))
+            report("commit, %s" % ("plain" if level == None else "level %d" % level), size,
+                   best_of(lambda: client.commit(unit)))
+
+        response = codec.dumps_response(results)
+        client = IngesterPlatformAPI(server.url)
+        for threshold in (None, 1024):
+            server.compress_threshold = threshold
+            size = len(response) if threshold == None else len(gzip_encode(response))
+            report("search, %s" % ("plain" if threshold == None else "gzipped"), size,
+                   best_of(lambda: client.search(DataEntrySearchCriteria(1), 0, count)))
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
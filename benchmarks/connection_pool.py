@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""Compares the rate of small calls, streamed calls and data entry stream
+reads against a local stand-in server, with pooled keep-alive connections and
+with a new connection for each request, from one thread and from several.
+
+Usage: connection_pool.py [number of requests]
+"""
+import sys
+import threading
+import time
+
+from jcudc24ingesterapi.ingester_platform_api import IngesterPlatformAPI
+from jcudc24ingesterapi.standin_server import StandInServer
+from jcudc24ingesterapi.transport import ConnectionPool
+
+from workloads import best_of
+
+THREADS = 4
+
+def requests(client, kind, count):
+    for i in xrange(count):
+        if kind == "call":
+            client.ping()
+        elif kind == "stream":
+            client.getIngesterLogs(1)
+        else:
+            f_in = client.getDataEntryStream(1, 2, "file")
+            f_in.read()
+            f_in.close()
+
+def threaded(client, kind, count):
+    threads = [threading.Thread(target=requests, args=(client, kind, count // THREADS))
+               for i in range(THREADS)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+def main(count):
+    server = StandInServer({"ping": lambda: "PONG", "getIngesterLogs": lambda dataset_id: []}).start()
+    server.files["/api/data_entry/1/2/file"] = "x" * 4096
+    try:
+        print "%d requests" % count
+        print "%-8s %-8s %-12s %12s %10s" % ("request", "threads", "connections", "requests/s", "opened")
+        for kind in ("call", "stream", "file"):
+            for threads, run in ((1, requests), (THREADS, threaded)):
+                # A pool that keeps no idle connections closes each one after its request
+                for name, size in (("new", 0), ("pooled", 8)):
+                    pool = ConnectionPool(size=size)
+                    client = IngesterPlatformAPI(server.url, pool=pool)
+                    seconds = best_of(lambda: run(client, kind, count))
+                    print "%-8s %-8d %-12s %12.0f %10d" % (kind, threads, name, count / seconds, pool.opened)
+                    pool.close()
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
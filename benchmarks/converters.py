@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Times assigning values that need converting, such as Decimals, longs and
+NumPy scalars, to typed properties (the scalar path) and to frame columns (the
+bulk path). Each is compared with converting the values in python first, as
+callers had to before the converters handled these types.
+
+Usage: converters.py [number of values]
+"""
+import sys
+import datetime
+import timeit
+from decimal import Decimal
+
+from jcudc24ingesterapi import converters
+from jcudc24ingesterapi.models.frame import DataEntryFrame
+from jcudc24ingesterapi.models.locations import LocationOffset
+
+from workloads import START, best_of
+
+def scalar_rates(value, convert, number=200000):
+    """Assignments per second, converting the value by hand and letting the
+    property convert it"""
+    offset = LocationOffset()
+    def by_hand():
+        offset.x = convert(value)
+    def converted():
+        offset.x = value
+    return [number / min(timeit.Timer(func).repeat(3, number)) for func in (by_hand, converted)]
+
+def main(count):
+    scalars = [("Decimal", Decimal("1.5"), float), ("long", 2L, float)]
+    columns = [("Decimal", [Decimal(i) / 10 for i in xrange(count)], float),
+               ("long", [long(i) for i in xrange(count)], int)]
+    try:
+        import numpy
+        scalars.append(("numpy.float32", numpy.float32(1.5), float))
+        columns.append(("numpy.float32 list", list(numpy.arange(count, dtype="float32")), float))
+        columns.append(("numpy.float32 array", numpy.arange(count, dtype="float32"), None))
+    except ImportError:
+        print "numpy is not installed, skipping the NumPy values"
+
+    print "%-20s %14s %14s %8s" % ("scalar", "by hand/s", "converter/s", "speedup")
+    for name, value, convert in scalars:
+        by_hand, converted = scalar_rates(value, convert)
+        print "%-20s %14.0f %14.0f %7.2fx" % (name, by_hand, converted, converted / by_hand)
+
+    timestamps = [START + datetime.timedelta(seconds=i) for i in xrange(count)]
+    frame = DataEntryFrame(1, timestamps)
+    print
+    print "%d values" % count
+    print "%-20s %14s %14s %8s" % ("column", "by hand", "bulk", "speedup")
+    for name, values, convert in columns:
+        def by_hand():
+            frame["value"] = [convert(v) for v in values] if convert != None else values.tolist()
+        def bulk():
+            frame["value"] = values
+        before, after = best_of(by_hand), best_of(bulk)
+        print "%-20s %13.3fs %13.3fs %7.2fx" % (name, before, after, before / after)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""Compares a list of data entries with a DataEntryFrame holding the same
+readings, for the memory per entry, the time to encode them as a batch and the
+time to decode a batch back.
+
+Usage: frames.py [number of entries]
+"""
+import sys
+import datetime
+
+from jcudc24ingesterapi.ingester_platform_api import Marshaller
+from jcudc24ingesterapi.models.data_entry import DataEntry
+from jcudc24ingesterapi.models.frame import DataEntryFrame
+
+from suite import run_forked
+from workloads import START, best_of
+
+def build_entries(count):
+    entries = []
+    for i in xrange(count):
+        entry = DataEntry(1, START + datetime.timedelta(seconds=i), i + 1)
+        entry["temp"] = 20.0 + (i % 100) / 10.0
+        entry["humidity"] = 50.0 + (i % 50)
+        entry["count"] = i
+        entries.append(entry)
+    return entries
+
+def build_frame(count):
+    frame = DataEntryFrame(1)
+    for i in xrange(count):
+        frame.append(START + datetime.timedelta(seconds=i),
+                     {"temp": 20.0 + (i % 100) / 10.0, "humidity": 50.0 + (i % 50), "count": i}, i + 1)
+    return frame
+
+def main(count):
+    marshaller = Marshaller(batch_threshold=1)
+    batch = marshaller.obj_to_dict(build_entries(count))
+    print "%d entries" % count
+    print "%-10s %12s %10s %10s" % ("container", "bytes/entry", "encode", "decode")
+    for name, build, frames in (("entries", build_entries, False), ("frame", build_frame, True)):
+        # Measured in a child process, as freed memory is reused
+        size = run_forked(lambda: build(count), count, 1)["peak_kb"] * 1024.0 / count
+        objs = build(count)
+        print "%-10s %12.0f %9.3fs %9.3fs" % (name, size, best_of(lambda: marshaller.obj_to_dict(objs)),
+                                             best_of(lambda: marshaller.dict_to_obj(batch, frames=frames)))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
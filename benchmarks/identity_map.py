@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""Walks many datasets, fetching the location and schema of each one the way
+a client does, and compares the objects kept and the decode time with and
+without an identity map.
+
+Usage: identity_map.py [number of datasets]
+"""
+import sys
+
+from jcudc24ingesterapi.ingester_platform_api import Marshaller, IdentityMap
+from jcudc24ingesterapi.models.locations import Location
+
+from suite import run_forked
+from workloads import build_schema
+
+LOCATIONS = 50
+SCHEMAS = 20
+
+def build_responses(marshaller):
+    locations = []
+    for i in range(LOCATIONS):
+        location = Location(-19.0 + i / 100.0, 146.0, "Station %d" % i, 10.0)
+        location.id = i + 1
+        location.version = 1
+        locations.append(marshaller.obj_to_dict(location))
+    schemas = []
+    for i in range(SCHEMAS):
+        schema = build_schema(40)
+        schema.id = i + 1
+        schema.version = 1
+        schemas.append(marshaller.obj_to_dict(schema))
+    return locations, schemas
+
+def walk(marshaller, responses, count):
+    locations, schemas = responses
+    loaded = []
+    for i in xrange(count):
+        loaded.append(marshaller.dict_to_obj(locations[i % LOCATIONS]))
+        loaded.append(marshaller.dict_to_obj(schemas[i % SCHEMAS]))
+    return loaded
+
+def main(count):
+    marshaller = Marshaller()
+    responses = build_responses(marshaller)
+    print "%d datasets" % count
+    print "%-14s %10s %10s %10s" % ("decoding", "objects", "peak kB", "seconds")
+    for name in ("new objects", "identity map"):
+        def run():
+            decoder = marshaller.decoding(identity_map=IdentityMap()) if name == "identity map" else marshaller
+            return walk(decoder, responses, count)
+        result = run_forked(run, count, 3)
+        print "%-14s %10d %10d %9.3fs" % (name, result["objects"], result["peak_kb"], result["seconds"])
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
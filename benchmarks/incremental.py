@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Compares decoding a large search response after reading it whole with the
+incremental response parser, against a local stand-in server.
+
+Reports the time to the first result, the total time and the peak memory
+growth of the client.
+
+Usage: incremental.py [number of entries]
+"""
+import sys
+import time
+
+from jcudc24ingesterapi.codec import get_codec
+from jcudc24ingesterapi.ingester_platform_api import IngesterPlatformAPI, Marshaller
+from jcudc24ingesterapi.search import DataEntrySearchCriteria
+from jcudc24ingesterapi.standin_server import StandInServer
+
+from suite import run_forked
+from workloads import build_results
+
+def whole(client, criteria):
+    """The old path, the whole response is read and unmarshalled by xmlrpclib
+    then converted by the marshaller"""
+    start = time.time()
+    results = client._marshaller.dict_to_obj(client.server.search(client._marshaller.obj_to_dict(criteria), 0, 0))
+    first = time.time() - start
+    return first, len(results.results)
+
+def incremental(client, criteria):
+    start = time.time()
+    results = client.search(criteria, 0, 0)
+    first = time.time() - start
+    return first, len(results.results)
+
+def iterated(client, criteria):
+    start = time.time()
+    first = None
+    count = 0
+    for entry in client.iter_search(criteria, 0, 0):
+        if first == None:
+            first = time.time() - start
+        count += 1
+    return first, count
+
+def main(count):
+    response = get_codec("xmlrpc").dumps_response(Marshaller().obj_to_dict(build_results(count, offsets=True)))
+    server = StandInServer({"search": lambda criteria, offset, limit: None}).start()
+    # Send the prepared response, so only the client is measured
+    server.codecs["text/xml"].dumps_response = lambda result: response
+    try:
+        client = IngesterPlatformAPI(server.url)
+        print "%d entries, %d bytes" % (count, len(response))
+        print "%-12s %10s %10s %10s" % ("mode", "first", "total", "peak kB")
+        for name, func in (("whole", whole), ("incremental", incremental), ("iterated", iterated)):
+            r = run_forked(lambda: func(client, DataEntrySearchCriteria(1)), count, 1)
+            # The time to the first result is measured again outside the child
+            print "%-12s %9.3fs %9.3fs %10d" % (name, func(client, DataEntrySearchCriteria(1))[0],
+                                                  r["seconds"], r["peak_kb"])
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""Measures the memory held by a decoded page of search results, with and
+without interning the strings and location offsets.
+
+The response is decoded with the XML-RPC codec, so every string is a separate
+object before interning, as it is when talking to the real service.
+
+Usage: interning.py [number of entries]
+"""
+import gc
+import sys
+
+from jcudc24ingesterapi.codec import get_codec
+from jcudc24ingesterapi.ingester_platform_api import Marshaller
+
+from suite import current_rss
+from workloads import build_results, best_of
+
+def decoded_size(decode):
+    """Returns (RSS growth in kB, gc tracked objects) held by the decoded result"""
+    gc.collect()
+    rss = current_rss()
+    objects = len(gc.get_objects())
+    result = decode()
+    gc.collect()
+    size = (current_rss() - rss, len(gc.get_objects()) - objects)
+    del result
+    return size
+
+def main(count):
+    codec = get_codec("xmlrpc")
+    print "%d entries" % count
+    print "%-12s %-9s %10s %10s %10s" % ("layout", "mode", "held kB", "objects", "decode")
+    for layout, marshaller in (("rows", Marshaller()), ("columns", Marshaller(batch_threshold=1))):
+        data = codec.dumps_response(marshaller.obj_to_dict(build_results(count, offsets=True)))
+        for mode, intern in (("plain", False), ("interned", True)):
+            decode = lambda: marshaller.dict_to_obj(codec.loads_response(data), intern=intern)
+            held, objects = decoded_size(decode)
+            print "%-12s %-9s %10d %10d %9.3fs" % (layout, mode, held, objects, best_of(decode))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""Compares the ways of uploading a large file to a local stand-in server:
+sending the file object with httplib, and streaming it as a FileBody read a
+chunk at a time, mapped into memory, or of unknown length and so sent with
+chunked transfer encoding. Each upload is made in a forked child process,
+which reports its time, CPU time and peak memory growth.
+
+Usage: large_uploads.py [MB] [chunk kB]
+"""
+import os
+import sys
+import json
+import time
+import httplib
+import resource
+import tempfile
+import urlparse
+
+from jcudc24ingesterapi.standin_server import StandInServer
+from jcudc24ingesterapi.transport import ServerProxy, FileBody
+
+from suite import current_rss
+
+HEADERS = {"Content-Type": "application/octet-stream"}
+
+class ReadFileBody(FileBody):
+    """A FileBody that always reads the file rather than mapping it"""
+    def _mappable(self):
+        return False
+
+class UnknownLength(object):
+    """A file that can only be read, so its length is not known"""
+    def __init__(self, f):
+        self.read = f.read
+
+def httplib_upload(url, path, chunk_size):
+    parts = urlparse.urlparse(url)
+    with open(path, "rb") as f:
+        connection = httplib.HTTPConnection(parts.netloc)
+        connection.request("POST", parts.path + "/upload", f,
+                           dict(HEADERS, **{"Content-Length": str(os.path.getsize(path))}))
+        connection.getresponse().read()
+        connection.close()
+
+def body_upload(make_body):
+    def upload(url, path, chunk_size):
+        proxy = ServerProxy(url)
+        with open(path, "rb") as f:
+            r = proxy("open")("POST", "/api/upload", make_body(f, chunk_size), HEADERS)
+            r.read()
+            r.close()
+        proxy("close")()
+    return upload
+
+UPLOADS = [
+    ("httplib, file", httplib_upload),
+    ("FileBody, read", body_upload(ReadFileBody)),
+    ("FileBody, mmap", body_upload(FileBody)),
+    ("FileBody, chunked", body_upload(lambda f, chunk_size: FileBody(UnknownLength(f), chunk_size))),
+    ]
+
+def run_forked(func):
+    """Call func in a child process, returning its seconds, CPU seconds and
+    peak memory growth in kB"""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            rss = current_rss()
+            cpu = os.times()
+            start = time.time()
+            func()
+            seconds = time.time() - start
+            cpu = sum(os.times()[:2]) - sum(cpu[:2])
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+            data = json.dumps({"seconds": seconds, "cpu_seconds": cpu, "peak_kb": max(peak, 0)})
+        except Exception, e:
+            data = json.dumps({"error": repr(e)})
+        with os.fdopen(write_fd, "w") as f:
+            f.write(data)
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(data)
+
+def main(size, chunk_size):
+    fd, path = tempfile.mkstemp()
+    block = os.urandom(1024 * 1024)
+    for i in xrange(size):
+        os.write(fd, block)
+    os.close(fd)
+    server = StandInServer().start()
+    server.keep_uploads = False
+    try:
+        print "%d MB file, %d kB chunks" % (size, chunk_size)
+        print "%-20s %10s %10s %10s %10s" % ("upload", "seconds", "MB/s", "cpu s", "peak kB")
+        for name, upload in UPLOADS:
+            results = [run_forked(lambda: upload(server.url, path, chunk_size * 1024)) for i in range(3)]
+            if "error" in results[0]:
+                print "%-20s failed: %s" % (name, results[0]["error"])
+                continue
+            best = min(results, key=lambda r: r["seconds"])
+            print "%-20s %9.3fs %10.1f %9.3fs %10d" % (name, best["seconds"], size / best["seconds"],
+                                                       min([r["cpu_seconds"] for r in results]),
+                                                       max([r["peak_kb"] for r in results]))
+        assert all([length == size * 1024 * 1024 for p, length in server.uploads])
+    finally:
+        server.stop()
+        os.remove(path)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 256, int(sys.argv[2]) if len(sys.argv) > 2 else 64)
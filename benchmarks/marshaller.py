@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+"""Times the Marshaller on a large UnitOfWork of DataEntry objects.
+
+Usage: marshaller.py [number of entries]
+"""
+import sys
+
+from jcudc24ingesterapi.ingester_platform_api import Marshaller
+
+from workloads import build_unit, best_of
+
+def main(count):
+    unit = build_unit(count)
+    print "%d entries" % count
+    for name, marshaller in (("plan", Marshaller()), ("generated", Marshaller(generated=True))):
+        unit_dict = marshaller.obj_to_dict(unit)
+        encode = best_of(lambda: marshaller.obj_to_dict(unit))
+        decode = best_of(lambda: marshaller.dict_to_obj(unit_dict))
+        print "%-10s obj_to_dict: %.3fs (%.0f entries/s)" % (name, encode, count / encode)
+        print "%-10s dict_to_obj: %.3fs (%.0f entries/s)" % (name, decode, count / decode)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Times resolving datasets, with the getDataset, getLocation, getSchema and
+getRegion calls of each, one call at a time and in batches sent with
+system.multicall, against a local stand-in server. The server can add a
+latency to each request, standing in for the round trip of a network.
+
+Usage: multicall.py [number of datasets]
+"""
+import sys
+
+from jcudc24ingesterapi.ingester_platform_api import IngesterPlatformAPI, Marshaller
+from jcudc24ingesterapi.models.dataset import Dataset
+from jcudc24ingesterapi.models.locations import Location, Region, LocationOffset
+from jcudc24ingesterapi.standin_server import StandInServer
+
+from workloads import best_of, build_schema
+
+LATENCIES = (0, 0.002)
+BATCH_SIZE = 250
+
+def build_methods(marshaller):
+    dataset = Dataset(1, location=2, schema=3, location_offset=LocationOffset(0, 0, 1))
+    location = Location(-19.0, 146.0, "Station", 10.0)
+    schema = build_schema(10)
+    region = Region("Townsville", [(-19.0, 146.0), (-19.5, 146.0), (-19.5, 146.5)])
+    for obj in (dataset, location, schema, region):
+        obj.id = 1
+        obj.version = 1
+    encoded = [marshaller.obj_to_dict(obj) for obj in (dataset, location, schema, region)]
+    return dict(zip(("getDataset", "getLocation", "getSchema", "getRegion"),
+                    [lambda obj_id, value=value: value for value in encoded]))
+
+def one_at_a_time(client, count):
+    for i in xrange(count):
+        client.getDataset(i)
+        client.getLocation(i)
+        client.getSchema(i)
+        client.getRegion(i)
+
+def batched(client, count):
+    batch = client.createBatch()
+    for start in xrange(0, count, BATCH_SIZE):
+        for i in xrange(start, min(start + BATCH_SIZE, count)):
+            batch.getDataset(i)
+            batch.getLocation(i)
+            batch.getSchema(i)
+            batch.getRegion(i)
+        batch.send()
+
+def main(count):
+    server = StandInServer(build_methods(Marshaller())).start()
+    try:
+        client = IngesterPlatformAPI(server.url)
+        print "%d datasets, %d calls, batches of %d datasets" % (count, count * 4, BATCH_SIZE)
+        print "%-10s %-14s %10s %12s" % ("latency", "calls", "seconds", "datasets/s")
+        for latency in LATENCIES:
+            server.latency = latency
+            for name, func in (("one at a time", one_at_a_time), ("batched", batched)):
+                seconds = best_of(lambda: func(client, count))
+                print "%8.1fms %-14s %9.3fs %12.0f" % (latency * 1000, name, seconds, count / seconds)
+        client.close()
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
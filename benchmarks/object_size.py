@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""Measures the memory used per domain object, with and without the compact
+(slots) layout. Each layout is measured in a fresh interpreter, as it is fixed
+when the model classes are created.
+
+Usage: object_size.py [number of objects]
+"""
+import os
+import sys
+import gc
+import datetime
+import subprocess
+
+def measure(count):
+    from jcudc24ingesterapi.models.data_entry import DataEntry
+    from jcudc24ingesterapi.models.dataset import Dataset
+    from jcudc24ingesterapi.models.locations import Location, LocationOffset
+    from jcudc24ingesterapi.models.system import IngesterLog
+    from suite import current_rss
+
+    def log():
+        log = IngesterLog()
+        log.dataset_id = 1
+        log.timestamp = datetime.datetime(2013, 1, 1)
+        log.level = "INFO"
+        return log
+    builders = [("DataEntry", lambda: DataEntry(1, datetime.datetime(2013, 1, 1), 1)),
+                ("LocationOffset", lambda: LocationOffset(0, 1, 2)),
+                ("Location", lambda: Location(-19.0, 146.0, "Site", 100)),
+                ("Dataset", lambda: Dataset(location=1, schema=2)),
+                ("IngesterLog", log)]
+    for name, builder in builders:
+        gc.collect()
+        rss = current_rss()
+        objs = [builder() for i in xrange(count)]
+        # Less the list's pointer
+        print "%s %f" % (name, (current_rss() - rss) * 1024.0 / count - 8)
+        del objs
+
+def main(count):
+    sizes = {}
+    for compact in ("0", "1"):
+        env = dict(os.environ, JCUDC24INGESTERAPI_COMPACT=compact)
+        out = subprocess.check_output([sys.executable, __file__, "--measure", str(count)], env=env)
+        for line in out.splitlines():
+            name, size = line.split()
+            sizes.setdefault(name, {})[compact] = float(size)
+    print "%-16s %10s %10s" % ("class", "dict", "slots")
+    for name in sorted(sizes):
+        print "%-16s %9.0fB %9.0fB" % (name, sizes[name]["0"], sizes[name]["1"])
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--measure":
+        measure(int(sys.argv[2]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""Compares the size and encode time of a unit of work updating the enabled
+flag of many datasets, sending the whole datasets and sending only the
+changed properties.
+
+Usage: partial_updates.py [number of datasets]
+"""
+import sys
+
+from jcudc24ingesterapi import track_changes
+from jcudc24ingesterapi.codec import get_codec
+from jcudc24ingesterapi.ingester_platform_api import Marshaller, UnitOfWork
+from jcudc24ingesterapi.models.dataset import Dataset
+from jcudc24ingesterapi.models.locations import LocationOffset
+from jcudc24ingesterapi.models.data_sources import PullDataSource
+from jcudc24ingesterapi.models.sampling import PeriodicSampling
+
+from workloads import best_of
+
+SCRIPT = "\n".join(["value_%d = float(line[%d])" % (i, i) for i in range(100)])
+
+def build(count, tracked):
+    unit = UnitOfWork(None)
+    for i in xrange(count):
+        dataset = Dataset(i + 1, location=1, schema=2, location_offset=LocationOffset(0, 0, i % 10),
+                          data_source=PullDataSource("http://example.com/station/%d" % i, "*.csv",
+                                                     mime_type="text/csv", field="file",
+                                                     processing_script=SCRIPT,
+                                                     sampling=PeriodicSampling(60000)))
+        dataset.version = 1
+        dataset.description = "Weather station %d" % i
+        if tracked:
+            track_changes(dataset)
+        dataset.enabled = True
+        unit.update(dataset)
+    return unit
+
+def main(count):
+    marshaller = Marshaller()
+    codec = get_codec("xmlrpc")
+    print "%d datasets" % count
+    print "%-8s %12s %10s" % ("update", "bytes", "encode")
+    for name, tracked in (("full", False), ("partial", True)):
+        unit = build(count, tracked)
+        size = len(codec.dumps_request("precommit", (marshaller.obj_to_dict(unit),)))
+        print "%-8s %12d %9.3fs" % (name, size, best_of(lambda: codec.dumps_request(
+            "precommit", (marshaller.obj_to_dict(unit),))))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""Compares posting locations one at a time with post_many at several numbers
+of workers, against a local stand-in server adding a latency to each request.
+
+Usage: post_many.py [number of locations]
+"""
+import sys
+import itertools
+
+from jcudc24ingesterapi.ingester_platform_api import IngesterPlatformAPI
+from jcudc24ingesterapi.models.locations import Location
+from jcudc24ingesterapi.standin_server import StandInServer
+
+from workloads import best_of
+
+LATENCY = 0.005
+WORKERS = (1, 4, 8, 16)
+
+def main(count):
+    ids = itertools.count(1)
+    def insert(obj):
+        obj["id"] = ids.next()
+        return obj
+    server = StandInServer({"insert": insert}).start()
+    server.latency = LATENCY
+    locations = [Location(-19.0 + i / 1000.0, 146.0, "Station %d" % i, 10.0) for i in xrange(count)]
+    try:
+        client = IngesterPlatformAPI(server.url)
+        print "%d locations, %.0fms latency" % (count, LATENCY * 1000)
+        print "%-22s %10s %12s" % ("post", "seconds", "locations/s")
+        seconds = best_of(lambda: [client.post(location) for location in locations])
+        print "%-22s %9.3fs %12.0f" % ("one at a time", seconds, count / seconds)
+        for workers in WORKERS:
+            seconds = best_of(lambda: client.post_many(locations, workers=workers))
+            print "%-22s %9.3fs %12.0f" % ("post_many, %d workers" % workers, seconds, count / seconds)
+        client.close()
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""Compares plain data entries with record classes compiled from the schema,
+for the memory per entry and the time to build and encode them.
+
+Usage: records.py [number of entries]
+"""
+import sys
+import datetime
+
+from jcudc24ingesterapi.ingester_platform_api import Marshaller
+from jcudc24ingesterapi.models.data_entry import DataEntry
+from jcudc24ingesterapi.models.records import record_class
+from jcudc24ingesterapi.schemas.data_entry_schemas import DataEntrySchema
+from jcudc24ingesterapi.schemas.data_types import Double, Integer, String
+
+from suite import run_forked
+from workloads import START, best_of
+
+def build(cls, count):
+    entries = []
+    for i in xrange(count):
+        entry = cls(1, START + datetime.timedelta(seconds=i), i + 1)
+        entry["temp"] = 20.0 + (i % 100) / 10.0
+        entry["humidity"] = 50.0 + (i % 50)
+        entry["count"] = i
+        entry["sensor"] = "T1"
+        entries.append(entry)
+    return entries
+
+def main(count):
+    schema = DataEntrySchema("weather")
+    for data_type in (Double("temp"), Double("humidity"), Integer("count"), String("sensor")):
+        schema.addAttr(data_type)
+    marshaller = Marshaller()
+    print "%d entries" % count
+    print "%-10s %12s %10s %10s" % ("class", "bytes/entry", "build", "encode")
+    for cls in (DataEntry, record_class(schema)):
+        # Measured in a child process, as freed memory is reused
+        size = run_forked(lambda: build(cls, count), count, 1)["peak_kb"] * 1024.0 / count
+        entries = build(cls, count)
+        print "%-10s %12.0f %9.3fs %9.3fs" % (cls.__name__, size, best_of(lambda: build(cls, count)),
+                                             best_of(lambda: marshaller.obj_to_dict(entries)))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
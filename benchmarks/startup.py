@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+"""Measures the cost of creating IngesterPlatformAPI clients.
+
+Each measurement runs in a fresh interpreter, and reports the time to import
+the API, create the clients, and marshal a DataEntry, along with the peak
+resident memory of the process.
+
+Usage: startup.py [number of clients]
+"""
+import sys
+import subprocess
+
+CHILD = """
+import resource, sys, time
+start = time.time()
+from jcudc24ingesterapi.ingester_platform_api import IngesterPlatformAPI
+from jcudc24ingesterapi.models.data_entry import DataEntry
+imported = time.time()
+clients = [IngesterPlatformAPI("http://localhost:8080/api") for i in range(%d)]
+created = time.time()
+clients[-1]._marshaller.dict_to_obj(clients[-1]._marshaller.obj_to_dict(DataEntry(1)))
+used = time.time()
+print imported - start, created - imported, used - created, \\
+    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "simplesos" in sys.modules
+"""
+
+def main(count):
+    out = subprocess.check_output([sys.executable, "-c", CHILD % count])
+    imported, created, used, maxrss, simplesos = out.split()
+    print "import:          %.1fms" % (float(imported) * 1000)
+    print "%5d clients:    %.1fms" % (count, float(created) * 1000)
+    print "first marshal:   %.1fms" % (float(used) * 1000)
+    print "peak RSS:        %dkB" % int(maxrss)
+    print "simplesos loaded: %s" % simplesos
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
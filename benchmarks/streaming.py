@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""Compares the peak memory of encoding a large unit of work as a whole, with
+obj_to_dict and dumps_request, against streaming it with stream_request.
+
+Usage: streaming.py [number of entries]
+"""
+import sys
+
+from jcudc24ingesterapi.codec import get_codec
+from jcudc24ingesterapi.ingester_platform_api import Marshaller
+
+from suite import run_forked
+from workloads import build_unit
+
+def whole(marshaller, codec, unit):
+    return len(codec.dumps_request("precommit", (marshaller.obj_to_dict(unit),)))
+
+def streamed(marshaller, codec, unit):
+    size = 0
+    for chunk in marshaller.stream_request(codec, "precommit", (unit,)):
+        size += len(chunk)
+    return size
+
+def main(count):
+    marshaller = Marshaller()
+    unit = build_unit(count)
+    print "%d entries" % count
+    print "%-8s %-9s %10s %10s" % ("codec", "mode", "peak kB", "seconds")
+    for name in ("xmlrpc", "json", "msgpack"):
+        codec = get_codec(name)
+        for mode, encode in (("whole", whole), ("streamed", streamed)):
+            r = run_forked(lambda: encode(marshaller, codec, unit), count, 1)
+            print "%-8s %-9s %10d %10.3f" % (name, mode, r["peak_kb"], r["seconds"])
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""Marshaller benchmark suite with recorded baselines.
+
+Times obj_to_dict, dict_to_obj, xmlrpclib.dumps and xmlrpclib.loads on
+synthetic workloads built from the real model classes, and reports for each:
+
+* ops/s - complete conversions of the workload per second
+* items/s - objects (entries, attributes or datasets) converted per second
+* peak - the peak memory growth in kB while converting
+* objects - the net number of gc tracked objects allocated by one conversion
+
+Each operation is measured in a forked child process so the memory figures of
+one do not affect another. Results can be saved as a JSON baseline, and later
+runs compared against it to catch regressions.
+
+Usage:
+    suite.py [--large] [--generated] [--batch] [--save NAME] [--compare NAME]
+"""
+import os
+import gc
+import sys
+import json
+import time
+import platform
+import resource
+import xmlrpclib
+from optparse import OptionParser
+
+from jcudc24ingesterapi.ingester_platform_api import Marshaller
+
+from workloads import build_results, build_schema, build_deep_unit
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# name, builder, number of items
+WORKLOADS = [
+    ("schema_300", lambda: build_schema(300), 300),
+    ("deep_unit_500", lambda: build_deep_unit(500), 500),
+    ("search_10k", lambda: build_results(10000, offsets=True), 10000),
+    ]
+LARGE_WORKLOADS = [
+    ("search_100k", lambda: build_results(100000, offsets=True), 100000),
+    ("search_1m", lambda: build_results(1000000, offsets=True), 1000000),
+    ]
+
+def current_rss():
+    """Current resident memory in kB (Linux only, 0 elsewhere)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except IOError:
+        return 0
+
+def measure(func, repeat):
+    """Run func, returning (best time, peak memory growth, objects allocated).
+    Fast functions are run in a loop so each timing covers at least 0.2s."""
+    gc.collect()
+    gc.disable()
+    try:
+        rss = current_rss()
+        objects = len(gc.get_objects())
+        start = time.time()
+        result = func()
+        first = time.time() - start
+        objects = len(gc.get_objects()) - objects
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+        del result
+        gc.collect()
+
+        loops = max(1, int(0.2 / first)) if first > 0 else 1000
+        best = first
+        for i in range(repeat - 1):
+            start = time.time()
+            for j in xrange(loops):
+                func()
+            best = min(best, (time.time() - start) / loops)
+            gc.collect()
+    finally:
+        gc.enable()
+    return best, max(peak, 0), objects
+
+def run_forked(func, items, repeat):
+    """Measure func in a child process, so that the memory it uses is not
+    mixed up with the other measurements"""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            elapsed, peak, objects = measure(func, repeat)
+            data = json.dumps({"seconds": elapsed, "ops_per_sec": 1 / elapsed if elapsed else 0,
+                               "items_per_sec": items / elapsed if elapsed else 0,
+                               "peak_kb": peak, "objects": objects})
+        except Exception, e:
+            data = json.dumps({"error": repr(e)})
+        with os.fdopen(write_fd, "w") as f:
+            f.write(data)
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(data)
+
+def run_workload(builder, items, options):
+    """Measure each operation on one workload"""
+    marshaller = Marshaller(generated=options.generated,
+                            batch_threshold=1 if options.batch else None)
+    obj = builder()
+    obj_dict = marshaller.obj_to_dict(obj)
+    xml = xmlrpclib.dumps((obj_dict,), allow_none=True)
+    operations = [
+        ("obj_to_dict", lambda: marshaller.obj_to_dict(obj)),
+        ("dict_to_obj", lambda: marshaller.dict_to_obj(obj_dict)),
+        ("xmlrpc_dumps", lambda: xmlrpclib.dumps((obj_dict,), allow_none=True)),
+        ("xmlrpc_loads", lambda: xmlrpclib.loads(xml)),
+        ]
+    results = {}
+    for name, func in operations:
+        results[name] = run_forked(func, items, options.repeat)
+        if "error" in results[name]:
+            sys.stderr.write("%s failed: %s\n" % (name, results.pop(name)["error"]))
+    return results
+
+def print_results(results, baseline=None):
+    print "%-14s %-13s %10s %12s %10s %10s" % ("workload", "operation", "ops/s",
+                                               "items/s", "peak kB", "objects"),
+    print " change" if baseline else ""
+    for workload in sorted(results):
+        for op in sorted(results[workload]):
+            r = results[workload][op]
+            print "%-14s %-13s %10.2f %12.0f %10d %10d" % (workload, op, r["ops_per_sec"],
+                    r["items_per_sec"], r["peak_kb"], r["objects"]),
+            if baseline and workload in baseline and op in baseline[workload]:
+                print " %+6.1f%%" % (100.0 * (r["seconds"] / baseline[workload][op]["seconds"] - 1))
+            else:
+                print
+
+def regressions(results, baseline, tolerance):
+    """List the operations that are more than tolerance slower than the baseline"""
+    slower = []
+    for workload in results:
+        for op in results[workload]:
+            if workload not in baseline or op not in baseline[workload]: continue
+            change = results[workload][op]["seconds"] / baseline[workload][op]["seconds"] - 1
+            if change > tolerance:
+                slower.append((workload, op, change))
+    return slower
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, name + ".json")
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--large", action="store_true", help="include the 100k and 1M entry workloads")
+    parser.add_option("--generated", action="store_true", help="use the generated marshaller mode")
+    parser.add_option("--batch", action="store_true", help="encode data entries as columnar batches")
+    parser.add_option("--repeat", type="int", default=5, help="number of timed runs per operation")
+    parser.add_option("--only", help="only run workloads whose name contains this")
+    parser.add_option("--save", metavar="NAME", help="save the results as a baseline")
+    parser.add_option("--compare", metavar="NAME", help="compare the results with a baseline")
+    parser.add_option("--tolerance", type="float", default=0.20,
+                      help="slowdown reported as a regression [default: %default]")
+    options, args = parser.parse_args(argv)
+
+    workloads = WORKLOADS + (LARGE_WORKLOADS if options.large else [])
+    if options.only:
+        workloads = [w for w in workloads if options.only in w[0]]
+
+    results = {}
+    for name, builder, items in workloads:
+        results[name] = run_workload(builder, items, options)
+
+    baseline = None
+    if options.compare:
+        with open(baseline_path(options.compare)) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if options.save:
+        if not os.path.exists(BASELINE_DIR):
+            os.makedirs(BASELINE_DIR)
+        with open(baseline_path(options.save), "w") as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "generated": bool(options.generated), "batch": bool(options.batch),
+                       "results": results}, f, indent=1, sort_keys=True)
+        print "Saved baseline %s" % baseline_path(options.save)
+
+    if baseline != None:
+        slower = regressions(results, baseline, options.tolerance)
+        for workload, op, change in slower:
+            print "REGRESSION: %s %s is %.1f%% slower" % (workload, op, change * 100)
+        return 1 if slower else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""Compares the fixed format timestamp codec with the generic strptime and
+strftime based functions.
+
+Usage: timestamps.py [number of timestamps]
+"""
+import sys
+import datetime
+
+import jcudc24ingesterapi
+from jcudc24ingesterapi import parse_timestamp, format_timestamp, parse_timestamps, \
+    _parse_timestamp_generic, _format_timestamp_generic
+
+from workloads import best_of
+
+def main(count):
+    start = datetime.datetime(2013, 1, 1, tzinfo=jcudc24ingesterapi.UTC)
+    dates = [start + datetime.timedelta(seconds=i, microseconds=i * 1000) for i in range(count)]
+    strings = [format_timestamp(d) for d in dates]
+    # A series that repeats, as when many attributes share a timestamp
+    repeated = [strings[i // 10] for i in range(count)]
+
+    print "%d timestamps" % count
+    for name, func, values in (("format generic", _format_timestamp_generic, dates),
+                               ("format", format_timestamp, dates),
+                               ("parse generic", _parse_timestamp_generic, strings),
+                               ("parse", parse_timestamp, strings),
+                               ("parse repeated", parse_timestamp, repeated)):
+        elapsed = best_of(lambda: [func(v) for v in values])
+        print "%-16s %.3fs (%.0f/s)" % (name, elapsed, count / elapsed)
+    elapsed = best_of(lambda: parse_timestamps(strings))
+    print "%-16s %.3fs (%.0f/s)" % ("parse batch", elapsed, count / elapsed)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Compares the get and set throughput of TypedProperty against the original
+property built from the getter and setter closures, on domain objects with
+and without a listener.
+
+Usage: typed_properties.py
+"""
+import timeit
+
+from jcudc24ingesterapi import APIDomainObject, typed, getter, setter, deleter
+
+class Closures(APIDomainObject):
+    value = property(getter("_value"), setter("_value", int), deleter("_value"))
+    unset = property(getter("_unset"), setter("_unset", int), deleter("_unset"))
+    number = property(getter("_number"), setter("_number", float), deleter("_number"))
+
+class Descriptors(APIDomainObject):
+    value = typed("_value", int)
+    unset = typed("_unset", int)
+    number = typed("_number", float)
+
+def listener(obj, attr, value):
+    pass
+
+STATEMENTS = [
+    ("get", "obj.value"),
+    ("get unset", "obj.unset"),
+    ("set", "obj.value = 5"),
+    ("set None", "obj.value = None"),
+    ("set converted", "obj.number = 5"),
+    ]
+
+obj = None
+
+def rate(cls, statement, with_listener, number=500000):
+    """Operations per second"""
+    global obj
+    obj = cls()
+    obj.value = 1
+    if with_listener:
+        obj.set_listener(listener)
+    timer = timeit.Timer(statement, "from __main__ import obj")
+    return number / min(timer.repeat(3, number))
+
+def main():
+    print "%-14s %-9s %12s %12s %8s" % ("operation", "listener", "closures/s", "typed/s", "speedup")
+    for with_listener in (False, True):
+        for name, statement in STATEMENTS:
+            before = rate(Closures, statement, with_listener)
+            after = rate(Descriptors, statement, with_listener)
+            print "%-14s %-9s %12.0f %12.0f %7.2fx" % (name, with_listener, before, after, after / before)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""Times committing a unit of work with many files, uploading them one at a
+time and over several parallel connections, against a local stand-in server
+adding a latency to each request.
+
+Usage: uploads.py [number of files] [kB per file]
+"""
+import sys
+import datetime
+from StringIO import StringIO
+
+from jcudc24ingesterapi.ingester_platform_api import IngesterPlatformAPI, UnitOfWork
+from jcudc24ingesterapi.models.data_entry import DataEntry, FileObject
+from jcudc24ingesterapi.standin_server import StandInServer
+
+from workloads import START, best_of
+
+LATENCY = 0.005
+WORKERS = (1, 4, 8, 16)
+
+def build_unit(count, data):
+    unit = UnitOfWork(None)
+    for i in xrange(count):
+        entry = DataEntry(1, START + datetime.timedelta(seconds=i))
+        entry["image"] = FileObject(f_handle=StringIO(data), mime_type="image/jpeg")
+        unit.insert(entry)
+    return unit
+
+def main(count, size):
+    data = "\xff" * (size * 1024)
+    server = StandInServer({"precommit": lambda unit: 1, "commit": lambda transaction_id: []}).start()
+    server.latency = LATENCY
+    try:
+        print "%d files of %d kB, %.0fms latency" % (count, size, LATENCY * 1000)
+        print "%-12s %10s %10s %10s" % ("workers", "seconds", "files/s", "MB/s")
+        for workers in WORKERS:
+            client = IngesterPlatformAPI(server.url, upload_workers=workers)
+            def commit():
+                del server.uploads[:]
+                client.commit(build_unit(count, data))
+            seconds = best_of(commit)
+            print "%-12d %9.3fs %10.0f %10.1f" % (workers, seconds, count / seconds,
+                                                   count * size / 1024.0 / seconds)
+            client.close()
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200, int(sys.argv[2]) if len(sys.argv) > 2 else 256)
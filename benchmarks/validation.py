@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Times checking a unit's worth of data entries against their schema, with
+the compiled validator and with a generic loop over the schema attributes,
+for a list of entries and for a DataEntryFrame.
+
+Usage: validation.py [number of entries]
+"""
+import sys
+import datetime
+
+from jcudc24ingesterapi.models.data_entry import DataEntry
+from jcudc24ingesterapi.models.frame import DataEntryFrame
+from jcudc24ingesterapi.schemas.data_entry_schemas import DataEntrySchema
+from jcudc24ingesterapi.schemas.data_types import Double, Integer, String
+from jcudc24ingesterapi.schemas.validation import compile_validator, _value_types
+
+from workloads import START, best_of
+
+def build(count):
+    entries = []
+    for i in xrange(count):
+        entry = DataEntry(1, START + datetime.timedelta(seconds=i), i + 1)
+        entry["temp"] = 20.0 + (i % 100) / 10.0
+        entry["humidity"] = 50.0 + (i % 50)
+        entry["count"] = i
+        entry["sensor"] = "T1"
+        entries.append(entry)
+    return entries
+
+def generic_validate(schema, entries):
+    """Looks up each attribute of each entry in the schema"""
+    errors = []
+    types = dict([(name, _value_types(data_type)) for name, data_type in schema.attrs.iteritems()])
+    for entry in entries:
+        for k, v in entry.data.iteritems():
+            if k not in types:
+                errors.append((entry.id, k))
+            elif v is not None and not isinstance(v, tuple(types[k])):
+                errors.append((entry.id, k))
+    return errors
+
+def main(count):
+    schema = DataEntrySchema("weather")
+    for data_type in (Double("temp"), Double("humidity"), Integer("count"), String("sensor")):
+        schema.addAttr(data_type)
+    entries = build(count)
+    frame = DataEntryFrame.from_entries(entries)
+    validator = compile_validator(schema)
+    required = compile_validator(schema, required=True)
+    print "%d entries" % count
+    print "%-28s %10s %12s" % ("check", "seconds", "entries/s")
+    for name, func in (("generic loop", lambda: generic_validate(schema, entries)),
+                       ("compiled", lambda: validator.validate(entries)),
+                       ("compiled, all required", lambda: required.validate(entries)),
+                       ("compiled, frame", lambda: validator.validate(frame)),
+                       ("compiled, frame, required", lambda: required.validate(frame))):
+        seconds = best_of(func)
+        print "%-28s %9.3fs %12.0f" % (name, seconds, count / seconds)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
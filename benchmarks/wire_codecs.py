@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""Compares the wire codecs on DataEntry heavy payloads.
+
+For a UnitOfWork commit request and a SearchResults response page, reports the
+payload size and the time to encode and decode it with each codec.
+
+Usage: wire_codecs.py [number of entries]
+"""
+import sys
+
+from jcudc24ingesterapi.codec import CODECS, get_codec, msgpack
+from jcudc24ingesterapi.ingester_platform_api import Marshaller
+
+from workloads import build_unit, build_results, best_of
+
+def main(count):
+    marshaller = Marshaller()
+    unit_dict = marshaller.obj_to_dict(build_unit(count))
+    results_dict = marshaller.obj_to_dict(build_results(count))
+    print "%d entries, msgpack implementation: %s" % (count, "msgpack" if msgpack != None else "pure python")
+    print "%-22s %12s %10s %10s" % ("payload", "bytes", "encode", "decode")
+    for name in sorted(CODECS):
+        codec = get_codec(name)
+        data = codec.dumps_request("precommit", (unit_dict,))
+        encode = best_of(lambda: codec.dumps_request("precommit", (unit_dict,)))
+        decode = best_of(lambda: codec.loads_request(data))
+        print "%-22s %12d %9.3fs %9.3fs" % ("commit/" + name, len(data), encode, decode)
+
+        data = codec.dumps_response(results_dict)
+        encode = best_of(lambda: codec.dumps_response(results_dict))
+        decode = best_of(lambda: codec.loads_response(data))
+        print "%-22s %12d %9.3fs %9.3fs" % ("search/" + name, len(data), encode, decode)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,77 @@
+"""Synthetic workloads built from the real model classes, shared by the
+benchmarks."""
+import time
+import datetime
+
+import jcudc24ingesterapi
+from jcudc24ingesterapi.models.data_entry import DataEntry, FileObject
+from jcudc24ingesterapi.models.dataset import Dataset
+from jcudc24ingesterapi.models.locations import Location, LocationOffset
+from jcudc24ingesterapi.models.data_sources import PullDataSource
+from jcudc24ingesterapi.models.sampling import PeriodicSampling
+from jcudc24ingesterapi.schemas.data_entry_schemas import DataEntrySchema
+from jcudc24ingesterapi.schemas.data_types import Double, Integer, String, FileDataType
+from jcudc24ingesterapi.search import SearchResults
+from jcudc24ingesterapi.ingester_platform_api import UnitOfWork
+
+START = datetime.datetime(2013, 1, 1, tzinfo=jcudc24ingesterapi.UTC)
+
+def best_of(func, repeat=3):
+    """Time func, returning the fastest of repeat runs in seconds"""
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+def build_unit(count):
+    """A unit of work inserting count numeric data entries"""
+    unit = UnitOfWork(None)
+    for i in range(count):
+        entry = DataEntry(1, START + datetime.timedelta(seconds=i))
+        entry.location_offset = LocationOffset(0, 0, i % 10)
+        entry["temp"] = 20.0 + (i % 100) / 10.0
+        entry["humidity"] = 50.0 + (i % 50)
+        entry["sensor"] = "T1"
+        unit.insert(entry)
+    return unit
+
+def build_results(count, offsets=False):
+    """A page of search results holding count data entries with a file each"""
+    results = []
+    for i in range(count):
+        entry = DataEntry(1, START + datetime.timedelta(seconds=i), id=i + 1)
+        entry["temp"] = 20.0 + (i % 100) / 10.0
+        entry["humidity"] = 50.0 + (i % 50)
+        entry["image"] = FileObject(f_path="%d/image" % (i + 1), mime_type="image/jpeg")
+        if offsets:
+            entry.location_offset = LocationOffset(0, 0, i % 10)
+        results.append(entry)
+    return SearchResults(results, 0, count, count)
+
+def build_schema(count):
+    """A data entry schema with count attributes"""
+    schema = DataEntrySchema("wide_schema")
+    types = (Double, Integer, String, FileDataType)
+    for i in range(count):
+        schema.addAttr(types[i % len(types)]("attr_%d" % i, description="Attribute %d" % i, units="m"))
+    schema.extends = [1, 2, 3]
+    return schema
+
+def build_deep_unit(count):
+    """A unit of work provisioning count locations, each with a schema and a
+    dataset with a data source, sampling and location offset"""
+    unit = UnitOfWork(None)
+    for i in range(count):
+        loc = Location(-19.0 - i / 1000.0, 146.0, "Site %d" % i, 100)
+        loc_id = unit.insert(loc)
+        schema = build_schema(10)
+        schema.name = "schema_%d" % i
+        schema_id = unit.insert(schema)
+        dataset = Dataset(location=loc_id, schema=schema_id, location_offset=LocationOffset(0, 1, 2),
+                data_source=PullDataSource("http://example.com/%d" % i, "file", field="file",
+                                           sampling=PeriodicSampling(10000)))
+        dataset.description = "Dataset %d" % i
+        unit.insert(dataset)
+    return unit
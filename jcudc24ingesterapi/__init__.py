@@ -4,17 +4,171 @@ pkg_resources.declare_namespace(__name__)
 __author__ = 'Casey Bajema'
 from decimal import Decimal
 
+import os
 import time
 import datetime
 import email.utils as eut
 import inspect
+import types
+
+class ConverterRegistry(dict):
+    """The registered type converters, (from, to) = func.
+
+    Converters are looked up with find, which caches the result for each
+    source type and set of valid types. Types without a registered converter
+    are passed to the resolvers, functions of (from type, to type) returning
+    a converter or None, so whole families of types can be handled. By
+    default a converter registered for a base class is used for its
+    subclasses, and NumPy scalars are converted to the python value they
+    hold.
+    """
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.resolvers = [_base_class_converter, _numpy_converter]
+        self._cache = {}
+        # Changed whenever a converter or resolver is added or removed, so the
+        # caches of the typed properties know to look converters up again
+        self.generation = 0
+
+    def _changed(self):
+        self._cache.clear()
+        self.generation += 1
+
+    def __setitem__(self, key, func):
+        dict.__setitem__(self, key, func)
+        self._changed()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._changed()
+
+    def register(self, from_type, to_type, func):
+        self[(from_type, to_type)] = func
+
+    def add_resolver(self, resolver):
+        self.resolvers.append(resolver)
+        self._changed()
+
+    def find(self, from_type, valid_types):
+        """The converter from from_type to the first of the valid types that
+        it can be converted to, or None"""
+        key = (from_type, valid_types)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        func = None
+        for t in valid_types:
+            func = self.get((from_type, t))
+            if func != None:
+                break
+        else:
+            for t in valid_types:
+                for resolver in self.resolvers:
+                    func = resolver(self, from_type, t)
+                    if func != None:
+                        break
+                if func != None:
+                    break
+        self._cache[key] = func
+        return func
+
+    def convert(self, value, valid_types):
+        """Convert the value to one of the valid types, raising a TypeError if
+        there is no converter for it"""
+        if type(value) in valid_types:
+            return value
+        func = self.find(type(value), valid_types)
+        if func == None:
+            raise TypeError("%s Not of required type %s" % (str(type(value)), str(valid_types)))
+        return func(value)
+
+    def convert_column(self, values):
+        """Convert a column of values in bulk to plain python values that can
+        be marshalled. A NumPy array of numbers is returned as it is, other
+        NumPy arrays are converted to a list, and each type in a list is only
+        looked up once."""
+        dtype = getattr(values, "dtype", None)
+        if dtype != None:
+            if dtype.kind in "fiu":
+                return values
+            elif dtype.kind == "M":
+                return values.astype("datetime64[us]").tolist()
+            values = values.tolist()
+        if not isinstance(values, list):
+            return values
+        funcs = {}
+        for t in set(map(type, values)):
+            if t not in _PLAIN_TYPES:
+                func = self.find(t, PLAIN_TYPES)
+                if func != None:
+                    funcs[t] = func
+        if not funcs:
+            return values
+        return [funcs[type(v)](v) if type(v) in funcs else v for v in values]
+
+def _base_class_converter(registry, from_type, to_type):
+    """Use the converter registered for a base class of the type, for types
+    other than the builtin ones (so a bool is not converted as an int)"""
+    if from_type.__module__ == "__builtin__":
+        return None
+    for base in from_type.__mro__[1:]:
+        func = registry.get((base, to_type))
+        if func != None:
+            return func
+    return None
+
+def _numpy_converter(registry, from_type, to_type):
+    """Convert NumPy scalars, only importing numpy when one is seen"""
+    if from_type.__module__ != "numpy":
+        return None
+    import numpy
+    if issubclass(from_type, numpy.datetime64):
+        if to_type is datetime.datetime:
+            return lambda v: v.astype("datetime64[us]").item()
+    elif issubclass(from_type, numpy.bool_):
+        if to_type is bool:
+            return bool
+    elif issubclass(from_type, numpy.integer):
+        if to_type in (int, long, float):
+            return to_type
+    elif issubclass(from_type, numpy.floating):
+        if to_type is float:
+            return float
+    elif issubclass(from_type, (numpy.str_, numpy.unicode_)):
+        if to_type in (str, unicode):
+            return to_type
+    return None
+
+def _date_to_datetime(d):
+    if isinstance(d, datetime.datetime):
+        # A subclass, such as a pandas Timestamp
+        return datetime.datetime(d.year, d.month, d.day, d.hour, d.minute, d.second,
+                                 d.microsecond, d.tzinfo)
+    return datetime.datetime(d.year, d.month, d.day)
+
+def _long_to_int(v):
+    """Convert a long to an int, raising an OverflowError if it does not fit,
+    as int() would return a long"""
+    i = int(v)
+    if type(i) is not int:
+        raise OverflowError("%d does not fit in an int" % v)
+    return i
 
 # Registered type convertes. (from, to) = func
-converters = { (Decimal, float): float,
+converters = ConverterRegistry({ (Decimal, float): float,
               (unicode, str): str,
               (int, float): float,
               (unicode, int): int,
-              (unicode, bool): bool }
+              (unicode, bool): bool,
+              (long, int): _long_to_int,
+              (long, float): float,
+              (datetime.date, datetime.datetime): _date_to_datetime })
+
+# The types of plain values, in the order they are tried in when converting
+# other values for a column
+PLAIN_TYPES = (int, long, float, bool, str, unicode, datetime.datetime)
+_PLAIN_TYPES = frozenset(PLAIN_TYPES + (type(None),))
 
 def deleter(attr):
     """Deleter closure, used to remove the inner variable"""
@@ -27,6 +181,7 @@ def getter(attr):
     def getter_real(self):
         if not hasattr(self, attr): return None
         return getattr(self, attr)
+    getter_real.attr = attr
     return getter_real
 
 def setter(attr, valid_types):
@@ -53,11 +208,82 @@ def setter(attr, valid_types):
     setter_real.valid_types = valid_types
     return setter_real
 
+class TypedProperty(property):
+    """A property that checks the type of the values assigned to it, storing
+    them in the attr attribute of the object. Values of other types are
+    converted with the registered converters, unset properties read as None.
+
+    The converter for each source type is looked up when a value of that type
+    is first assigned, and again after the registered converters change.
+    Converters in the conversions dict of the property are used before the
+    registered ones.
+    """
+    def __init__(self, attr, valid_types, doc=""):
+        if type(valid_types) not in (list, tuple):
+            valid_types = (valid_types,)
+        self.attr = attr
+        self.valid_types = tuple(valid_types)
+        # Source type -> converter of this property only
+        self.conversions = {}
+        # Source type -> converter found, for the converters generation
+        self._cache = {}
+        self._generation = converters.generation
+        property.__init__(self, self._getter(), self._setter(), deleter(attr), doc)
+        # Otherwise the class docstring is shown
+        self.__doc__ = doc
+
+    def _getter(self):
+        attr = self.attr
+        def getter_real(self):
+            return getattr(self, attr, None)
+        getter_real.attr = attr
+        return getter_real
+
+    def _setter(self):
+        attr = self.attr
+        valid_types = self.valid_types
+        exact_types = frozenset(valid_types)
+        prop = self
+        cache = self._cache
+        def setter_real(self, var):
+            if var is not None and type(var) not in exact_types and \
+                    not isinstance(var, valid_types):
+                func = cache.get(type(var)) if prop._generation == converters.generation else None
+                var = func(var) if func is not None else prop.convert(var)
+            setattr(self, attr, var)
+            listener = getattr(self, "_listener", None)
+            if listener is not None and isinstance(listener, types.FunctionType):
+                listener(self, attr, var)
+        setter_real.valid_types = valid_types
+        return setter_real
+
+    def convert(self, var):
+        """Convert the value to one of the valid types, raising a TypeError if
+        there is no converter for it"""
+        if self._generation != converters.generation:
+            self._cache.clear()
+            self._generation = converters.generation
+        func = self._cache.get(type(var))
+        if func == None:
+            func = self.conversions.get(type(var))
+            if func == None:
+                func = converters.find(type(var), self.valid_types)
+            if func == None:
+                raise TypeError("%s Not of required type %s for %s"%(str(type(var)), str(self.valid_types), self.attr))
+            self._cache[type(var)] = func
+        return func(var)
+
 def typed(attr, valid_types, docs=""):
     """Wrapper around property() so that we can easily apply type checking
     to properties"""
-    prop = property(getter(attr), setter(attr, valid_types), deleter(attr), docs)
-    return prop
+    return TypedProperty(attr, valid_types, docs)
+
+def typed_attr(prop):
+    """Returns the attribute that backs a typed() property, or None if it is
+    some other property"""
+    if isinstance(prop, TypedProperty):
+        return prop.attr
+    return getattr(prop.fget, "attr", None)
 
 class FixedOffset(datetime.tzinfo):
     """Fixed offset in minutes east from UTC."""
@@ -77,16 +303,21 @@ class FixedOffset(datetime.tzinfo):
 
 UTC = FixedOffset(0, "UTC")
 
-def format_timestamp(in_date):
+def _format_timestamp_generic(in_date):
     if type(in_date) == str:
         in_date = datetime.datetime(*eut.parsedate(in_date)[:6])
     r = in_date.strftime("%Y-%m-%dT%H:%M:%S.%f")
     r = r[0:r.find(".")+4] + 'Z'
     return r
 
-def parse_timestamp(date_str):
-    """Parse the date time returned by the DAM"""
-    if date_str == None: return None
+def format_timestamp(in_date):
+    """Format a datetime in the wire format, YYYY-MM-DDTHH:MM:SS.fffZ"""
+    if type(in_date) is datetime.datetime:
+        return "%04d-%02d-%02dT%02d:%02d:%02d.%03dZ" % (in_date.year, in_date.month, in_date.day,
+                in_date.hour, in_date.minute, in_date.second, in_date.microsecond // 1000)
+    return _format_timestamp_generic(in_date)
+
+def _parse_timestamp_generic(date_str):
     (dt, mSecs) = date_str.strip().split(".") 
     if mSecs.endswith('Z'): mSecs = mSecs[:-1]
     mSecs = mSecs+'0'*(6-len(mSecs))
@@ -95,6 +326,45 @@ def parse_timestamp(date_str):
 
     return dt+mSeconds
 
+# Recently parsed timestamps, datetimes are immutable so they can be shared
+_timestamp_cache = {}
+_TIMESTAMP_CACHE_SIZE = 1024
+
+def parse_timestamp(date_str):
+    """Parse the date time returned by the DAM"""
+    if date_str == None: return None
+    dt = _timestamp_cache.get(date_str)
+    if dt != None: return dt
+    s = date_str
+    if len(s) == 24 and s[4] == '-' and s[7] == '-' and s[10] == 'T' and s[13] == ':' \
+            and s[16] == ':' and s[19] == '.' and s[23] == 'Z':
+        dt = datetime.datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]), int(s[11:13]),
+                               int(s[14:16]), int(s[17:19]), int(s[20:23]) * 1000, UTC)
+    else:
+        dt = _parse_timestamp_generic(s)
+    if len(_timestamp_cache) >= _TIMESTAMP_CACHE_SIZE:
+        _timestamp_cache.clear()
+    _timestamp_cache[date_str] = dt
+    return dt
+
+def format_timestamps(values):
+    """Format a list of datetimes, or a numpy datetime64 array, returning a
+    list of timestamp strings. None values are kept as None."""
+    if type(values).__name__ == "ndarray" and values.dtype.kind == "M":
+        import numpy
+        ret = numpy.datetime_as_string(values.astype("datetime64[ms]"), unit="ms")
+        return [None if v == "NaT" else v + "Z" for v in ret.tolist()]
+    return [format_timestamp(v) if v != None else None for v in values]
+
+def parse_timestamps(values, datetime64=False):
+    """Parse a list of timestamp strings. If datetime64 is True the result
+    is a numpy datetime64[ms] array (in UTC) rather than a list of datetimes."""
+    if datetime64:
+        import numpy
+        return numpy.array([v[:-1] if v != None and v.endswith("Z") else v for v in values],
+                           dtype="datetime64[ms]")
+    return [parse_timestamp(v) for v in values]
+
 class ValidationError(object):
     """A ValidationError represents an issue with a field on an object.
     """
@@ -112,14 +382,127 @@ class ValidationError(object):
     def __str__(self):
         return "%s: %s"%(self.field, self.message)
 
+# Store the backing fields of typed() properties in slots rather than the
+# instance __dict__, which roughly halves the size of the domain objects. This
+# must be set before the model modules are imported, so it can also be turned
+# off by setting JCUDC24INGESTERAPI_COMPACT=0 in the environment.
+COMPACT_OBJECTS = os.environ.get("JCUDC24INGESTERAPI_COMPACT", "1") != "0"
+
+def _slot_names(cls):
+    """All the slots of the class and its bases"""
+    names = set()
+    for klass in cls.__mro__:
+        slots = klass.__dict__.get("__slots__", ())
+        names.update([slots] if isinstance(slots, basestring) else slots)
+    return names
+
+class DomainObjectType(type):
+    """The metaclass of the API domain objects. In compact mode the backing
+    fields of the typed() properties declared by each class are added to its
+    __slots__. The objects keep a __dict__ for any other attributes, which is
+    only allocated when one is set.
+    """
+    def __new__(mcs, name, bases, namespace):
+        if COMPACT_OBJECTS and "__slots__" not in namespace:
+            inherited = set()
+            for base in bases:
+                inherited.update(_slot_names(base))
+            if not any(isinstance(base, DomainObjectType) for base in bases):
+                slots = set(["__dict__", "__weakref__"])
+            else:
+                slots = set()
+            for v in namespace.values():
+                if isinstance(v, property) and typed_attr(v) != None:
+                    slots.add(typed_attr(v))
+            namespace["__slots__"] = tuple(sorted(slots - inherited))
+        return type.__new__(mcs, name, bases, namespace)
+
 class APIDomainObject(object):
     """This is the base class of all API domain objects, and provides a listener method
     for indicating when data on the object is updated."""
+    __metaclass__ = DomainObjectType
+    # Set on the object by set_listener
+    _listener = None
+    # The names of the changed properties, set by track_changes
+    _changes = None
+
     def set_listener(self, func):
         self._listener = func
+
+    def __getstate__(self):
+        state = dict(getattr(self, "__dict__", {}))
+        if "_changes" in state:
+            # Change tracking is not pickled, only the listener it wraps
+            del state["_changes"]
+        if hasattr(state.get("_listener"), "tracked_listener"):
+            state["_listener"] = state["_listener"].tracked_listener
+        for attr in _slot_names(type(self)):
+            if attr not in ("__dict__", "__weakref__") and hasattr(self, attr):
+                state[attr] = getattr(self, attr)
+        return state
+
+    def __setstate__(self, state):
+        for k, v in state.iteritems():
+            setattr(self, k, v)
         
     def validate(self):
         """Checks all of the properties on the object, and returns a list
         of validation errors."""
         return []
+
+# Class -> {backing attribute: property name} of its typed() properties
+_property_names = {}
+
+def _typed_properties(cls):
+    names = _property_names.get(cls)
+    if names == None:
+        names = {}
+        for klass in reversed(cls.__mro__):
+            for k, v in vars(klass).items():
+                if isinstance(v, property) and typed_attr(v) != None:
+                    names[typed_attr(v)] = k
+        _property_names[cls] = names
+    return names
+
+def _tracking_listener(obj, changes, name=None):
+    """Set a listener on obj that adds the name of each changed property to
+    changes, or the given name for a nested object. Any other listener of the
+    object is still called."""
+    previous = obj._listener
+    previous = getattr(previous, "tracked_listener", previous)
+    names = _typed_properties(type(obj))
+    def listener(self, attr, value):
+        changes.add(name if name != None else names.get(attr, attr))
+        if previous != None:
+            previous(self, attr, value)
+    listener.tracked_listener = previous
+    obj.set_listener(listener)
+    for attr in names:
+        value = getattr(obj, attr, None)
+        if isinstance(value, APIDomainObject):
+            _tracking_listener(value, changes, name if name != None else names[attr])
+
+def track_changes(obj):
+    """Start recording which properties of the object are changed, forgetting
+    any changes recorded so far. Changing a property of a nested domain object
+    (such as a dataset's data source) counts as a change of the property that
+    holds it.
+
+    >>> from jcudc24ingesterapi.models.dataset import Dataset
+    >>> from jcudc24ingesterapi.models.locations import LocationOffset
+    >>> dataset = Dataset(1, location_offset=LocationOffset(0, 0, 0))
+    >>> track_changes(dataset)
+    >>> dataset.enabled = True
+    >>> dataset.location_offset.z = 5
+    >>> sorted(changed_properties(dataset))
+    ['enabled', 'location_offset']
+    """
+    changes = set()
+    _tracking_listener(obj, changes)
+    obj._changes = changes
+
+def changed_properties(obj):
+    """The set of names of the properties changed since track_changes was
+    called, or None if the object's changes are not tracked"""
+    return getattr(obj, "_changes", None)
     
\ No newline at end of file
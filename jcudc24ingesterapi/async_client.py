@@ -0,0 +1,201 @@
+"""A client making calls to the ingester platform in the background.
+
+AsyncIngesterPlatformAPI has the methods of the IngesterPlatformAPI, but
+each one returns a Future straight away, and the call is made by one of a
+bounded number of worker threads sharing a pool of connections. Commit
+uploads and data entry downloads are made by the workers too.
+
+>>> from jcudc24ingesterapi.standin_server import StandInServer
+>>> server = StandInServer({"ping": lambda: "PONG"}).start()
+>>> client = AsyncIngesterPlatformAPI(server.url, concurrency=4)
+>>> futures = [client.ping() for i in range(10)]
+>>> gather(futures)[0]
+'PONG'
+>>> client.close()
+>>> server.stop()
+"""
+__author__ = 'Casey Bajema'
+import logging
+import Queue
+import sys
+import threading
+
+from jcudc24ingesterapi.ingester_platform_api import IngesterPlatformAPI, UnitOfWork
+from jcudc24ingesterapi.transport import ConnectionPool, BLOCK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# The IngesterPlatformAPI methods that are made in the background
+ASYNC_METHODS = ["ping", "post", "insert", "update", "delete", "search", "commit", "enableDataset",
+                 "disableDataset", "getIngesterLogs", "getRegion", "getLocation", "getSchema",
+                 "getDataset", "getDataEntry", "getDataEntryStream", "findDatasets", "reset"]
+
+class TimeoutError(Exception):
+    """Raised when the result of a Future is not ready in time"""
+    pass
+
+class Future(object):
+    """The result of a call that is made in the background"""
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._value = None
+        self._exc_info = None
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the call to complete, returning its result or raising the
+        exception it failed with"""
+        if not self._event.wait(timeout):
+            raise TimeoutError("The call did not complete in %s seconds" % timeout)
+        if self._exc_info != None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._value
+
+    def exception(self, timeout=None):
+        """Wait for the call to complete, returning the exception it failed
+        with, or None"""
+        if not self._event.wait(timeout):
+            raise TimeoutError("The call did not complete in %s seconds" % timeout)
+        return self._exc_info[1] if self._exc_info != None else None
+
+    def add_done_callback(self, func):
+        """Call func with the future once it is done, straight away if it
+        already is"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(func)
+                return
+        self._call(func)
+
+    def set_result(self, value):
+        self._value = value
+        self._finish()
+
+    def set_exception(self, exc_info):
+        """Set the exception of a failed call, as returned by sys.exc_info()"""
+        self._exc_info = exc_info
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for func in callbacks:
+            self._call(func)
+
+    def _call(self, func):
+        try:
+            func(self)
+        except Exception:
+            logger.exception("Exception in the callback of a future")
+
+def gather(futures, timeout=None):
+    """Wait for all the futures, returning their results in order. The
+    exception of the first failed call is raised."""
+    return [future.result(timeout) for future in futures]
+
+class AsyncIngesterPlatformAPI(object):
+    """Makes the calls of an IngesterPlatformAPI in the background, returning
+    a Future for each.
+
+    :param concurrency: the most calls made at once, which is also the number
+        of connections kept open
+    :param max_pending: the most calls waiting for a worker, further calls
+        block until there is room, None for no limit
+    The other arguments are those of the IngesterPlatformAPI.
+    """
+    def __init__(self, service_url, auth=None, concurrency=8, max_pending=None, **kwargs):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        kwargs.setdefault("pool", ConnectionPool(size=concurrency))
+        self.client = IngesterPlatformAPI(service_url, auth, **kwargs)
+        self.concurrency = concurrency
+        self._queue = Queue.Queue(max_pending or 0)
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, func, *args, **kwargs):
+        """Call func(*args, **kwargs) in the background, returning a Future of
+        its result"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise ValueError("The client has been closed")
+            # Start the workers as they are needed
+            if len(self._workers) < self.concurrency:
+                worker = threading.Thread(target=self._work, name="ingesterapi-worker-%d" % len(self._workers))
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, func, args, kwargs = item
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                future.set_exception(sys.exc_info())
+            else:
+                future.set_result(result)
+
+    def downloadDataEntryStream(self, ds_id, de_id, attr, f_out):
+        """Copy a data entry stream to the file f_out in the background,
+        returning a Future of the number of bytes copied, or None if there is
+        no such stream"""
+        return self.submit(self._download, ds_id, de_id, attr, f_out)
+
+    def _download(self, ds_id, de_id, attr, f_out):
+        stream = self.client.getDataEntryStream(ds_id, de_id, attr)
+        if stream is None:
+            return None
+        size = 0
+        try:
+            while True:
+                data = stream.read(BLOCK_SIZE)
+                if not data:
+                    break
+                f_out.write(data)
+                size += len(data)
+        finally:
+            stream.close()
+        return size
+
+    def createUnitOfWork(self):
+        """Creates a unit of work, which commits through this client, so
+        unit.commit() returns a Future"""
+        return UnitOfWork(self)
+
+    def close(self):
+        """Wait for the calls already made to complete, then stop the workers
+        and close the connections"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers)
+        for worker in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join()
+        self.client.close()
+
+def _background(name):
+    def call(self, *args, **kwargs):
+        return self.submit(getattr(self.client, name), *args, **kwargs)
+    call.__name__ = name
+    call.__doc__ = "Make IngesterPlatformAPI.%s in the background, returning a Future of its result" % name
+    return call
+
+for _name in ASYNC_METHODS:
+    setattr(AsyncIngesterPlatformAPI, _name, _background(_name))
+del _name
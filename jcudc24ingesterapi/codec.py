@@ -0,0 +1,462 @@
+"""Wire codecs used to encode the calls made to the ingester platform.
+
+A codec turns a method call into a request body, and a response body back into
+the result, raising an xmlrpclib.Fault if the server returned an error so that
+translate_exception works the same for all codecs. The server side methods are
+provided as well so the codecs can be used by stand-in servers.
+
+* xmlrpc - XML-RPC, the default
+* json - JSON-RPC 2.0
+* msgpack - MessagePack-RPC, using the msgpack package if it is installed
+
+Requests can also be written incrementally through a request writer, which is
+driven by Marshaller.stream_request to send very large requests without
+building them in memory first.
+"""
+__author__ = 'Casey Bajema'
+import itertools
+import json
+import json.encoder
+import struct
+import xmlrpclib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class Codec(object):
+    """Base class of all wire codecs"""
+    name = None
+    content_type = None
+
+    def dumps_request(self, methodname, params):
+        """Encode a method call"""
+        raise NotImplementedError()
+
+    def loads_request(self, data):
+        """Decode a method call, returning (methodname, params)"""
+        raise NotImplementedError()
+
+    def dumps_response(self, result):
+        """Encode the result of a method call"""
+        raise NotImplementedError()
+
+    def dumps_fault(self, fault):
+        """Encode an xmlrpclib.Fault"""
+        raise NotImplementedError()
+
+    def loads_response(self, data):
+        """Decode the response to a method call, raising an xmlrpclib.Fault
+        if the call failed."""
+        raise NotImplementedError()
+
+    def request_writer(self, methodname, param_count, out):
+        """Returns a RequestWriter that appends an encoded call of methodname
+        with param_count parameters to the list out"""
+        raise NotImplementedError()
+
+class RequestWriter(object):
+    """Writes a method call one value at a time. Each parameter is written
+    between begin_param and end_param, structs and arrays are written by
+    start_struct/start_array, their contents, and then end_struct/end_array.
+    Each struct value is preceded by a call to member with its name.
+    """
+    def __init__(self, out):
+        self.write = out.append
+
+    def begin_param(self):
+        pass
+
+    def end_param(self):
+        pass
+
+    def scalar(self, value):
+        raise NotImplementedError()
+
+    def start_array(self, length):
+        raise NotImplementedError()
+
+    def end_array(self):
+        pass
+
+    def start_struct(self, length):
+        raise NotImplementedError()
+
+    def member(self, name):
+        raise NotImplementedError()
+
+    def end_struct(self):
+        pass
+
+    def finish(self):
+        pass
+
+class XmlRpcCodec(Codec):
+    name = "xmlrpc"
+    content_type = "text/xml"
+
+    def dumps_request(self, methodname, params):
+        return xmlrpclib.dumps(tuple(params), methodname, allow_none=True)
+
+    def loads_request(self, data):
+        params, methodname = xmlrpclib.loads(data)
+        return methodname, params
+
+    def dumps_response(self, result):
+        return xmlrpclib.dumps((result,), methodresponse=True, allow_none=True)
+
+    def dumps_fault(self, fault):
+        return xmlrpclib.dumps(fault, methodresponse=True, allow_none=True)
+
+    def loads_response(self, data):
+        return xmlrpclib.loads(data)[0][0]
+
+    def request_writer(self, methodname, param_count, out):
+        return XmlRpcRequestWriter(methodname, out)
+
+class XmlRpcRequestWriter(RequestWriter):
+    def __init__(self, methodname, out):
+        RequestWriter.__init__(self, out)
+        self._marshaller = xmlrpclib.Marshaller("utf-8", allow_none=True)
+        self._dispatch = self._marshaller.dispatch
+        # True for each struct that has a member open
+        self._members = []
+        self.write("<?xml version='1.0'?>\n<methodCall>\n<methodName>%s</methodName>\n<params>\n"
+                   % xmlrpclib.escape(methodname))
+
+    def begin_param(self):
+        self.write("<param>\n")
+
+    def end_param(self):
+        self.write("</param>\n")
+
+    def scalar(self, value):
+        self._dispatch[type(value)](self._marshaller, value, self.write)
+
+    def start_array(self, length):
+        self.write("<value><array><data>\n")
+
+    def end_array(self):
+        self.write("</data></array></value>\n")
+
+    def start_struct(self, length):
+        self.write("<value><struct>\n")
+        self._members.append(False)
+
+    def member(self, name):
+        if self._members[-1]:
+            self.write("</member>\n")
+        self._members[-1] = True
+        if type(name) is unicode:
+            name = name.encode("utf-8")
+        self.write("<member>\n<name>%s</name>\n" % xmlrpclib.escape(name))
+
+    def end_struct(self):
+        if self._members.pop():
+            self.write("</member>\n")
+        self.write("</struct></value>\n")
+
+    def finish(self):
+        self.write("</params>\n</methodCall>\n")
+
+class JsonRpcCodec(Codec):
+    name = "json"
+    content_type = "application/json"
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def dumps_request(self, methodname, params):
+        return json.dumps({"jsonrpc":"2.0", "method":methodname, "params":list(params),
+                           "id":self._ids.next()}, separators=(",", ":"))
+
+    def loads_request(self, data):
+        request = json.loads(data)
+        return request["method"], tuple(request.get("params", ()))
+
+    def dumps_response(self, result):
+        return json.dumps({"jsonrpc":"2.0", "result":result, "id":None}, separators=(",", ":"))
+
+    def dumps_fault(self, fault):
+        return json.dumps({"jsonrpc":"2.0", "error":{"code":fault.faultCode, "message":fault.faultString},
+                           "id":None}, separators=(",", ":"))
+
+    def loads_response(self, data):
+        response = json.loads(data)
+        if response.get("error") != None:
+            raise xmlrpclib.Fault(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    def request_writer(self, methodname, param_count, out):
+        return JsonRpcRequestWriter(methodname, self._ids.next(), out)
+
+class JsonRpcRequestWriter(RequestWriter):
+    def __init__(self, methodname, request_id, out):
+        RequestWriter.__init__(self, out)
+        self._encode = json.JSONEncoder(separators=(",", ":")).encode
+        # The number of values written so far in each open array or struct,
+        # struct values are counted by member
+        self._counts = [0]
+        self._in_struct = [False]
+        self.write('{"jsonrpc":"2.0","method":%s,"id":%d,"params":[' % (self._encode(methodname), request_id))
+
+    def _separate(self):
+        if not self._in_struct[-1]:
+            if self._counts[-1]:
+                self.write(",")
+            self._counts[-1] += 1
+
+    def scalar(self, value):
+        self._separate()
+        if type(value) is str or type(value) is unicode:
+            self.write(json.encoder.encode_basestring_ascii(value))
+        else:
+            self.write(self._encode(value))
+
+    def start_array(self, length):
+        self._separate()
+        self.write("[")
+        self._counts.append(0)
+        self._in_struct.append(False)
+
+    def end_array(self):
+        self._counts.pop()
+        self._in_struct.pop()
+        self.write("]")
+
+    def start_struct(self, length):
+        self._separate()
+        self.write("{")
+        self._counts.append(0)
+        self._in_struct.append(True)
+
+    def member(self, name):
+        if self._counts[-1]:
+            self.write(",")
+        self._counts[-1] += 1
+        self.write(self._encode(name) + ":")
+
+    def end_struct(self):
+        self._counts.pop()
+        self._in_struct.pop()
+        self.write("}")
+
+    def finish(self):
+        self.write("]}")
+
+class MsgPackCodec(Codec):
+    """MessagePack-RPC, a request is [0, msgid, method, params] and a response
+    [1, msgid, error, result], with errors sent as [code, message].
+    """
+    name = "msgpack"
+    content_type = "application/x-msgpack"
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        if msgpack != None:
+            self.pack = msgpack.packb
+            self.unpack = _msgpack_unpackb
+        else:
+            self.pack = packb
+            self.unpack = unpackb
+
+    def dumps_request(self, methodname, params):
+        return self.pack([0, self._ids.next(), methodname, list(params)])
+
+    def loads_request(self, data):
+        request = self.unpack(data)
+        return request[2], tuple(request[3])
+
+    def dumps_response(self, result):
+        return self.pack([1, 0, None, result])
+
+    def dumps_fault(self, fault):
+        return self.pack([1, 0, [fault.faultCode, fault.faultString], None])
+
+    def loads_response(self, data):
+        response = self.unpack(data)
+        if response[2] != None:
+            raise xmlrpclib.Fault(response[2][0], response[2][1])
+        return response[3]
+
+    def request_writer(self, methodname, param_count, out):
+        return MsgPackRequestWriter(methodname, self._ids.next(), param_count, self.pack, out)
+
+class MsgPackRequestWriter(RequestWriter):
+    def __init__(self, methodname, request_id, param_count, pack, out):
+        RequestWriter.__init__(self, out)
+        self._pack = pack
+        self._out = out
+        _pack_len(out, 4, 0x90, 15, None, 0xdc, 0xdd)
+        self.write(pack(0))
+        self.write(pack(request_id))
+        self.write(pack(methodname))
+        _pack_len(out, param_count, 0x90, 15, None, 0xdc, 0xdd)
+
+    def scalar(self, value):
+        self.write(self._pack(value))
+
+    def start_array(self, length):
+        _pack_len(self._out, length, 0x90, 15, None, 0xdc, 0xdd)
+
+    def start_struct(self, length):
+        _pack_len(self._out, length, 0x80, 15, None, 0xde, 0xdf)
+
+    def member(self, name):
+        self.write(self._pack(name))
+
+def _msgpack_unpackb(data):
+    return msgpack.unpackb(data, use_list=True)
+
+# Codecs by name
+CODECS = {"xmlrpc": XmlRpcCodec, "json": JsonRpcCodec, "msgpack": MsgPackCodec}
+
+def get_codec(codec):
+    """Returns a codec instance from a codec or the name of one"""
+    if codec == None:
+        return XmlRpcCodec()
+    elif isinstance(codec, Codec):
+        return codec
+    elif codec in CODECS:
+        return CODECS[codec]()
+    raise ValueError("Unknown codec: %s" % codec)
+
+# A pure python implementation of the subset of MessagePack used by the codec.
+_pack_double = struct.Struct(">Bd").pack
+_pack_B = struct.Struct(">BB").pack
+_pack_H = struct.Struct(">BH").pack
+_pack_I = struct.Struct(">BI").pack
+_pack_Q = struct.Struct(">BQ").pack
+_pack_b = struct.Struct(">Bb").pack
+_pack_h = struct.Struct(">Bh").pack
+_pack_i = struct.Struct(">Bi").pack
+_pack_q = struct.Struct(">Bq").pack
+
+def _pack_len(out, n, fix, fix_max, code8, code16, code32):
+    if n <= fix_max:
+        out.append(chr(fix | n))
+    elif code8 != None and n < 0x100:
+        out.append(_pack_B(code8, n))
+    elif n < 0x10000:
+        out.append(_pack_H(code16, n))
+    else:
+        out.append(_pack_I(code32, n))
+
+def _pack(obj, out):
+    t = type(obj)
+    if t is str or t is unicode:
+        if t is unicode: obj = obj.encode("utf-8")
+        _pack_len(out, len(obj), 0xa0, 31, 0xd9, 0xda, 0xdb)
+        out.append(obj)
+    elif t is bool:
+        out.append("\xc3" if obj else "\xc2")
+    elif t is int or t is long:
+        if 0 <= obj < 0x80: out.append(chr(obj))
+        elif -32 <= obj < 0: out.append(chr(obj & 0xff))
+        elif 0 < obj:
+            if obj < 0x100: out.append(_pack_B(0xcc, obj))
+            elif obj < 0x10000: out.append(_pack_H(0xcd, obj))
+            elif obj < 0x100000000: out.append(_pack_I(0xce, obj))
+            else: out.append(_pack_Q(0xcf, obj))
+        else:
+            if obj >= -0x80: out.append(_pack_b(0xd0, obj))
+            elif obj >= -0x8000: out.append(_pack_h(0xd1, obj))
+            elif obj >= -0x80000000: out.append(_pack_i(0xd2, obj))
+            else: out.append(_pack_q(0xd3, obj))
+    elif t is float:
+        out.append(_pack_double(0xcb, obj))
+    elif obj is None:
+        out.append("\xc0")
+    elif t is list or t is tuple:
+        _pack_len(out, len(obj), 0x90, 15, None, 0xdc, 0xdd)
+        for v in obj: _pack(v, out)
+    elif t is dict:
+        _pack_len(out, len(obj), 0x80, 15, None, 0xde, 0xdf)
+        for k, v in obj.iteritems():
+            _pack(k, out)
+            _pack(v, out)
+    else:
+        raise TypeError("Cannot encode %s" % t)
+
+def packb(obj):
+    """Encode obj as MessagePack"""
+    out = []
+    _pack(obj, out)
+    return "".join(out)
+
+_unpack_from = {}
+for _code, _fmt in ((0xca, ">f"), (0xcb, ">d"), (0xcc, ">B"), (0xcd, ">H"), (0xce, ">I"),
+                    (0xcf, ">Q"), (0xd0, ">b"), (0xd1, ">h"), (0xd2, ">i"), (0xd3, ">q")):
+    _s = struct.Struct(_fmt)
+    _unpack_from[_code] = (_s.unpack_from, _s.size)
+_len_from = {0xd9: (struct.Struct(">B").unpack_from, 1), 0xda: (struct.Struct(">H").unpack_from, 2),
+             0xdb: (struct.Struct(">I").unpack_from, 4), 0xdc: (struct.Struct(">H").unpack_from, 2),
+             0xdd: (struct.Struct(">I").unpack_from, 4), 0xde: (struct.Struct(">H").unpack_from, 2),
+             0xdf: (struct.Struct(">I").unpack_from, 4), 0xc4: (struct.Struct(">B").unpack_from, 1),
+             0xc5: (struct.Struct(">H").unpack_from, 2), 0xc6: (struct.Struct(">I").unpack_from, 4)}
+
+def _text(data):
+    """Strings are returned as str if they are ASCII, as xmlrpclib does"""
+    try:
+        data.decode("ascii")
+        return data
+    except UnicodeDecodeError:
+        return data.decode("utf-8")
+
+def _unpack(data, pos):
+    code = ord(data[pos])
+    pos += 1
+    if code < 0x80:
+        return code, pos
+    elif code >= 0xe0:
+        return code - 0x100, pos
+    elif code & 0xe0 == 0xa0:
+        n = code & 0x1f
+        return _text(data[pos:pos + n]), pos + n
+    elif code & 0xf0 == 0x90:
+        return _unpack_array(data, pos, code & 0x0f)
+    elif code & 0xf0 == 0x80:
+        return _unpack_map(data, pos, code & 0x0f)
+    elif code == 0xc0:
+        return None, pos
+    elif code == 0xc2:
+        return False, pos
+    elif code == 0xc3:
+        return True, pos
+    elif code in _unpack_from:
+        unpack, size = _unpack_from[code]
+        return unpack(data, pos)[0], pos + size
+    elif code in _len_from:
+        unpack, size = _len_from[code]
+        n = unpack(data, pos)[0]
+        pos += size
+        if code in (0xdc, 0xdd):
+            return _unpack_array(data, pos, n)
+        elif code in (0xde, 0xdf):
+            return _unpack_map(data, pos, n)
+        elif code in (0xc4, 0xc5, 0xc6):
+            return data[pos:pos + n], pos + n
+        return _text(data[pos:pos + n]), pos + n
+    raise ValueError("Unsupported MessagePack type 0x%x" % code)
+
+def _unpack_array(data, pos, n):
+    ret = []
+    for i in xrange(n):
+        v, pos = _unpack(data, pos)
+        ret.append(v)
+    return ret, pos
+
+def _unpack_map(data, pos, n):
+    ret = {}
+    for i in xrange(n):
+        k, pos = _unpack(data, pos)
+        ret[k], pos = _unpack(data, pos)
+    return ret, pos
+
+def unpackb(data):
+    """Decode a MessagePack string"""
+    obj, pos = _unpack(data, 0)
+    if pos != len(data):
+        raise ValueError("Extra data after MessagePack object")
+    return obj
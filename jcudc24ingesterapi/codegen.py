@@ -0,0 +1,105 @@
+"""Generates specialised encode and decode functions for marshallable classes.
+
+The functions are built from a ClassPlan as straight line code, one statement
+block per property, so converting an object does not need any generic dispatch
+over its properties. Anything unusual falls back to the Marshaller, so the
+output is identical to the generic code path.
+"""
+__author__ = 'Casey Bajema'
+import datetime
+
+from jcudc24ingesterapi import format_timestamp, parse_timestamp
+
+# Types that are passed through the marshaller untouched
+PRIMITIVE_TYPES = frozenset([str, int, float, unicode, bool, type(None), tuple])
+STRING_TYPES = frozenset([str, unicode])
+
+_MISSING = object()
+
+def _namespace(plan):
+    return {"PRIMITIVE_TYPES": PRIMITIVE_TYPES, "STRING_TYPES": STRING_TYPES,
+            "datetime": datetime.datetime, "format_timestamp": format_timestamp, "parse_timestamp": parse_timestamp,
+            "MISSING": _MISSING, "cls": plan.cls}
+
+def _compile(name, lines, namespace):
+    """Compile the function source and return the function object"""
+    source = "\n".join(lines) + "\n"
+    code = compile(source, "<marshaller %s>" % name, "exec")
+    exec code in namespace
+    func = namespace[name]
+    func.source = source
+    return func
+
+def generate_encoder(plan):
+    """Generate an encode(marshaller, obj, special_attrs) function for the class
+    described by the plan.
+    """
+    name = "encode_%s" % plan.cls.__name__
+    lines = ["def %s(m, obj, special_attrs):" % name,
+             "    ret = {}"]
+    for k in plan.encode_properties:
+        attr = plan.fields.get(k)
+        if attr != None:
+            lines.append("    v = getattr(obj, %r, None)" % attr)
+        else:
+            lines.append("    v = obj.%s" % k)
+        if k in plan.datetime_properties:
+            lines.append("    if type(v) is datetime: ret[%r] = format_timestamp(v)" % k)
+            lines.append("    elif type(v) in PRIMITIVE_TYPES: ret[%r] = v" % k)
+        else:
+            lines.append("    if type(v) in PRIMITIVE_TYPES: ret[%r] = v" % k)
+        lines.append("    else: ret[%r] = m._encode_value(v)" % k)
+    lines.append("    for k in special_attrs: ret[k] = getattr(obj, k)")
+    if plan.is_schema:
+        lines.append("    m._encode_schema_attrs(obj, ret)")
+    lines.append("    ret['class'] = %r" % plan.xmlrpc_class)
+    lines.append("    return ret")
+    return _compile(name, lines, _namespace(plan))
+
+def generate_decoder(plan, intern=False):
+    """Generate a decode(marshaller, x, obj) function for the class described
+    by the plan. The destination object must already exist.
+
+    If intern is True, the strings stored on the object are shared through
+    the marshaller's InternTable.
+    """
+    name = "decode_%s%s" % (plan.cls.__name__, "_interned" if intern else "")
+    known = set(plan.properties)
+    known.add("class")
+    namespace = _namespace(plan)
+    namespace["known"] = frozenset(known)
+
+    lines = ["def %s(m, x, obj):" % name]
+    for k in plan.properties:
+        # Mirrors the order of the checks in Marshaller.dict_to_obj
+        branches = []
+        if k not in plan.dict_properties:
+            branches.append(("isinstance(v, dict)", "obj.%s = m.dict_to_obj(v)" % k))
+        if plan.is_data_entry and k == "data" and intern:
+            branches.append((None, "for data_key in v: obj[m._interner.string(data_key)] = m.dict_to_obj(v[data_key])"))
+        elif plan.is_data_entry and k == "data":
+            branches.append((None, "for data_key in v: obj[data_key] = m.dict_to_obj(v[data_key])"))
+        elif k in plan.datetime_properties:
+            branches.append((None, "obj.%s = parse_timestamp(v)" % k))
+        else:
+            branches.append(("isinstance(v, list)", "obj.%s = [m.dict_to_obj(i) for i in v]" % k))
+            if intern:
+                branches.append(("type(v) in STRING_TYPES", "obj.%s = m._interner.string(v)" % k))
+            branches.append((None, "obj.%s = v" % k))
+
+        lines.append("    v = x.get(%r, MISSING)" % k)
+        lines.append("    if v is not MISSING:")
+        for i, (test, stmt) in enumerate(branches):
+            if i == 0 and test == None:
+                lines.append("        %s" % stmt)
+                continue
+            elif i == 0:
+                lines.append("        if %s:" % test)
+            elif test == None:
+                lines.append("        else:")
+            else:
+                lines.append("        elif %s:" % test)
+            lines.append("            %s" % stmt)
+    lines.append("    if not known.issuperset(x): m._decode_extra(x, obj, known)")
+    lines.append("    return obj")
+    return _compile(name, lines, namespace)
@@ -43,7 +43,7 @@ class InvalidObjectError(IngestPlatformError):
     """
     __xmlrpc_error__ = 4
     def __init__(self, validation_errors):
-        if isinstance(validation_errors, str):
+        if isinstance(validation_errors, basestring):
             # Convert from JSON
             validation_errors = json.loads(validation_errors)
         
@@ -4,25 +4,28 @@ __author__ = 'Casey Bajema'
 import xmlrpclib
 import inspect
 import datetime
-import httplib
-import urllib2
 import urlparse
 import logging
-import base64
+import sys
+import copy
+import itertools
+import threading
+import weakref
 
 from jcudc24ingesterapi import parse_timestamp, format_timestamp, typed,\
-    ValidationError, ingester_exceptions
-import jcudc24ingesterapi.models.system
-import jcudc24ingesterapi.models.dataset
-import jcudc24ingesterapi.models.locations
-import jcudc24ingesterapi.models.sampling
-import jcudc24ingesterapi.models.data_sources
-import jcudc24ingesterapi.models.metadata
-import jcudc24ingesterapi.schemas.metadata_schemas
-import jcudc24ingesterapi.schemas.data_entry_schemas
-import jcudc24ingesterapi.schemas.data_types
-import jcudc24ingesterapi.search
+    ValidationError, ingester_exceptions, parse_timestamps, format_timestamps,\
+    TypedProperty, typed_attr, track_changes, changed_properties, converters,\
+    PLAIN_TYPES
+import jcudc24ingesterapi.schemas
 from jcudc24ingesterapi.models.data_entry import FileObject, DataEntry
+# Only the module is imported, so scanning this module does not find RecordEntry
+from jcudc24ingesterapi.models import records
+from jcudc24ingesterapi.models.frame import DataEntryFrame, to_epoch, from_epoch
+from jcudc24ingesterapi.schemas.validation import EntryValidator, compile_validator
+from jcudc24ingesterapi.codegen import PRIMITIVE_TYPES as _PRIMITIVE_TYPES,\
+    STRING_TYPES as _STRING_TYPES, generate_encoder, generate_decoder
+from jcudc24ingesterapi.transport import ServerProxy, ChunkedBody, FileBody, BLOCK_SIZE
+from jcudc24ingesterapi.response_parser import parse_response, iter_response
 
 logger = logging.getLogger(__name__)
 
@@ -30,124 +33,806 @@ def get_properties(obj):
     """Returns a list of valid property names for this object"""
     return [k for k,v in inspect.getmembers(type(obj)) if isinstance(v, property)]
 
+class ClassPlan(object):
+    """A ClassPlan holds everything the Marshaller needs to know about a class,
+    so that the reflection over its properties is only done once per class
+    rather than once per object.
+    """
+    def __init__(self, cls, xmlrpc_class=None):
+        self.cls = cls
+        self.xmlrpc_class = xmlrpc_class
+        self.is_schema = issubclass(cls, jcudc24ingesterapi.schemas.Schema)
+        self.is_data_entry = issubclass(cls, DataEntry)
+        # Value objects may be shared between objects when interning, setting
+        # _frozen on them must make them read only
+        self.is_value_object = getattr(cls, "__value_object__", False)
+
+        # Property name -> valid types for the property setter
+        self.valid_types = {}
+        # Property name -> backing attribute for typed() properties
+        self.fields = {}
+        for k, v in inspect.getmembers(cls):
+            if not isinstance(v, property): continue
+            if typed_attr(v) != None:
+                self.fields[k] = typed_attr(v)
+            if isinstance(v, TypedProperty):
+                self.valid_types[k] = v.valid_types
+            elif v.fset != None and hasattr(v.fset, "valid_types"):
+                self.valid_types[k] = tuple(v.fset.valid_types)
+            else:
+                self.valid_types[k] = ()
+
+        self.properties = sorted(self.valid_types)
+        # Entities are stored objects with an id and a version, that can be
+        # updated and are kept in identity maps
+        self.is_entity = "id" in self.valid_types and "version" in self.valid_types
+        # Schema attributes and extends are written out separately
+        self.encode_properties = [k for k in self.properties
+                if not (self.is_schema and k in ("attrs", "extends"))]
+        self.datetime_properties = frozenset([k for k in self.properties
+                if datetime.datetime in self.valid_types[k]])
+        self.dict_properties = frozenset([k for k in self.properties
+                if dict in self.valid_types[k]])
+        self._encoder = None
+        self._decoder = None
+        self._interning_decoder = None
+
+    @property
+    def encoder(self):
+        """The generated encode function for this class"""
+        if self._encoder == None:
+            self._encoder = generate_encoder(self)
+        return self._encoder
+
+    @property
+    def decoder(self):
+        """The generated decode function for this class"""
+        if self._decoder == None:
+            self._decoder = generate_decoder(self)
+        return self._decoder
+
+    @property
+    def interning_decoder(self):
+        """The generated decode function for this class, that interns strings"""
+        if self._interning_decoder == None:
+            self._interning_decoder = generate_decoder(self, intern=True)
+        return self._interning_decoder
+
+# Modules that hold marshallable classes, in the order they are scanned.
+# The data entry and search modules come first as they are the most used, and
+# do not import the data sources (and simplesos).
+MARSHALLED_MODULES = [
+    "jcudc24ingesterapi.models.locations",
+    "jcudc24ingesterapi.models.data_entry",
+    "jcudc24ingesterapi.models.system",
+    "jcudc24ingesterapi.search",
+    "jcudc24ingesterapi.models.dataset",
+    "jcudc24ingesterapi.models.sampling",
+    "jcudc24ingesterapi.models.data_sources",
+    "jcudc24ingesterapi.models.metadata",
+    "jcudc24ingesterapi.schemas.metadata_schemas",
+    "jcudc24ingesterapi.schemas.data_entry_schemas",
+    "jcudc24ingesterapi.schemas.data_types",
+    "jcudc24ingesterapi.ingester_platform_api",
+    ]
+
+class ClassRegistry(object):
+    """A thread safe registry of the classes that can be marshalled, and their
+    plans.
+
+    Modules are only imported and scanned when a class that is not yet known
+    is looked up, so creating a Marshaller costs nothing until it is used.
+    Lookups of known classes do not take the lock.
+    """
+    def __init__(self, modules=MARSHALLED_MODULES):
+        self._lock = threading.RLock()
+        self._pending = list(modules)
+        self._classes = {}
+        self._class_factories = {}
+        self._plans = {}
+
+    def scan(self, pkg):
+        """Scan through the given package or package name and register the
+        classes that are eligable for marshalling."""
+        with self._lock:
+            if isinstance(pkg, basestring):
+                if pkg in self._pending: self._pending.remove(pkg)
+                __import__(pkg)
+                pkg = sys.modules[pkg]
+            elif pkg.__name__ in self._pending:
+                self._pending.remove(pkg.__name__)
+            for cls in dir(pkg):
+                cls = getattr(pkg, cls)
+                if isinstance(cls, type) and hasattr(cls, "__xmlrpc_class__"):
+                    self._plans[cls] = ClassPlan(cls, cls.__xmlrpc_class__)
+                    self._class_factories[cls.__xmlrpc_class__] = cls
+                    self._classes[cls] = cls.__xmlrpc_class__
+
+    def _scan_until(self, found, modules=None):
+        """Scan pending modules until found() returns True, or there is
+        nothing left to scan."""
+        with self._lock:
+            for module in list(self._pending if modules == None else modules):
+                if found(): return True
+                if module in self._pending:
+                    self.scan(module)
+            return found()
+
+    def class_for(self, klass):
+        """Returns the class registered for the given __xmlrpc_class__ name"""
+        cls = self._class_factories.get(klass)
+        if cls == None and self._pending:
+            self._scan_until(lambda: klass in self._class_factories)
+            cls = self._class_factories.get(klass)
+        if cls == None:
+            raise KeyError(klass)
+        return cls
+
+    def register(self, cls, xmlrpc_class=None):
+        """Register a class that is not found by scanning, such as a class
+        created at run time. It is encoded as xmlrpc_class (by default its
+        __xmlrpc_class__), but is not used when decoding that class."""
+        if xmlrpc_class == None:
+            xmlrpc_class = cls.__xmlrpc_class__
+        with self._lock:
+            self._plans[cls] = ClassPlan(cls, xmlrpc_class)
+            self._classes[cls] = xmlrpc_class
+
+    def is_registered(self, cls):
+        """Check if the class can be marshalled. Classes that declare their
+        own __xmlrpc_class__ outside the scanned modules are registered when
+        first seen."""
+        if cls in self._classes: return True
+        if not hasattr(cls, "__xmlrpc_class__"): return False
+        # Try the class's own module first
+        found = lambda: cls in self._classes
+        if self._pending and (self._scan_until(found, [cls.__module__]) or self._scan_until(found)):
+            return True
+        if "__xmlrpc_class__" in cls.__dict__:
+            self.register(cls)
+            return True
+        return False
+
+    def registered_plan(self, cls):
+        """Returns the plan for a registered class, or None if the class
+        cannot be marshalled."""
+        plan = self._plans.get(cls)
+        if plan != None and plan.xmlrpc_class != None: return plan
+        if not self.is_registered(cls): return None
+        return self._plans[cls]
+
+    def plan_for(self, cls):
+        """Returns the marshalling plan for the given class, building it if
+        the class is not registered."""
+        plan = self._plans.get(cls)
+        if plan == None or plan.xmlrpc_class == None:
+            with self._lock:
+                self.is_registered(cls)
+                plan = self._plans.get(cls)
+                if plan == None:
+                    plan = self._plans[cls] = ClassPlan(cls, self._classes.get(cls))
+        return plan
+
+# The registry shared by all Marshallers in this process
+default_registry = ClassRegistry()
+
+# Class name of a columnar batch of data entries
+DATA_ENTRY_BATCH = "data_entry_batch"
+
+class InternTable(object):
+    """Holds the strings and value objects shared while decoding, so equal
+    values are only stored once. An InternTable can be passed to several
+    decodes to share values across all of them.
+    """
+    def __init__(self):
+        self.strings = {}
+        self.objects = {}
+        self.shared_strings = 0
+        self.shared_objects = 0
+
+    def string(self, s):
+        """Returns the shared copy of the string"""
+        shared = self.strings.setdefault(s, s)
+        if shared is not s:
+            self.shared_strings += 1
+        return shared
+
+    def object_key(self, x):
+        """Returns a key identifying the value object described by the dict, or
+        None if it holds values that cannot be compared."""
+        try:
+            key = tuple(sorted(x.iteritems()))
+            hash(key)
+            return key
+        except TypeError:
+            return None
+
+class IdentityMap(object):
+    """Holds one object per (xmlrpc class, id) for the entities (objects with
+    an id and a version) decoded by a client, so fetching an object that is
+    already loaded returns the same instance. A newer version from the server
+    refreshes the instance in place, the same or an older version returns it
+    as it is.
+
+    Objects are only weakly referenced, and are dropped from the map once
+    nothing else refers to them. An IdentityMap may be shared between threads.
+    """
+    def __init__(self):
+        self.objects = weakref.WeakValueDictionary()
+        self.reused = 0
+        self._lock = threading.Lock()
+
+    def get(self, klass, obj_id):
+        """Returns the loaded object, or None. klass is the xmlrpc class name
+        or the class."""
+        return self.objects.get((getattr(klass, "__xmlrpc_class__", klass), obj_id))
+
+    def add(self, key, obj, replace=True):
+        """Add a decoded object, returning the object kept for the key. Unless
+        replace is True, an object another thread added for the key first is
+        kept and returned instead."""
+        with self._lock:
+            existing = self.objects.get(key)
+            if existing is None or replace:
+                self.objects[key] = obj
+                return obj
+            return existing
+
+    def count_reuse(self):
+        with self._lock:
+            self.reused += 1
+
+    def __contains__(self, key):
+        klass, obj_id = key
+        return self.get(klass, obj_id) != None
+
+    def __len__(self):
+        return len(self.objects)
+
+class _StreamedArray(object):
+    """An array written by Marshaller.stream_request as its items are
+    produced, so they are not all held in memory"""
+    __slots__ = ("length", "items")
+
+    def __init__(self, length, items):
+        self.length = length
+        self.items = items
+
 class Marshaller(object):
     """A Marshaller object is responsible for converting between real objects
     and dicts. This is used as a helper for the XMLRPC service.
+
+    If generated is True, objects are converted by functions generated for
+    each class rather than by the generic plan interpreter. The output is the
+    same in both modes.
+
+    By default all Marshallers share the process wide default_registry of
+    classes, pass registry to use a private one.
+
+    If batch_threshold is set, lists of at least that many data entries from
+    the same dataset are encoded as a single columnar data_entry_batch. Batches
+    are always decoded, back into a list of data entries, or into a
+    DataEntryFrame when dict_to_obj is called with frames=True.
+
+    A DataEntryFrame is encoded as a data_entry_batch when batching is enabled,
+    and as a data entry per row otherwise.
+
+    Very large requests can be written straight to the wire format with
+    stream_request, rather than through obj_to_dict.
+
+    Objects whose changes are tracked (see track_changes) are encoded with only
+    their changed properties, and their id and version.
     """
-    def __init__(self):
-        self._classes = {}
-        self._class_factories = {}
+    _interner = None
+    _frames = False
+    _track = False
+    _identity_map = None
 
-        self.scanPackage(jcudc24ingesterapi.models.locations)
-        self.scanPackage(jcudc24ingesterapi.models.dataset)
-        self.scanPackage(jcudc24ingesterapi.models.sampling)
-        self.scanPackage(jcudc24ingesterapi.models.data_sources)
-        self.scanPackage(jcudc24ingesterapi.models.data_entry)
-        self.scanPackage(jcudc24ingesterapi.models.metadata)
-        self.scanPackage(jcudc24ingesterapi.models.system)
-        self.scanPackage(jcudc24ingesterapi.search)
-        self.scanPackage(jcudc24ingesterapi.schemas.metadata_schemas)
-        self.scanPackage(jcudc24ingesterapi.schemas.data_entry_schemas)
-        self.scanPackage(jcudc24ingesterapi.schemas.data_types)
-        self.scanPackage(jcudc24ingesterapi.ingester_platform_api)
+    def __init__(self, generated=False, registry=None, batch_threshold=None):
+        self.generated = generated
+        self._registry = registry if registry != None else default_registry
+        self.batch_threshold = batch_threshold
         
     def scanPackage(self, pkg):
         """Scan through the given package and find classes that are eligable for 
-        marshalling."""
-        for cls in dir(pkg):
-            cls = getattr(pkg, cls)
-            if isinstance(cls, type) and hasattr(cls, "__xmlrpc_class__"):
-                self._classes[cls] = cls.__xmlrpc_class__
-                self._class_factories[cls.__xmlrpc_class__] = cls
+        marshalling. The classes are added to this marshaller's registry."""
+        self._registry.scan(pkg)
 
     def class_for(self, klass):
-        return self._class_factories[klass]
+        return self._registry.class_for(klass)
 
-    def obj_to_dict(self, obj, special_attrs=[]):
+    def plan_for(self, cls):
+        """Returns the marshalling plan for the given class, building it if
+        the class was not found while scanning."""
+        return self._registry.plan_for(cls)
+
+    def obj_to_dict(self, obj, special_attrs=[], only=None):
         """Maps an object of base class BaseManagementObject to a dict.
+
+        :param only: encode only these properties (and the id and version) of
+            the object, by default the changed properties if they are tracked
         """
-        if type(obj) in (str, int, float, unicode, bool, type(None), tuple):
+        if type(obj) in _PRIMITIVE_TYPES:
             return obj
         elif type(obj) == list:
-            return [self.obj_to_dict(o, special_attrs=special_attrs) for o in obj] 
-        elif not self._classes.has_key(type(obj)):
-            raise ValueError("This object class is not supported: " + str(obj.__class__))
-        ret = {}
+            if self.batch_threshold != None and not special_attrs and \
+                    len(obj) >= self.batch_threshold and self._is_batch(obj):
+                return self._encode_batch(obj)
+            ret = [self.obj_to_dict(o, special_attrs=special_attrs) for o in obj]
+            if self.batch_threshold == None and DataEntryFrame in map(type, obj):
+                ret = self._flatten_frames(obj, ret)
+            return ret
+        elif type(obj) is DataEntryFrame:
+            if self.batch_threshold != None:
+                return self._encode_frame(obj)
+            return list(self._iter_frame_rows(obj))
+        plan = self._registry.registered_plan(type(obj))
+        if plan == None:
+            return self.obj_to_dict(self._convert_value(obj))
+        properties = plan.encode_properties
+        if only == None:
+            only = getattr(obj, "_changes", None)
+        if only != None:
+            properties = self._partial_properties(plan, only)
+        elif self.generated:
+            return plan.encoder(self, obj, special_attrs)
 
-        data_keys = get_properties(obj)
-
-        for k in data_keys:
+        ret = {}
+        for k in properties:
             v = getattr(obj, k)
-            if k in ("attrs", "extends") and isinstance(obj, jcudc24ingesterapi.schemas.Schema): continue
-            if type(v) == datetime.datetime:
-                ret[k] = format_timestamp(v)
-            elif isinstance(v, dict):
-                ret[k] = {}
-                for k1 in v:
-                    ret[k][k1] = self.obj_to_dict(v[k1])
+            if type(v) in _PRIMITIVE_TYPES:
+                ret[k] = v
             else:
-                ret[k] = self.obj_to_dict(v)
+                ret[k] = self._encode_value(v)
 
         for k in special_attrs:
             ret[k] = getattr(obj, k)
 
-        if isinstance(obj, jcudc24ingesterapi.schemas.Schema):
-            ret["attributes"] = []
-            for k in obj.attrs:
-                attr = obj.attrs[k]
-                ret["attributes"].append({"class":attr.__xmlrpc_class__, "name":attr.name, 
-                                          "description":attr.description, "units":attr.units})
-            ret["extends"] = [] + obj.extends
+        if plan.is_schema:
+            self._encode_schema_attrs(obj, ret)
             
-        ret["class"] = self._classes[type(obj)]
+        ret["class"] = plan.xmlrpc_class
+        return ret
+
+    def _convert_value(self, v):
+        """Convert a value of an unsupported class, such as a NumPy scalar, to
+        a plain value with the registered converters. Datetimes, such as those
+        in the data of an entry, are sent as timestamp strings."""
+        if type(v) is datetime.datetime:
+            return format_timestamp(v)
+        elif type(v) is long:
+            try:
+                i = converters.find(long, (int,))(v)
+            except OverflowError:
+                i = None
+            if type(i) is not int:
+                raise ValueError("This value does not fit in an int: %d" % v)
+            return i
+        func = converters.find(type(v), PLAIN_TYPES) if type(v) not in PLAIN_TYPES else None
+        if func == None:
+            raise ValueError("This object class is not supported: " + str(v.__class__))
+        return func(v)
+
+    def _partial_properties(self, plan, only):
+        """The properties to encode for a partial update. Schemas and data
+        entries are always encoded in full, as their attributes and data can
+        be changed without setting a property."""
+        if plan.is_schema or plan.is_data_entry:
+            return plan.encode_properties
+        return [k for k in plan.encode_properties if k in only or k in ("id", "version")]
+
+    def _encode_value(self, v):
+        """Encode a single property value"""
+        if type(v) == datetime.datetime:
+            return format_timestamp(v)
+        elif isinstance(v, dict):
+            ret = {}
+            for k1 in v:
+                ret[k1] = self.obj_to_dict(v[k1])
+            return ret
+        else:
+            return self.obj_to_dict(v)
+
+    def _is_batch(self, entries):
+        """Check if the list is all plain data entries or records of one dataset"""
+        cls = self.class_for("data_entry")
+        dataset = None
+        for entry in entries:
+            if type(entry) is not cls and not isinstance(entry, records.RecordEntry):
+                return False
+            elif dataset == None:
+                dataset = entry.dataset
+                if dataset == None:
+                    return False
+            elif entry.dataset != dataset:
+                return False
+        return True
+
+    def _encode_batch(self, entries):
+        """Encode a list of data entries as a columnar batch, with a column per
+        attribute. Attributes that are not set on an entry are sent as None."""
+        attributes = set()
+        for entry in entries:
+            attributes.update(entry.data)
+        attributes = sorted(attributes)
+
+        ids = []
+        timestamps = []
+        offsets = []
+        columns = [[] for attr in attributes]
+        for entry in entries:
+            ids.append(entry.id)
+            timestamps.append(entry.timestamp)
+            offsets.append(self.obj_to_dict(entry.location_offset))
+            data = entry.data
+            for attr, column in zip(attributes, columns):
+                v = data.get(attr)
+                column.append(v if type(v) in _PRIMITIVE_TYPES else self.obj_to_dict(v))
+
+        ret = {"class":DATA_ENTRY_BATCH, "dataset":entries[0].dataset,
+               "attributes":attributes, "id":ids, "timestamp":format_timestamps(timestamps),
+               "data":columns}
+        if offsets.count(None) != len(offsets):
+            ret["location_offset"] = offsets
+        return ret
+
+    def _encode_frame(self, frame):
+        """Encode a frame as a columnar batch"""
+        attributes = frame.attributes
+        columns = []
+        for attr in attributes:
+            column = frame.column_values(attr)
+            columns.append([v if type(v) in _PRIMITIVE_TYPES else self.obj_to_dict(v) for v in column])
+        ret = {"class":DATA_ENTRY_BATCH, "dataset":frame.dataset,
+               "attributes":attributes, "id":list(frame.ids),
+               "timestamp":frame.formatted_timestamps(), "data":columns}
+        offsets = frame.location_offsets
+        if offsets != None and offsets.count(None) != len(offsets):
+            ret["location_offset"] = [self.obj_to_dict(o) for o in offsets]
+        return ret
+
+    def _iter_frame_rows(self, frame):
+        """Yield the encoded data entry of each row of the frame"""
+        xmlrpc_class = self.plan_for(self.class_for("data_entry")).xmlrpc_class
+        columns = [(attr, frame.column_values(attr)) for attr in frame.attributes]
+        offsets = frame.location_offsets
+        for i, timestamp in enumerate(frame.formatted_timestamps()):
+            data = {}
+            for attr, column in columns:
+                v = column[i]
+                if v is not None:
+                    data[attr] = v if type(v) in _PRIMITIVE_TYPES else self.obj_to_dict(v)
+            yield {"class":xmlrpc_class, "dataset":frame.dataset, "id":frame.ids[i],
+                   "timestamp":timestamp, "data":data,
+                   "location_offset":self.obj_to_dict(offsets[i]) if offsets != None else None}
+
+    def _flatten_frames(self, objs, encoded):
+        """Replace the encoded rows of each frame in the list by the rows themselves"""
+        ret = []
+        for obj, v in zip(objs, encoded):
+            if type(obj) is DataEntryFrame:
+                ret.extend(v)
+            else:
+                ret.append(v)
         return ret
 
-    def dict_to_obj(self, x, obj=None):
+    def stream_request(self, codec, methodname, params, chunk_size=65536):
+        """Encode a call of methodname directly to the wire format of the codec,
+        yielding the request body in chunks of about chunk_size bytes.
+
+        The object graph is walked iteratively, one object at a time, so the
+        memory used does not grow with the number of objects. The server sees
+        the same values as for obj_to_dict followed by codec.dumps_request.
+        """
+        out = []
+        writer = codec.request_writer(methodname, len(params), out)
+        for param in params:
+            writer.begin_param()
+            # Each open array or struct is an iterator over (name, value) pairs,
+            # names are None for array elements
+            stack = [(iter(((None, param),)), None)]
+            while stack:
+                items, end = stack[-1]
+                for name, v in items:
+                    if name != None:
+                        writer.member(name)
+                    t = type(v)
+                    if t in _PRIMITIVE_TYPES and t is not tuple:
+                        writer.scalar(v)
+                    elif t is datetime.datetime:
+                        writer.scalar(format_timestamp(v))
+                    else:
+                        stack.append(self._stream_open(v, writer))
+                        break
+                    if len(out) >= 512:
+                        out[:] = ["".join(out)]
+                        if len(out[0]) >= chunk_size:
+                            yield out.pop()
+                else:
+                    stack.pop()
+                    if end != None:
+                        end()
+            writer.end_param()
+        writer.finish()
+        yield "".join(out)
+
+    def _stream_open(self, v, writer):
+        """Start writing an array or struct, returning the iterator over its
+        contents and the function that ends it"""
+        if type(v) is _StreamedArray:
+            writer.start_array(v.length)
+            return ((None, o) for o in v.items), writer.end_array
+        if type(v) is DataEntryFrame:
+            if self.batch_threshold != None:
+                items = self._stream_frame(v)
+                writer.start_struct(len(items))
+                return iter(items), writer.end_struct
+            else:
+                writer.start_array(len(v))
+                return ((None, row) for row in self._iter_frame_rows(v)), writer.end_array
+        if type(v) in (list, tuple):
+            if type(v) is list and self.batch_threshold != None and \
+                    len(v) >= self.batch_threshold and self._is_batch(v):
+                items = self._stream_batch(v)
+                writer.start_struct(len(items))
+                return iter(items), writer.end_struct
+            elif type(v) is list and self.batch_threshold == None and DataEntryFrame in map(type, v):
+                writer.start_array(sum([len(o) if type(o) is DataEntryFrame else 1 for o in v]))
+                return self._iter_frame_items(v), writer.end_array
+            else:
+                writer.start_array(len(v))
+                return ((None, o) for o in v), writer.end_array
+        if isinstance(v, dict):
+            writer.start_struct(len(v))
+            return v.iteritems(), writer.end_struct
+
+        plan = self._registry.registered_plan(type(v))
+        if plan == None:
+            v = self._convert_value(v)
+            if type(v) not in _PRIMITIVE_TYPES:
+                raise ValueError("This object class is not supported: " + str(v.__class__))
+            writer.scalar(v)
+            return iter(()), None
+        properties = plan.encode_properties
+        if getattr(v, "_changes", None) != None:
+            properties = self._partial_properties(plan, v._changes)
+        items = [(k, getattr(v, k)) for k in properties]
+        if plan.is_schema:
+            attrs = {}
+            self._encode_schema_attrs(v, attrs)
+            items.extend(attrs.iteritems())
+        items.append(("class", plan.xmlrpc_class))
+        writer.start_struct(len(items))
+        return iter(items), writer.end_struct
+
+    def _stream_batch(self, entries):
+        """The members of the columnar batch of the data entries, as encoded
+        by _encode_batch, with the columns produced as they are written"""
+        attributes = set()
+        has_offsets = False
+        for entry in entries:
+            attributes.update(entry.data)
+            has_offsets = has_offsets or entry.location_offset != None
+        attributes = sorted(attributes)
+        n = len(entries)
+        columns = (_StreamedArray(n, (entry.data.get(attr) for entry in entries)) for attr in attributes)
+        items = [("class", DATA_ENTRY_BATCH), ("dataset", entries[0].dataset), ("attributes", attributes),
+                 ("id", _StreamedArray(n, (entry.id for entry in entries))),
+                 ("timestamp", _StreamedArray(n, (entry.timestamp for entry in entries))),
+                 ("data", _StreamedArray(len(attributes), columns))]
+        if has_offsets:
+            items.append(("location_offset", _StreamedArray(n, (entry.location_offset for entry in entries))))
+        return items
+
+    def _stream_frame(self, frame):
+        """The members of the columnar batch of a frame, as encoded by
+        _encode_frame, with the columns produced one at a time as they are
+        written"""
+        attributes = frame.attributes
+        n = len(frame)
+        columns = (_StreamedArray(n, frame.column_values(attr)) for attr in attributes)
+        items = [("class", DATA_ENTRY_BATCH), ("dataset", frame.dataset), ("attributes", attributes),
+                 ("id", _StreamedArray(n, frame.ids)),
+                 ("timestamp", _StreamedArray(n, (format_timestamp(from_epoch(t)) for t in frame.timestamps))),
+                 ("data", _StreamedArray(len(attributes), columns))]
+        offsets = frame.location_offsets
+        if offsets != None and offsets.count(None) != len(offsets):
+            items.append(("location_offset", _StreamedArray(n, offsets)))
+        return items
+
+    def _iter_frame_items(self, objs):
+        """The array items of a list, with the frames in it written row by row"""
+        for obj in objs:
+            if type(obj) is DataEntryFrame:
+                for row in self._iter_frame_rows(obj):
+                    yield None, row
+            else:
+                yield None, obj
+
+    def _decode_batch(self, x):
+        """Decode a columnar batch into a list of data entries"""
+        if self._frames:
+            return self._decode_frame(x)
+        cls = self.class_for("data_entry")
+        dataset = x["dataset"]
+        attributes = x["attributes"]
+        columns = x["data"]
+        offsets = x.get("location_offset")
+        interner = self._interner
+        if interner != None:
+            attributes = [interner.string(attr) for attr in attributes]
+        entries = []
+        for i, (entry_id, timestamp) in enumerate(zip(x["id"], parse_timestamps(x["timestamp"]))):
+            entry = cls(dataset, timestamp, entry_id)
+            if offsets != None and offsets[i] != None:
+                entry.location_offset = self.dict_to_obj(offsets[i])
+            data = entry.data
+            for attr, column in zip(attributes, columns):
+                v = column[i]
+                if v == None:
+                    continue
+                elif type(v) not in _PRIMITIVE_TYPES:
+                    v = self.dict_to_obj(v)
+                elif interner != None and type(v) in _STRING_TYPES:
+                    v = interner.string(v)
+                data[attr] = v
+            entries.append(entry)
+        return entries
+
+    def _decode_frame(self, x):
+        """Decode a columnar batch into a DataEntryFrame"""
+        interner = self._interner
+        data = {}
+        for attr, column in zip(x["attributes"], x["data"]):
+            data[attr if interner == None else interner.string(attr)] = \
+                [v if type(v) in _PRIMITIVE_TYPES else self.dict_to_obj(v) for v in column]
+        offsets = x.get("location_offset")
+        if offsets != None:
+            offsets = [self.dict_to_obj(o) for o in offsets]
+        timestamps = [to_epoch(t) for t in parse_timestamps(x["timestamp"])]
+        return DataEntryFrame(x["dataset"], timestamps, data, x["id"], offsets)
+
+    def _encode_schema_attrs(self, obj, ret):
+        """Schema attributes are written as a list of attribute dicts"""
+        ret["attributes"] = []
+        for k in obj.attrs:
+            attr = obj.attrs[k]
+            ret["attributes"].append({"class":attr.__xmlrpc_class__, "name":attr.name, 
+                                      "description":attr.description, "units":attr.units})
+        ret["extends"] = [] + obj.extends
+
+    def dict_to_obj(self, x, obj=None, intern=False, frames=False):
         """Maps a dict back to an object, created based on the 'class' element.
         
         :param x: 
         :param obj: an optional object to use as the destination
+        :param intern: share equal strings and value objects (such as location
+            offsets) between the decoded objects to save memory. Either True, or
+            an InternTable to share them across several decodes.
+        :param frames: decode data entry batches into DataEntryFrames rather
+            than lists of data entries
         """
+        if intern or frames:
+            return self.decoding(intern, frames).dict_to_obj(x, obj)
+
         if isinstance(x, list):
             return [self.dict_to_obj(obj) for obj in x]
-        elif type(x) in (str, int, float, unicode, bool, type(None)):
+        elif type(x) in _PRIMITIVE_TYPES:
+            if self._interner != None and type(x) in _STRING_TYPES:
+                return self._interner.string(x)
+            return x
+        elif type(x) is not dict:
+            # Already decoded, by the incremental response parser
             return x
         elif not x.has_key("class"):
             raise ValueError("There is no class element")
+        elif x["class"] == DATA_ENTRY_BATCH:
+            return self._decode_batch(x)
         
+        shared_key = None
+        identity_key = None
+        given = obj != None
+        if self._identity_map != None and x.get("id") != None and \
+                self.plan_for(type(obj) if obj != None else self.class_for(x["class"])).is_entity:
+            identity_key = (x["class"], x["id"])
+            if obj == None:
+                obj = self._identity_map.get(*identity_key)
+                if obj != None and x.get("version") != None and obj.version >= x["version"]:
+                    # The same version, or an older response than the one loaded
+                    self._identity_map.count_reuse()
+                    return obj
         if obj == None:
+            cls = self.class_for(x["class"])
+            if self._interner != None and self.plan_for(cls).is_value_object:
+                shared_key = self._interner.object_key(x)
+                if shared_key in self._interner.objects:
+                    self._interner.shared_objects += 1
+                    return self._interner.objects[shared_key]
             try:
-                obj = self._class_factories[x["class"]]()
+                obj = cls()
             except TypeError, e:
                 raise TypeError(e.message + " for " + x["class"], *e.args[1:])
 
-        # Create a dict of the properties, and the valid types allowed
-        data_keys = dict([ (k,v.fset.valid_types if v.fset != None and hasattr(v.fset, "valid_types") else []) for k,v in inspect.getmembers(type(obj)) if isinstance(v, property)])
+        obj = self._decode_fields(x, obj)
+        if identity_key != None:
+            kept = self._identity_map.add(identity_key, obj, replace=given)
+            if kept is not obj:
+                # Another thread decoded the same object first, only a newer
+                # version refreshes it
+                if obj.version > kept.version:
+                    self._decode_fields(x, kept)
+                obj = kept
+        if self._track and self.plan_for(type(obj)).is_entity:
+            track_changes(obj)
+        if shared_key != None:
+            # Value objects are frozen once they are shared
+            obj._frozen = True
+            self._interner.objects[shared_key] = obj
+        return obj
+
+    def decoding(self, intern=False, frames=False, track=None, identity_map=None):
+        """Returns a copy of this marshaller that decodes with the given
+        options of dict_to_obj.
+
+        :param track: if True, track the changes of the decoded objects that
+            have a version (see track_changes), by default as this marshaller
+        :param identity_map: an IdentityMap, decoded objects with a version are
+            looked up in and added to it. By default as this marshaller.
+        """
+        marshaller = copy.copy(self)
+        if intern:
+            marshaller._interner = intern if isinstance(intern, InternTable) else InternTable()
+        marshaller._frames = frames
+        if track != None:
+            marshaller._track = track
+        if identity_map != None:
+            marshaller._identity_map = identity_map
+        return marshaller
+
+    def _decode_fields(self, x, obj):
+        """Set the properties of obj from the dict"""
+        plan = self.plan_for(type(obj))
+        if self.generated:
+            if self._interner != None:
+                return plan.interning_decoder(self, x, obj)
+            return plan.decoder(self, x, obj)
+        valid_types = plan.valid_types
+        interner = self._interner
 
         for k in x:
             if k == "class": 
                 continue
+            elif k not in valid_types:
+                self._decode_extra(x, obj, valid_types, k)
+            else:
+                v = x[k]
+                if isinstance(v, dict) and k not in plan.dict_properties:
+                    setattr(obj, k, self.dict_to_obj(v))
+                elif plan.is_data_entry and k == "data":
+                    for data_key in v:
+                        obj[data_key if interner == None else interner.string(data_key)] = self.dict_to_obj(v[data_key])
+                elif k in plan.datetime_properties:
+                    setattr(obj, k, parse_timestamp(v))
+                elif isinstance(v, list):
+                    setattr(obj, k, [self.dict_to_obj(val_) for val_ in v])
+                elif interner != None and type(v) in _STRING_TYPES:
+                    setattr(obj, k, interner.string(v))
+                else:
+                    setattr(obj, k, v)
+        return obj
+
+    def _decode_extra(self, x, obj, known, key=None):
+        """Handle the keys of x that are not properties of the object, either
+        the single given key, or all of the keys not in known."""
+        for k in ([key] if key != None else x):
+            if k in known:
+                continue
             elif k == "attributes" and x["class"].endswith("_schema"):
                 for attr in x["attributes"]:
                     obj.addAttr(self.class_for(attr["class"])(attr["name"], 
                                 description=attr["description"], units=attr["units"]))
-#                    setattr(obj, k2, self._class_factories[x["attributes"][k2]]())
-            elif k not in data_keys:
-                print "Ignoring ", k
-                continue
             else:
-                if isinstance(x[k], dict) and dict not in data_keys[k]:
-                    setattr(obj, k, self.dict_to_obj(x[k]))
-                elif isinstance(obj, DataEntry) and k == "data":
-                    for data_key in x[k]:
-                        obj[data_key] = self.dict_to_obj(x[k][data_key])
-                elif datetime.datetime in data_keys[k]:
-                    setattr(obj, k, parse_timestamp(x[k]))
-                elif isinstance(x[k], list):
-                    setattr(obj, k, [self.dict_to_obj(val_) for val_ in x[k]])
-                else:
-                    setattr(obj, k, x[k])
-        return obj
+                print "Ignoring ", k
 
 def translate_exception(e):
     """Translate an exception from an XMLRPC fault into an actual exception"""
@@ -170,6 +855,44 @@ def translate_exception(e):
         logger.error("Unsupported exception returned by webservice: "+str(e))
         return Exception(e.faultString)
 
+# The mime types of files that are already compressed, so are uploaded as they are
+_COMPRESSED_MIME_TYPES = frozenset(["image/jpeg", "image/png", "image/gif", "image/webp",
+    "application/zip", "application/gzip", "application/x-gzip", "application/x-bzip2",
+    "application/x-xz", "application/x-7z-compressed"])
+
+def _compressible(mime_type):
+    """Check if a file of the mime type is worth compressing"""
+    if mime_type == None:
+        return True
+    mime_type = mime_type.split(";")[0].strip().lower()
+    return mime_type not in _COMPRESSED_MIME_TYPES and not mime_type.startswith(("audio/", "video/"))
+
+def _run_parallel(func, items, workers):
+    """Call func with each item, from up to workers threads, returning the
+    results in the order of the items, with the exception raised in place of
+    the result of a failed call"""
+    items = list(items)
+    results = [None] * len(items)
+    indexes = itertools.count()
+    def work():
+        for i in iter(indexes.next, None):
+            if i >= len(items):
+                return
+            try:
+                results[i] = func(items[i])
+            except Exception, e:
+                results[i] = e
+    if workers <= 1 or len(items) <= 1:
+        work()
+        return results
+    threads = [threading.Thread(target=work) for i in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
 class IngesterPlatformAPI(object):
     """
     The ingester platform API's are intended to provide a simple way of provisioning ingesters for sensors
@@ -179,11 +902,39 @@ class IngesterPlatformAPI(object):
         * Missing parameters
         * Parameters of an unknown type
         * Parameter values that don't make sense (eg. inserting an object that has an ID set)
+
+    An IngesterPlatformAPI may be shared between threads. Each call takes a
+    connection of its own from the connection pool.
     """
     
-    def __init__(self, service_url, auth=None):
+    def __init__(self, service_url, auth=None, codec=None, marshaller=None, stream_commits=False,
+                 track_changes=False, identity_map=False, pool=None, compress_threshold=None,
+                 compress_level=6, upload_workers=4, upload_timeout=None, upload_chunk_size=BLOCK_SIZE,
+                 upload_progress=None):
         """Initialise the client connection using the given URL
         @param service_url: The server URL. HTTP and HTTPS only.
+        @param codec: The wire codec, either "xmlrpc" (the default), "json" or "msgpack"
+        @param marshaller: An optional configured Marshaller to use
+        @param stream_commits: Encode units of work while sending them, using chunked
+            transfer encoding, so large commits do not need to be held in memory
+        @param track_changes: Record the changes made to the objects (with a version)
+            returned by the server, so updating them only sends the changed properties
+        @param identity_map: True, or an IdentityMap to share between clients, to keep
+            a single instance of each object with a version fetched from the server
+        @param pool: An optional ConnectionPool to share between clients. The calls,
+            uploads and data entry streams of the client reuse its connections.
+        @param compress_threshold: Gzip the requests and uploaded files larger than
+            this many bytes, None (the default) to not compress them. Gzipped
+            responses are always accepted.
+        @param compress_level: The gzip compression level, from 1 (fastest) to 9
+        @param upload_workers: The number of files of a commit uploaded at once
+        @param upload_timeout: The socket timeout in seconds of each file upload, by
+            default the socket default
+        @param upload_chunk_size: The number of bytes of a file sent at a time. Files
+            are streamed, so they are never held in memory whole.
+        @param upload_progress: An optional function called with the object id, the
+            attribute, the bytes sent so far and the size of the file (or None if it is
+            not known) as each file uploads. It is called from the upload threads.
         
         >>> s = IngesterPlatformAPI("")
         Traceback (most recent call last):
@@ -203,9 +954,20 @@ class IngesterPlatformAPI(object):
             connection_url = "%s://%s%s"%(url_obj[0], url_obj[1], url_obj[2])
         else:
             connection_url = "%s://%s:%s@%s%s"%(url_obj[0], auth.username, auth.password, url_obj[1], url_obj[2])
-        self.server = xmlrpclib.ServerProxy(connection_url, allow_none=True)
+        self.server = ServerProxy(connection_url, codec, pool=pool)
+        self.server("transport").encode_threshold = compress_threshold
+        self.server("transport").compress_level = compress_level
         self.auth = auth
-        self._marshaller = Marshaller()
+        self._marshaller = marshaller if marshaller != None else Marshaller()
+        self.identity_map = IdentityMap() if identity_map is True else (identity_map or None)
+        if track_changes or self.identity_map != None:
+            self._marshaller = self._marshaller.decoding(track=track_changes or None,
+                                                         identity_map=self.identity_map)
+        self.stream_commits = stream_commits
+        self.upload_workers = upload_workers
+        self.upload_timeout = upload_timeout
+        self.upload_chunk_size = upload_chunk_size
+        self.upload_progress = upload_progress
 
     def ping(self):
         """A simple diagnotic method which should return "PONG"
@@ -227,6 +989,16 @@ class IngesterPlatformAPI(object):
         except Exception, e:
             raise translate_exception(e)
         
+    def post_many(self, ingester_objects, workers=8):
+        """
+        Post many objects, using several threads to make the calls at once. A failed post does not stop the others.
+
+        :param ingester_objects: The objects to insert or update, see post.
+        :param workers: The most calls made at once. Connections beyond the size of the connection pool are not kept.
+        :return: The result of each post in the order of the objects, or the exception it failed with.
+        """
+        return _run_parallel(self.post, ingester_objects, workers)
+
     def insert(self, ingester_object):
         """
         Create a new entry using the passed in object, the entry type will be based on the objects type.
@@ -247,7 +1019,10 @@ class IngesterPlatformAPI(object):
         :return: The updated object (eg. :return == ingester_object should always be true on success).
         """
         try:
-            return self._marshaller.dict_to_obj(self.server.update(self._marshaller.obj_to_dict(ingester_object)))
+            ret = self._marshaller.dict_to_obj(self.server.update(self._marshaller.obj_to_dict(ingester_object)))
+            if changed_properties(ingester_object) != None:
+                track_changes(ingester_object)
+            return ret
         except Exception, e:
             raise translate_exception(e)
 
@@ -260,9 +1035,52 @@ class IngesterPlatformAPI(object):
         """
         pass
     
-    def search(self, criteria, offset, limit):
+    def _decoded_call(self, methodname, *params, **kwargs):
+        """Call the method, decoding the response into objects as it is read.
+        The marshaller keyword argument overrides the client's marshaller."""
+        stream = self.server("stream")(methodname, params)
+        try:
+            return parse_response(self.server("codec"), kwargs.get("marshaller", self._marshaller), stream)
+        finally:
+            stream.close()
+
+    def _iter_call(self, items, methodname, *params):
+        """Call the method, yielding the items of the result list as they are read"""
+        stream = self.server("stream")(methodname, params)
+        try:
+            for item in iter_response(self.server("codec"), self._marshaller, stream, items):
+                yield item
+        finally:
+            stream.close()
+
+    def search(self, criteria, offset, limit, frames=False):
+        """Search for objects matching the criteria.
+
+        :param frames: return data entry results as a DataEntryFrame rather
+            than a list of DataEntry objects
+        """
+        try:
+            if not frames:
+                return self._decoded_call("search", self._marshaller.obj_to_dict(criteria), offset, limit)
+            results = self._decoded_call("search", self._marshaller.obj_to_dict(criteria), offset, limit,
+                                         marshaller=self._marshaller.decoding(frames=True))
+            if type(results.results) is list and \
+                    all([isinstance(result, DataEntry) for result in results.results]):
+                # The server did not send a batch
+                results.results = DataEntryFrame.from_entries(results.results,
+                                                              getattr(criteria, "dataset", None))
+            return results
+        except Exception, e:
+            logger.exception(e)
+            raise translate_exception(e)
+
+    def iter_search(self, criteria, offset, limit):
+        """Search, yielding each result as soon as it has been read rather
+        than returning the SearchResults once the whole response is read.
+        """
         try:
-            return self._marshaller.dict_to_obj(self.server.search(self._marshaller.obj_to_dict(criteria), offset, limit))
+            for result in self._iter_call("results", "search", self._marshaller.obj_to_dict(criteria), offset, limit):
+                yield result
         except Exception, e:
             logger.exception(e)
             raise translate_exception(e)
@@ -274,10 +1092,16 @@ class IngesterPlatformAPI(object):
         """
         transaction_id = None
         try:
+            errors = unit.validate_data()
+            if len(errors) > 0:
+                raise InvalidObjectError(errors)
             to_upload = []
-            unit_dto = self._marshaller.obj_to_dict(unit)
             
             for obj in unit._to_update:
+                if type(obj) is DataEntryFrame:
+                    for entry_id, k, val in obj.files():
+                        to_upload.append( ( "data_entry:%d"%(entry_id), k, val) )
+                    continue
                 if not hasattr(obj, "data"): continue
                 for k in obj.data:
                     val = obj.data[k]
@@ -285,48 +1109,73 @@ class IngesterPlatformAPI(object):
                     to_upload.append( ( "%s:%d"%(obj.__xmlrpc_class__,obj.id), k, val) )
     
             for obj in unit._to_insert:
+                if type(obj) is DataEntryFrame:
+                    for entry_id, k, val in obj.files():
+                        to_upload.append( ( "data_entry:%d"%(entry_id), k, val) )
+                    continue
                 if not hasattr(obj, "data"): continue
                 for k in obj.data:
                     val = obj.data[k]
                     if not isinstance(val, FileObject): continue
                     to_upload.append( ( "%s:%d"%(obj.__xmlrpc_class__,obj.id), k, val) )
             
-            transaction_id = self.server.precommit(unit_dto)
+            if self.stream_commits:
+                codec = self.server("codec")
+                transaction_id = self.server("send")(ChunkedBody(
+                        lambda: self._marshaller.stream_request(codec, "precommit", (unit,))))
+            else:
+                transaction_id = self.server.precommit(self._marshaller.obj_to_dict(unit))
             # do uploads
             
             (proto, host, path, params, query, frag) = urlparse.urlparse(self.service_url)
-            c = httplib.HTTPConnection(host)
-            headers = {"Content-Type":"application/octet-stream"}
-            if self.auth != None:
-                headers["Authorization"] = "Basic %s"%(base64.b64encode("%s:%s"%(self.auth.username, self.auth.password)))
-            for oid, attr, file_obj in to_upload:
-                if file_obj.f_handle != None:
-                    f_handle = file_obj.f_handle
-                else:
-                    f_handle = open(file_obj.f_path, "rb")
-                c.request('POST', "%s/%s/%s/%s"%(path, transaction_id, oid, attr), f_handle, 
-                          headers)
-                r = c.getresponse()
-                r.close()
-                if r.status != 200:
-                    raise Exception("Error uploading data files")
-                f_handle.close()
-            c.close()
+            uploaded = _run_parallel(lambda upload: self._upload(path, transaction_id, *upload),
+                                     to_upload, self.upload_workers)
+            for e in uploaded:
+                # Only commit once every file is uploaded
+                if isinstance(e, Exception): raise e
             
             results = self.server.commit(transaction_id)
             
             lookup = {}
             for result in results: lookup[result["correlationid"]] = result
             for obj in unit._to_update:
-                if obj.id not in lookup: continue
-                self._marshaller.dict_to_obj(lookup[obj.id], obj)
+                if type(obj) is DataEntryFrame: continue
+                if obj.id in lookup:
+                    self._marshaller.dict_to_obj(lookup[obj.id], obj)
+                if changed_properties(obj) != None:
+                    # The changes have been sent
+                    track_changes(obj)
             for obj in unit._to_insert:
+                if type(obj) is DataEntryFrame:
+                    obj.ids = [lookup[i]["id"] if i in lookup else i for i in obj.ids]
+                    continue
                 if obj.id not in lookup: continue
                 self._marshaller.dict_to_obj(lookup[obj.id], obj)
         except Exception, e:
             logger.exception("Exception while committing " + `transaction_id`)
             raise translate_exception(e)
 
+    def _upload(self, path, transaction_id, oid, attr, file_obj):
+        """Upload the file of a commit"""
+        if file_obj.f_handle != None:
+            f_handle = file_obj.f_handle
+        else:
+            f_handle = open(file_obj.f_path, "rb")
+        try:
+            progress = None
+            if self.upload_progress != None:
+                progress = lambda sent, total: self.upload_progress(oid, attr, sent, total)
+            body = FileBody(f_handle, self.upload_chunk_size, progress)
+            r = self.server("open")('POST', "%s/%s/%s/%s"%(path, transaction_id, oid, attr), body,
+                                    {"Content-Type":"application/octet-stream"},
+                                    compress=_compressible(file_obj.mime_type), timeout=self.upload_timeout)
+            r.read()
+            r.close()
+        finally:
+            f_handle.close()
+        if r.status != 200:
+            raise Exception("Error uploading data files, got code %d for %s.%s" % (r.status, oid, attr))
+
     def enableDataset(self, dataset_id):
         """Enable data ingestion for this dataset.
         """
@@ -351,7 +1200,19 @@ class IngesterPlatformAPI(object):
         :return: an array of file handles for all log files for that dataset.
         """
         try:
-            return self._marshaller.dict_to_obj(self.server.getIngesterLogs(dataset_id))
+            return self._decoded_call("getIngesterLogs", dataset_id)
+        except Exception, e:
+            raise translate_exception(e)
+
+    def iterIngesterLogs(self, dataset_id):
+        """
+        Get all ingester logs for a single dataset, yielding each log as soon as it has been read.
+
+        :param dataset_id: ID of the dataset to get ingester logs for
+        """
+        try:
+            for log in self._iter_call("", "getIngesterLogs", dataset_id):
+                yield log
         except Exception, e:
             raise translate_exception(e)
 
@@ -402,18 +1263,18 @@ class IngesterPlatformAPI(object):
         
         """
         try:
-            req = urllib2.Request("%s/data_entry/%s/%s/%s"%(self.service_url, ds_id, de_id, attr))
-            if self.auth != None:
-                req.add_header("Authorization" ,"Basic %s"%base64.b64encode("%s:%s"%(self.auth.username, self.auth.password)))
-            resp = urllib2.urlopen(req)
-            if resp.getcode == 404:
+            path = urlparse.urlparse(self.service_url)[2]
+            resp = self.server("open")("GET", "%s/data_entry/%s/%s/%s"%(path, ds_id, de_id, attr))
+            if resp.status == 404:
+                resp.read()
                 resp.close()
                 return None
-            elif resp.code == 200:
+            elif resp.status == 200:
                 return resp
             else:
+                resp.read()
                 resp.close()
-                raise InternalSystemError("Error getting stream, got code " + resp.getcode)
+                raise InternalSystemError("Error getting stream, got code %d" % resp.status)
 
         except Exception, e:
             raise translate_exception(e)
@@ -431,6 +1292,12 @@ class IngesterPlatformAPI(object):
         except Exception, e:
             raise translate_exception(e)
         
+    def createBatch(self):
+        """Creates a batch, which sends many get, enable and disable calls to the
+        server in one request
+        """
+        return Batch(self)
+
     def createUnitOfWork(self):
         """Creates a unit of work object that can be used to create transactional consistent set of operations
         """
@@ -441,12 +1308,15 @@ class IngesterPlatformAPI(object):
         Close should always be called when finished with the IngesterPlatformAPI to allow it to clean up any related data.
         :return:
         """
-        pass
+        self.server("close")()
 
 class UnitOfWork(object):
     """The unit of work encapsulates all the operations in a transaction.
     
     There is no rollback, simply discard the unit of work in this case.
+
+    Data entries are checked against the schemas of their datasets, given with
+    set_schema, when the unit is committed.
     """
     __xmlrpc_class__ = "unit_of_work"
     to_insert = typed("_to_insert", list)
@@ -463,12 +1333,18 @@ class UnitOfWork(object):
         self._to_enable = []
         self._to_disable = []
         self._next = -1
+        self._validators = {}
         
     def post(self, ingester_object):
         """ If the object has an ID this object is updated, else it is inserted.
         
         @return: the ID for this object to be used on other objects
         """
+        if type(ingester_object) is DataEntryFrame:
+            if ingester_object.ids.count(None) == len(ingester_object):
+                return self.insert(ingester_object)
+            self.update(ingester_object)
+            return ingester_object.ids
         if ingester_object.id == None:
             return self.insert(ingester_object)
         else:
@@ -478,8 +1354,11 @@ class UnitOfWork(object):
     def insert(self, ingester_object):
         """Records the object for ingestion.
         
-        @return: the ID to use on other objects.
+        @return: the ID to use on other objects, or the list of IDs of the
+            entries of a DataEntryFrame.
         """
+        if type(ingester_object) is DataEntryFrame:
+            return self._insert_frame(ingester_object)
         if ingester_object.id != None:
             raise InvalidObjectError([ValidationError("id","Expected no ID set")])
         validation = ingester_object.validate()
@@ -491,6 +1370,20 @@ class UnitOfWork(object):
         self._next = self._next - 1
         return ingester_object.id
 
+    def _insert_frame(self, frame):
+        """Records all the entries of the frame for ingestion, each gets its
+        own ID"""
+        if frame.ids.count(None) != len(frame.ids):
+            raise InvalidObjectError([ValidationError("ids","Expected no IDs set")])
+        validation = frame.validate()
+        if len(validation) > 0:
+            raise InvalidObjectError(validation)
+
+        frame.ids = range(self._next, self._next - len(frame), -1)
+        self._to_insert.append(frame)
+        self._next = self._next - len(frame)
+        return frame.ids
+
     def update(self, ingester_object):
         validation = ingester_object.validate()
         if len(validation) > 0:
@@ -507,10 +1400,50 @@ class UnitOfWork(object):
     def disable(self, ingester_object_id):
         self._to_disable.append(ingester_object_id)
 
+    def set_schema(self, dataset_id, schema, resolver=None, required=()):
+        """Check the data entries of the dataset against the schema.
+
+        :param schema: a DataEntrySchema or ConcreteSchema, or an EntryValidator
+            compiled from one
+        :param resolver: looks up the schemas that the schema extends by id,
+            such as IngesterPlatformAPI.getSchema
+        :param required: the attributes every entry must have, or True for all
+        """
+        if not isinstance(schema, EntryValidator):
+            schema = compile_validator(schema, resolver, required)
+        self._validators[dataset_id] = schema
+
+    def validate_data(self):
+        """Check the data entries to insert and update against the schemas of
+        their datasets, all the entries of a dataset in one pass.
+
+        @return: the list of ValidationErrors
+        """
+        if not self._validators:
+            return []
+        batches = {}
+        frames = []
+        for obj in self._to_insert + self._to_update:
+            dataset = getattr(obj, "dataset", None)
+            if dataset not in self._validators:
+                continue
+            elif type(obj) is DataEntryFrame:
+                frames.append(obj)
+            elif isinstance(obj, DataEntry):
+                batches.setdefault(dataset, []).append(obj)
+        errors = []
+        for dataset in sorted(batches):
+            errors.extend(self._validators[dataset].validate(batches[dataset]))
+        for frame in frames:
+            errors.extend(self._validators[frame.dataset].validate(frame))
+        return errors
+
     def commit(self):
-        """Commit this unit of work using the original service instance.
+        """Commit this unit of work using the original service instance. The
+        result of the service's commit is returned, a Future for an
+        AsyncIngesterPlatformAPI.
         """
-        self.service.commit(self)
+        return self.service.commit(self)
         
     def findId(self, collection, obj_id):
         """Looks for an id in a collection of objects.
@@ -530,6 +1463,107 @@ class UnitOfWork(object):
             if obj.id == obj_id: return True
         return False
 
+class BatchCall(object):
+    """A call queued in a Batch, which holds its result once the batch is sent"""
+    def __init__(self, methodname, params, decode):
+        self.methodname = methodname
+        self.params = params
+        self.decode = decode
+        self.done = False
+        self.value = None
+        self.exception = None
+
+    def result(self):
+        """Returns the result of the call, or raises the exception it failed with"""
+        if not self.done:
+            raise ValueError("The batch has not been sent")
+        if self.exception != None:
+            raise self.exception
+        return self.value
+
+    def __repr__(self):
+        return "<BatchCall %s%r>" % (self.methodname, tuple(self.params))
+
+class Batch(object):
+    """A batch queues get, enable and disable calls and sends them to the
+    server in one request, using system.multicall.
+
+    Each queued call returns a BatchCall, holding its own result or exception
+    once the batch is sent, so one failed call does not fail the others.
+
+    >>> batch = Batch(None)
+    >>> batch.getDataset(1)
+    <BatchCall getDataset(1,)>
+    >>> batch.enableDataset(2)
+    <BatchCall enableDataset(2,)>
+    >>> len(batch)
+    2
+    """
+    def __init__(self, service=None):
+        self.service = service
+        self.calls = []
+
+    def _queue(self, methodname, params, decode=True):
+        call = BatchCall(methodname, params, decode)
+        self.calls.append(call)
+        return call
+
+    def getRegion(self, reg_id):
+        return self._queue("getRegion", (reg_id,))
+
+    def getLocation(self, loc_id):
+        return self._queue("getLocation", (loc_id,))
+
+    def getSchema(self, s_id):
+        return self._queue("getSchema", (s_id,))
+
+    def getDataset(self, ds_id):
+        return self._queue("getDataset", (ds_id,))
+
+    def getDataEntry(self, ds_id, de_id):
+        return self._queue("getDataEntry", (ds_id, de_id))
+
+    def getIngesterLogs(self, dataset_id):
+        return self._queue("getIngesterLogs", (dataset_id,))
+
+    def enableDataset(self, dataset_id):
+        return self._queue("enableDataset", (dataset_id,), False)
+
+    def disableDataset(self, dataset_id):
+        return self._queue("disableDataset", (dataset_id,), False)
+
+    def __len__(self):
+        return len(self.calls)
+
+    def send(self):
+        """Send the queued calls, setting the result of each of them. The batch
+        is emptied, so it can be used again.
+
+        :return: the results of the calls, in the order they were queued
+        :raises: the exception of the first failed call, once all the results
+            have been set
+        """
+        calls, self.calls = self.calls, []
+        if not calls:
+            return []
+        marshaller = self.service._marshaller
+        try:
+            results = self.service.server.system.multicall(
+                [{"methodName": call.methodname, "params": list(call.params)} for call in calls])
+        except Exception, e:
+            raise translate_exception(e)
+        if len(results) != len(calls):
+            raise InternalSystemError("Expected %d results from the batch, got %d" % (len(calls), len(results)))
+        for call, result in zip(calls, results):
+            call.done = True
+            try:
+                if isinstance(result, dict):
+                    raise xmlrpclib.Fault(result["faultCode"], result["faultString"])
+                call.value = marshaller.dict_to_obj(result[0]) if call.decode else result[0]
+            except Exception, e:
+                call.exception = translate_exception(e)
+        return [call.result() for call in calls]
+
 def push_data(self, authentication, data_entry, dataset_id):
     """
         For datasets that use a PushDataSource, data can be entered using this method.
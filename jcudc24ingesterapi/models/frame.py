@@ -0,0 +1,233 @@
+"""A columnar container for many data entries of one dataset.
+
+A DataEntryFrame holds the timestamps (as seconds since the epoch) and each
+float or integer attribute in an array.array, so a long sensor series does not
+need a DataEntry object per reading. NumPy arrays can be used for the columns
+too, and are kept as they are. Other attributes, such as strings and files,
+are kept in lists. Missing values are given as None, and kept as None in the
+lists. In float columns they are stored as NaN and recorded in the missing
+dict of the frame, so they are kept apart from NaN measurements (such as the
+NaN values of an assigned NumPy array). Values such as NumPy scalars and
+Decimals are converted to plain python values by the registered converters,
+in bulk when a whole column is assigned.
+
+Frames are marshalled as a single columnar data_entry_batch when the
+Marshaller has batching enabled, and as one data entry per row otherwise.
+
+>>> frame = DataEntryFrame(1)
+>>> frame.append(datetime.datetime(2013, 1, 1), {"temp": 21.5})
+>>> frame.append(datetime.datetime(2013, 1, 1, 0, 1), {"temp": 22})
+>>> frame["temp"]
+array('d', [21.5, 22.0])
+>>> [entry["temp"] for entry in frame.to_entries()]
+[21.5, 22.0]
+"""
+__author__ = 'Casey Bajema'
+import array
+import calendar
+import datetime
+
+from jcudc24ingesterapi import UTC, ValidationError, format_timestamp, converters
+from jcudc24ingesterapi.models.data_entry import DataEntry, FileObject
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=UTC)
+NAN = float("nan")
+
+def to_epoch(dt):
+    """Seconds since the epoch. Aware datetimes are converted to UTC, naive
+    ones are taken to be in UTC already."""
+    return calendar.timegm(dt.utctimetuple()) + dt.microsecond / 1000000.0
+
+def from_epoch(seconds):
+    """The UTC datetime for seconds since the epoch"""
+    return EPOCH + datetime.timedelta(microseconds=int(round(seconds * 1000000)))
+
+def _is_float_column(column):
+    return getattr(column, "typecode", None) == "d" or \
+        getattr(getattr(column, "dtype", None), "kind", None) == "f"
+
+def _missing(values):
+    """The set of indexes of the None values of a list"""
+    return set([i for i, v in enumerate(values) if v is None])
+
+def _compact(values):
+    """Store a list of values in an array if they are all floats, or all
+    integers. None values of floats are stored as NaN."""
+    types = set(map(type, values))
+    if types <= set([float, int, type(None)]) and float in types:
+        return array.array("d", [NAN if v is None else v for v in values])
+    elif types == set([int]):
+        return array.array("l", values)
+    return list(values)
+
+def _new_column(value_type, n):
+    """A column for values of the type, with n missing values"""
+    if value_type is float:
+        return array.array("d", [NAN]) * n
+    elif value_type is int and n == 0:
+        return array.array("l")
+    return [None] * n
+
+def _timestamps(values):
+    """Seconds since the epoch for a list of datetimes or numbers, or a numpy
+    datetime64 array"""
+    if getattr(getattr(values, "dtype", None), "kind", None) == "M":
+        return array.array("d", (values.astype("datetime64[us]").astype("int64") / 1000000.0).tolist())
+    elif isinstance(values, array.array):
+        return values
+    if isinstance(values, (list, tuple)) and None in values:
+        raise ValueError("The timestamps of the entries of a frame must be set")
+    return array.array("d", [to_epoch(v) if isinstance(v, datetime.datetime) else v for v in values])
+
+class DataEntryFrame(object):
+    """The data entries of one dataset, stored by column.
+
+    :param dataset: the dataset ID
+    :param timestamps: the timestamps of the entries, as datetimes, seconds
+        since the epoch or a numpy datetime64 array
+    :param data: a dict of attribute name to the column of values
+    :param ids: the IDs of the entries, if they are known
+    :param location_offsets: the LocationOffset of each entry, or None
+    """
+    def __init__(self, dataset=None, timestamps=(), data=None, ids=None, location_offsets=None):
+        self.dataset = dataset
+        self.timestamps = _timestamps(timestamps)
+        self.ids = list(ids) if ids != None else [None] * len(self.timestamps)
+        self.location_offsets = list(location_offsets) if location_offsets != None else None
+        self.columns = {}
+        # Float column name -> the set of indexes of its missing values
+        self.missing = {}
+        if data != None:
+            for name in data:
+                self[name] = data[name]
+
+    @classmethod
+    def from_entries(cls, entries, dataset=None):
+        """Create a frame from a list of data entries of one dataset"""
+        frame = cls(dataset if dataset != None or not entries else entries[0].dataset)
+        for entry in entries:
+            if entry.dataset != frame.dataset:
+                raise ValueError("All the entries must be from dataset %s" % frame.dataset)
+            frame.append(entry.timestamp, entry.data, entry.id, entry.location_offset)
+        return frame
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        if len(values) != len(self):
+            raise ValueError("Column %s has %d values, expected %d" % (name, len(values), len(self)))
+        values = converters.convert_column(values)
+        missing = set()
+        if isinstance(values, list):
+            missing = _missing(values)
+            values = _compact(values)
+        self.columns[name] = values
+        self.missing.pop(name, None)
+        if missing and _is_float_column(values):
+            self.missing[name] = missing
+
+    def __delitem__(self, name):
+        del self.columns[name]
+        self.missing.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    @property
+    def attributes(self):
+        return sorted(self.columns)
+
+    def append(self, timestamp, data=None, id=None, location_offset=None):
+        """Add an entry to the end of the frame. None values of the data are
+        missing values."""
+        if timestamp is None:
+            raise ValueError("The timestamp of an entry of a frame must be set")
+        n = len(self)
+        timestamp = float(to_epoch(timestamp) if isinstance(timestamp, datetime.datetime) else timestamp)
+        if data != None:
+            values = data.values()
+            converted = converters.convert_column(values)
+            if converted is not values:
+                data = dict(zip(data.keys(), converted))
+            for name in data:
+                if name not in self.columns:
+                    self.columns[name] = _new_column(type(data[name]), n)
+                    if n and _is_float_column(self.columns[name]):
+                        self.missing[name] = set(xrange(n))
+        for name, column in self.columns.iteritems():
+            v = data.get(name) if data != None else None
+            if v is None and _is_float_column(column):
+                self.missing.setdefault(name, set()).add(n)
+                v = NAN
+            try:
+                column.append(v)
+            except (TypeError, AttributeError, OverflowError):
+                column = self.columns[name] = self.column_values(name)
+                self.missing.pop(name, None)
+                column.append(v)
+        self.timestamps.append(timestamp)
+        self.ids.append(id)
+        if location_offset != None and self.location_offsets == None:
+            self.location_offsets = [None] * n
+        if self.location_offsets != None:
+            self.location_offsets.append(location_offset)
+
+    def column_values(self, name):
+        """The values of a column as a list, with missing values as None"""
+        column = self.columns[name]
+        values = column.tolist() if hasattr(column, "tolist") else list(column)
+        for i in self.missing.get(name, ()):
+            values[i] = None
+        return values
+
+    def datetimes(self):
+        """The timestamps as UTC datetimes"""
+        return [from_epoch(t) for t in self.timestamps]
+
+    def formatted_timestamps(self):
+        """The timestamps in the wire format"""
+        return [format_timestamp(from_epoch(t)) for t in self.timestamps]
+
+    def to_entries(self, cls=DataEntry):
+        """Create a data entry for each row of the frame"""
+        columns = [(name, self.column_values(name)) for name in self.attributes]
+        entries = []
+        for i, timestamp in enumerate(self.datetimes()):
+            entry = cls(self.dataset, timestamp, self.ids[i])
+            if self.location_offsets != None and self.location_offsets[i] != None:
+                entry.location_offset = self.location_offsets[i]
+            for name, values in columns:
+                if values[i] is not None:
+                    entry[name] = values[i]
+            entries.append(entry)
+        return entries
+
+    def files(self):
+        """Yield (id, attribute name, FileObject) for each file in the frame"""
+        for name in self.attributes:
+            column = self.columns[name]
+            if not isinstance(column, list): continue
+            for i, v in enumerate(column):
+                if isinstance(v, FileObject):
+                    yield self.ids[i], name, v
+
+    def validate(self):
+        """Checks that the frame is complete and consistent"""
+        valid = []
+        if self.dataset == None:
+            valid.append(ValidationError("dataset", "Dataset must be set"))
+        for name in self.attributes:
+            if len(self.columns[name]) != len(self):
+                valid.append(ValidationError(name, "Expected %d values" % len(self)))
+        if len(self.ids) != len(self):
+            valid.append(ValidationError("ids", "Expected %d IDs" % len(self)))
+        if self.location_offsets != None and len(self.location_offsets) != len(self):
+            valid.append(ValidationError("location_offsets", "Expected %d location offsets" % len(self)))
+        return valid
+
+    def __repr__(self):
+        return "<DataEntryFrame dataset %s, %d entries, attributes %s>" % (self.dataset, len(self), self.attributes)
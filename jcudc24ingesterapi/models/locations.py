@@ -69,6 +69,9 @@ class LocationOffset(APIDomainObject):
     """An offset from a frame of reference.
     """
     __xmlrpc_class__ = "offset"
+    # Equal offsets may be shared when decoding, the shared offsets are frozen
+    __value_object__ = True
+    _frozen = False
     x = typed("_x", (int, float))
     y = typed("_y", (int, float))
     z = typed("_z", (int, float))
@@ -76,3 +79,16 @@ class LocationOffset(APIDomainObject):
         self.x = x
         self.y = y
         self.z = z
+
+    def __setattr__(self, name, value):
+        # Listeners may still be set, as they are never called
+        if self._frozen and name not in ("_listener", "_changes"):
+            raise AttributeError("This offset is shared between decoded objects and cannot be changed, "
+                                 "assign a copy (copy.copy) instead")
+        APIDomainObject.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        # Copies of a frozen offset can be changed
+        state = APIDomainObject.__getstate__(self)
+        state.pop("_frozen", None)
+        return state
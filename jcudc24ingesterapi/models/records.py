@@ -0,0 +1,160 @@
+"""Record classes are DataEntry classes compiled from a data entry schema.
+
+Rather than a free form data dict, a record class has a fixed, typed field for
+each attribute of the schema, stored in a slot. Values are checked (and
+converted) as they are assigned, and unknown attributes are rejected. Records
+are marshalled exactly like plain data entries.
+
+>>> from jcudc24ingesterapi.schemas.data_entry_schemas import DataEntrySchema
+>>> from jcudc24ingesterapi.schemas.data_types import Double
+>>> schema = DataEntrySchema("weather")
+>>> schema.addAttr(Double("temp"))
+>>> Weather = record_class(schema)
+>>> entry = Weather(1, None)
+>>> entry["temp"] = 21
+>>> entry.data
+{'temp': 21.0}
+"""
+__author__ = 'Casey Bajema'
+import re
+import datetime
+
+from jcudc24ingesterapi import TypedProperty, parse_timestamp
+from jcudc24ingesterapi.ingester_exceptions import UnknownParameterError
+from jcudc24ingesterapi.models.data_entry import DataEntry, FileObject
+from jcudc24ingesterapi.schemas import ConcreteSchema
+from jcudc24ingesterapi.schemas.data_types import FileDataType, String, Integer,\
+    Double, DateTime, Boolean
+
+# Data type -> the types its values may have. Longs are converted to ints, as
+# the Marshaller does not send longs, and raise OverflowError if too large.
+FIELD_TYPES = [
+    (FileDataType, (FileObject,)),
+    (String, (str, unicode)),
+    (Integer, (int,)),
+    (Double, (float,)),
+    (DateTime, (datetime.datetime,)),
+    (Boolean, (bool,)),
+    ]
+
+# Data type -> converters of the values of its fields, besides the registered
+# converters. Datetimes are sent as timestamp strings, which are parsed when
+# they are decoded into a record.
+FIELD_CONVERSIONS = [
+    (DateTime, {str: parse_timestamp, unicode: parse_timestamp}),
+    ]
+
+_UNSET = object()
+
+def _data_getter(self):
+    data = {}
+    for name, field in self.__fields__.iteritems():
+        value = getattr(self, field.attr, _UNSET)
+        if value is not _UNSET:
+            data[name] = value
+    return data
+
+def _data_setter(self, data):
+    for field in self.__fields__.itervalues():
+        if hasattr(self, field.attr):
+            delattr(self, field.attr)
+    if data != None:
+        for name in data:
+            self[name] = data[name]
+_data_setter.valid_types = (dict,)
+
+class RecordEntry(DataEntry):
+    """The base class of the record classes. Subclasses are created by
+    record_class, with __fields__ mapping each attribute name to the
+    TypedProperty that checks and stores its values."""
+    __fields__ = {}
+    __schema__ = None
+
+    # A copy of the values, assigning a dict replaces all the values
+    data = property(_data_getter, _data_setter, None, "Data storage")
+
+    def _field(self, item, value=None):
+        try:
+            return self.__fields__[item]
+        except KeyError:
+            raise UnknownParameterError(item, value)
+
+    def __getitem__(self, item):
+        value = getattr(self, self._field(item).attr, _UNSET)
+        if value is _UNSET:
+            raise KeyError(item)
+        return value
+
+    def __setitem__(self, item, value):
+        try:
+            field = self.__fields__[item]
+        except KeyError:
+            raise UnknownParameterError(item, value)
+        field.fset(self, value)
+
+    def __delitem__(self, item):
+        attr = self._field(item).attr
+        if not hasattr(self, attr):
+            raise KeyError(item)
+        delattr(self, attr)
+
+    def __contains__(self, item):
+        field = self.__fields__.get(item)
+        return field != None and hasattr(self, field.attr)
+
+def _field_conversions(data_type):
+    for cls, conversions in FIELD_CONVERSIONS:
+        if isinstance(data_type, cls):
+            return conversions
+    return {}
+
+def _field_types(data_type):
+    for cls, types in FIELD_TYPES:
+        if isinstance(data_type, cls):
+            return types
+    raise ValueError("Unsupported data type %s for %s" % (type(data_type).__name__, data_type.name))
+
+def concrete_schema(schema, resolver=None, seen=None):
+    """Collect the attributes of the schema, and the schemas it extends, into a
+    ConcreteSchema. resolver looks up a schema by its id."""
+    if isinstance(schema, ConcreteSchema):
+        return schema
+    if seen == None:
+        seen = set()
+    concrete = ConcreteSchema([schema])
+    for schema_id in schema.extends:
+        if resolver == None:
+            raise ValueError("Schema %s extends schema %s, a resolver is needed to look it up"
+                             % (schema.name, schema_id))
+        if schema_id in seen:
+            continue
+        seen.add(schema_id)
+        concrete.add(concrete_schema(resolver(schema_id), resolver, seen))
+    return concrete
+
+def record_class(schema, name=None, resolver=None):
+    """Create a record class for the schema.
+
+    :param schema: a DataEntrySchema or ConcreteSchema
+    :param name: the class name, by default based on the schema name
+    :param resolver: a function returning the schema for a schema id (such
+        as IngesterPlatformAPI.getSchema), used to add the attributes of the
+        schemas that the schema extends
+    """
+    concrete = concrete_schema(schema, resolver)
+    if name == None:
+        name = "%sRecord" % str(re.sub("[^A-Za-z0-9_]", "_", getattr(schema, "name", None) or ""))
+
+    fields = {}
+    for attr_name in sorted(concrete.attrs):
+        data_type = concrete.attrs[attr_name]
+        field = TypedProperty("_v_" + attr_name, _field_types(data_type), data_type.description or "")
+        field.conversions.update(_field_conversions(data_type))
+        fields[attr_name] = field
+    namespace = {"__module__": __name__,
+                 "__doc__": "A data entry record of the %s schema" % getattr(schema, "name", None),
+                 "__slots__": tuple(sorted([field.attr for field in fields.itervalues()])),
+                 "__xmlrpc_class__": DataEntry.__xmlrpc_class__,
+                 "__fields__": fields,
+                 "__schema__": concrete}
+    return type(RecordEntry)(name, (RecordEntry,), namespace)
@@ -1,6 +1,13 @@
 import unittest
+import datetime
 
-from jcudc24ingesterapi.models.data_entry import DataEntry
+from jcudc24ingesterapi.ingester_exceptions import UnknownParameterError
+from jcudc24ingesterapi.models.data_entry import DataEntry, FileObject
+from jcudc24ingesterapi.models.records import record_class
+from jcudc24ingesterapi.models.frame import DataEntryFrame
+from jcudc24ingesterapi.models.locations import LocationOffset
+from jcudc24ingesterapi.schemas.data_entry_schemas import DataEntrySchema
+from jcudc24ingesterapi.schemas.data_types import Double, FileDataType, Integer, String
 from jcudc24ingesterapi.models.data_sources import PullDataSource
 from jcudc24ingesterapi.models.dataset import Dataset
 
@@ -12,6 +19,110 @@ class TestIngesterModels(unittest.TestCase):
     def test_data_entry(self):
         pass
 
+    def test_records(self):
+        base = DataEntrySchema("base")
+        base.addAttr(Integer("count"))
+        schema = DataEntrySchema("weather station")
+        schema.addAttr(Double("temp"))
+        schema.addAttr(String("name"))
+        schema.addAttr(FileDataType("image"))
+        schema.extends = [1]
+        self.assertRaises(ValueError, record_class, schema)
+
+        Weather = record_class(schema, resolver={1: base}.get)
+        self.assertEquals("weather_stationRecord", Weather.__name__)
+        self.assertEquals(["count", "image", "name", "temp"], sorted(Weather.__fields__))
+        entry = Weather(1, datetime.datetime(2013, 1, 1), 2)
+        self.assertTrue(isinstance(entry, DataEntry))
+        self.assertRaises(KeyError, entry.__getitem__, "temp")
+        entry["temp"] = 1
+        entry["name"] = u"name"
+        self.assertEquals(1.0, entry["temp"])
+        self.assertTrue(type(entry["temp"]) is float)
+        self.assertRaises(TypeError, entry.__setitem__, "count", "1")
+        self.assertRaises(TypeError, entry.__setitem__, "image", "1/image")
+        self.assertRaises(UnknownParameterError, entry.__setitem__, "humidity", 50.0)
+        self.assertEquals({"temp":1.0, "name":u"name"}, entry.data)
+        del entry["name"]
+        self.assertFalse("name" in entry)
+        entry.data = {"count":3}
+        self.assertEquals({"count":3}, entry.data)
+
+    def test_frame(self):
+        start = datetime.datetime(2013, 1, 1)
+        entries = []
+        for i in range(3):
+            entry = DataEntry(1, start + datetime.timedelta(seconds=i, microseconds=500), i + 1)
+            entry["temp"] = float(i)
+            entry["count"] = i
+            entries.append(entry)
+        entries[1].location_offset = LocationOffset(0, 1, 2)
+        del entries[1]["temp"]
+        entries[2]["image"] = FileObject(f_path="3/image")
+
+        frame = DataEntryFrame.from_entries(entries)
+        self.assertEquals(3, len(frame))
+        self.assertEquals(["count", "image", "temp"], frame.attributes)
+        self.assertEquals("l", frame["count"].typecode)
+        self.assertEquals("d", frame["temp"].typecode)
+        self.assertEquals([0.0, None, 2.0], frame.column_values("temp"))
+        self.assertEquals([None, None, entries[2]["image"]], frame["image"])
+        self.assertEquals([(3, "image", entries[2]["image"])], list(frame.files()))
+        self.assertEquals([], frame.validate())
+
+        for entry, entry_return in zip(entries, frame.to_entries()):
+            self.assertEquals(entry.id, entry_return.id)
+            self.assertEquals(entry.timestamp, entry_return.timestamp.replace(tzinfo=None))
+            self.assertEquals(entry.data, entry_return.data)
+            self.assertEquals(entry.location_offset, entry_return.location_offset)
+
+        # Aware datetimes are read back as the same time in UTC
+        class Brisbane(datetime.tzinfo):
+            def utcoffset(self, dt): return datetime.timedelta(hours=10)
+            def dst(self, dt): return datetime.timedelta(0)
+        local = datetime.datetime(2013, 1, 1, 10, 0, 0, 250000, tzinfo=Brisbane())
+        aware_frame = DataEntryFrame(1, [local])
+        aware_frame.append(local)
+        self.assertEquals([local, local], aware_frame.datetimes())
+        self.assertEquals(datetime.datetime(2013, 1, 1, 0, 0, 0, 250000), aware_frame.datetimes()[0].replace(tzinfo=None))
+        self.assertEquals(local, aware_frame.to_entries()[1].timestamp)
+
+        # Every entry needs a timestamp
+        self.assertRaises(ValueError, frame.append, None, {"count": 3})
+        self.assertRaises(ValueError, DataEntryFrame.from_entries, [DataEntry(1, None)])
+        self.assertRaises(ValueError, DataEntryFrame, 1, [start, None])
+        self.assertEquals(3, len(frame))
+
+        # NaN measurements are kept apart from missing values
+        nan = float("nan")
+        nan_frame = DataEntryFrame(1, [start] * 3, {"temp": [nan, None, 1.5]})
+        self.assertEquals("d", nan_frame["temp"].typecode)
+        nan_frame.append(start, {"temp": None})
+        nan_frame.append(start, {"temp": nan, "depth": 2.0})
+        values = nan_frame.column_values("temp")
+        self.assertTrue(values[0] != values[0] and values[4] != values[4])
+        self.assertEquals([None, 1.5, None], values[1:4])
+        self.assertEquals([None, None, None, None, 2.0], nan_frame.column_values("depth"))
+        entries = nan_frame.to_entries()
+        self.assertTrue(entries[0]["temp"] != entries[0]["temp"])
+        self.assertEquals([{}, {"temp": 1.5}, {}], [entry.data for entry in entries[1:4]])
+        # Falling back to a list keeps both
+        nan_frame.append(start, {"temp": "warm"})
+        self.assertEquals([None, 1.5, None], nan_frame.column_values("temp")[1:4])
+        self.assertTrue(nan_frame.column_values("temp")[4] != nan_frame.column_values("temp")[4])
+
+        # Columns fall back to lists when a value does not fit
+        frame.append(start, {"count": "many"})
+        self.assertEquals([0, 1, 2, "many"], frame["count"])
+        self.assertEquals([0.0, None, 2.0, None], frame.column_values("temp"))
+
+        frame = DataEntryFrame(1, [start, start], {"temp": [1, 2.5], "name": ["a", None]})
+        self.assertEquals("d", frame["temp"].typecode)
+        self.assertEquals(["a", None], frame["name"])
+        self.assertRaises(ValueError, frame.__setitem__, "temp", [1.0])
+        self.assertRaises(ValueError, DataEntryFrame.from_entries, [DataEntry(1, start), DataEntry(2, start)])
+        self.assertEquals(1, len(DataEntryFrame().validate()))
+
     def test_data_sources(self):
         pass
 
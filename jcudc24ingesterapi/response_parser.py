@@ -0,0 +1,118 @@
+"""Incremental decoding of responses into domain objects.
+
+For XML-RPC the response is parsed as it is read, and each struct with a class
+is turned into its object as soon as its end tag is seen, so the generic dicts
+and lists never exist for the whole response. The items of a result list can
+also be handed out while the rest of the response is still being read.
+
+The other codecs can not be parsed incrementally, their responses are read
+whole and then decoded.
+"""
+__author__ = 'Casey Bajema'
+import xmlrpclib
+
+CHUNK_SIZE = 65536
+
+class ObjectUnmarshaller(xmlrpclib.Unmarshaller):
+    """An xmlrpclib Unmarshaller that decodes structs with a class element
+    using the marshaller as they are completed.
+
+    :param marshaller: the Marshaller used to create the objects
+    :param items: None, "" to collect the items of the array that is the
+        response, or the name of the top level struct member holding the
+        array. Collected items are moved to ready as they are completed
+        instead of being added to the array.
+    """
+    dispatch = xmlrpclib.Unmarshaller.dispatch.copy()
+
+    def __init__(self, marshaller, items=None):
+        xmlrpclib.Unmarshaller.__init__(self)
+        self._marshaller = marshaller
+        self._items = items
+        # The number of open arrays and structs directly inside the items
+        # array, or 0 once it has been read
+        self._items_depth = None
+        self.ready = []
+
+    def _at_items(self, name_index):
+        """Check if the value being read is the items, name_index is the
+        position of its member name on the stack"""
+        if self._items == None or self._items_depth != None:
+            return False
+        elif self._items == "":
+            return not self._marks
+        return len(self._marks) == 1 and len(self._stack) >= -name_index and \
+            self._stack[name_index] == self._items
+
+    def start(self, tag, attrs):
+        if tag == "array" and self._at_items(-1):
+            self._items_depth = len(self._marks) + 1
+        xmlrpclib.Unmarshaller.start(self, tag, attrs)
+
+    def end(self, tag):
+        xmlrpclib.Unmarshaller.end(self, tag)
+        depth = self._items_depth
+        if depth != None and depth > 0:
+            if len(self._marks) == depth:
+                mark = self._marks[-1]
+                if len(self._stack) > mark:
+                    self.ready.extend(self._stack[mark:])
+                    del self._stack[mark:]
+            elif len(self._marks) < depth:
+                # The items array has ended
+                self._items_depth = 0
+
+    def end_struct(self, data):
+        xmlrpclib.Unmarshaller.end_struct(self, data)
+        if "class" in self._stack[-1]:
+            obj = self._marshaller.dict_to_obj(self._stack[-1])
+            if type(obj) is list and self._at_items(-2):
+                # A batch of items
+                self.ready.extend(obj)
+                obj = []
+            self._stack[-1] = obj
+    dispatch["struct"] = end_struct
+
+def _read_chunks(stream, chunk_size):
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        yield data
+
+def parse_response(codec, marshaller, stream, chunk_size=CHUNK_SIZE):
+    """Read the response from the stream, returning the decoded result"""
+    if codec.name != "xmlrpc":
+        return marshaller.dict_to_obj(codec.loads_response("".join(_read_chunks(stream, chunk_size))))
+    unmarshaller = ObjectUnmarshaller(marshaller)
+    parser = xmlrpclib.ExpatParser(unmarshaller)
+    for data in _read_chunks(stream, chunk_size):
+        parser.feed(data)
+    parser.close()
+    return marshaller.dict_to_obj(unmarshaller.close()[0])
+
+def iter_response(codec, marshaller, stream, items="", chunk_size=CHUNK_SIZE):
+    """Read the response from the stream, yielding the decoded items of its
+    result list as they are read.
+
+    :param items: "" if the result is the list of items, otherwise the name
+        of the attribute of the result that holds the items
+    """
+    if codec.name != "xmlrpc":
+        result = parse_response(codec, marshaller, stream, chunk_size)
+        for item in (result if items == "" else getattr(result, items)):
+            yield item
+        return
+    unmarshaller = ObjectUnmarshaller(marshaller, items)
+    parser = xmlrpclib.ExpatParser(unmarshaller)
+    for data in _read_chunks(stream, chunk_size):
+        parser.feed(data)
+        if unmarshaller.ready:
+            ready, unmarshaller.ready = unmarshaller.ready, []
+            for item in ready:
+                yield item
+    parser.close()
+    # Raises the fault if the call failed
+    unmarshaller.close()
+    for item in unmarshaller.ready:
+        yield item
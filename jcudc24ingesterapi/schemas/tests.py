@@ -1,6 +1,11 @@
 import unittest
+import datetime
 from jcudc24ingesterapi.schemas.metadata_schemas import DataEntryMetadataSchema
+from jcudc24ingesterapi.schemas.data_entry_schemas import DataEntrySchema
 from jcudc24ingesterapi.schemas.data_types import *
+from jcudc24ingesterapi.schemas.validation import compile_validator
+from jcudc24ingesterapi.models.data_entry import DataEntry, FileObject
+from jcudc24ingesterapi.models.frame import DataEntryFrame
 
 class TestSchemas(unittest.TestCase):
     def test_valid_schemas(self):
@@ -24,5 +29,54 @@ class TestDataTypes(unittest.TestCase):
         self.assertRaises(ValueError, Double, "1dfkjdfjk")
         Double("validname")
 
+class TestValidation(unittest.TestCase):
+    def setUp(self):
+        base = DataEntrySchema("base")
+        base.addAttr(Integer("count"))
+        self.schema = DataEntrySchema("weather")
+        self.schema.addAttr(Double("temp"))
+        self.schema.addAttr(FileDataType("image"))
+        self.schema.extends = [1]
+        self.resolver = {1: base}.get
+
+    def entries(self):
+        entries = []
+        for i in range(4):
+            entry = DataEntry(1, datetime.datetime(2013, 1, 1), i + 1)
+            entry["temp"] = 20 if i == 0 else 20.5
+            entry["count"] = i
+            entries.append(entry)
+        entries[1]["temp"] = "warm"
+        entries[2]["humidity"] = 50.0
+        entries[3]["image"] = FileObject(f_path=__file__)
+        entries[3].data.pop("count")
+        return entries
+
+    def test_entries(self):
+        self.assertRaises(ValueError, compile_validator, self.schema)
+        self.assertRaises(ValueError, compile_validator, self.schema, self.resolver, ["missing"])
+        validator = compile_validator(self.schema, self.resolver)
+        entries = self.entries()
+        errors = validator.validate(entries)
+        self.assertEquals([("data_entry:2.temp", "type"), ("data_entry:3.humidity", "unknown")],
+                          [(e.field, e.code) for e in errors])
+
+        validator = compile_validator(self.schema, self.resolver, required=True)
+        entries[3]["image"] = FileObject(f_path="missing/image")
+        entries[0].id = None
+        errors = validator.validate(entries)
+        self.assertEquals([("data_entry[0].image", "missing"), ("data_entry:2.image", "missing"),
+                           ("data_entry:2.temp", "type"), ("data_entry:3.humidity", "unknown"),
+                           ("data_entry:3.image", "missing"), ("data_entry:4.count", "missing"),
+                           ("data_entry:4.image", "file")],
+                          [(e.field, e.code) for e in errors])
+
+    def test_frames(self):
+        entries = self.entries()
+        for required in ((), True):
+            validator = compile_validator(self.schema, self.resolver, required)
+            self.assertEquals([(e.field, e.code) for e in validator.validate(entries)],
+                              [(e.field, e.code) for e in validator.validate(DataEntryFrame.from_entries(entries))])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""Checks data entries against their data entry schema before they are sent.
+
+A validator is compiled once per schema into a straight line function, with a
+block of checks per attribute, and then checks a whole batch of entries in one
+pass. Every problem found is reported, rather than just the first.
+
+>>> from jcudc24ingesterapi.schemas.data_entry_schemas import DataEntrySchema
+>>> from jcudc24ingesterapi.schemas.data_types import Double
+>>> from jcudc24ingesterapi.models.data_entry import DataEntry
+>>> schema = DataEntrySchema("weather")
+>>> schema.addAttr(Double("temp"))
+>>> validator = compile_validator(schema)
+>>> entry = DataEntry(1, None, 5)
+>>> entry["temp"] = "warm"
+>>> entry["humidity"] = 50.0
+>>> for error in validator.validate([entry]): print error
+data_entry:5.humidity: Unknown attribute
+data_entry:5.temp: Expected double, not str
+"""
+__author__ = 'Casey Bajema'
+import os
+import re
+
+from jcudc24ingesterapi import ValidationError
+from jcudc24ingesterapi.models.frame import DataEntryFrame
+from jcudc24ingesterapi.models.records import FIELD_TYPES, concrete_schema
+from jcudc24ingesterapi.schemas.data_types import Double, Integer, FileDataType
+
+# Array typecodes and numpy dtype kinds of the columns that hold valid values
+# for a data type, without looking at the values
+_COLUMN_KINDS = [
+    (Double, frozenset(["d", "f", "l", "i"])),
+    (Integer, frozenset(["l", "i"])),
+    ]
+
+def _value_types(data_type):
+    """The types of the values that are valid for a data type. Doubles may
+    also be given as integers."""
+    for cls, types in FIELD_TYPES:
+        if isinstance(data_type, cls):
+            if cls is Double:
+                types = types + (int, long)
+            return frozenset(types)
+    raise ValueError("Unsupported data type %s for %s" % (type(data_type).__name__, data_type.name))
+
+def file_present(file_obj):
+    """Check that the file of a FileObject can be uploaded"""
+    return file_obj.f_handle != None or (file_obj.f_path != None and os.path.isfile(file_obj.f_path))
+
+def _error(errors, entry, i, attr, code, message):
+    if entry.id != None:
+        field = "data_entry:%s.%s" % (entry.id, attr)
+    else:
+        field = "data_entry[%d].%s" % (i, attr)
+    errors.append(ValidationError(field, message, code))
+
+def _type_message(data_type, v):
+    return "Expected %s, not %s" % (data_type.__xmlrpc_class__, type(v).__name__)
+
+def _compile(name, lines, namespace):
+    source = "\n".join(lines) + "\n"
+    code = compile(source, "<validator %s>" % name, "exec")
+    exec code in namespace
+    func = namespace[name]
+    func.source = source
+    return func
+
+class EntryValidator(object):
+    """Checks data entries against a schema, see compile_validator.
+
+    :param schema: the ConcreteSchema
+    :param required: the names of the attributes that every entry must have
+    """
+    def __init__(self, schema, required=()):
+        self.schema = schema
+        self.attrs = dict(schema.attrs)
+        self.required = frozenset(required)
+        unknown = self.required.difference(self.attrs)
+        if unknown:
+            raise ValueError("Required attributes are not in the schema: %s" % ", ".join(sorted(unknown)))
+        self.value_types = dict([(name, _value_types(data_type)) for name, data_type in self.attrs.iteritems()])
+        self.check_entries = self._generate()
+
+    def _generate(self):
+        """Generate check_entries(entries, errors), which adds the errors of the
+        entries to the errors list"""
+        name = "check_%s" % re.sub("[^A-Za-z0-9_]", "_", "_".join(sorted(self.attrs)))[:60]
+        namespace = {"known": frozenset(self.attrs), "error": _error, "type_message": _type_message,
+                     "file_present": file_present}
+        lines = ["def %s(entries, errors):" % name,
+                 "    for i, entry in enumerate(entries):",
+                 "        data = entry.data",
+                 "        if not known.issuperset(data):",
+                 "            for k in sorted(data):",
+                 "                if k not in known: error(errors, entry, i, k, 'unknown', 'Unknown attribute')"]
+        for n, attr in enumerate(sorted(self.attrs)):
+            data_type = self.attrs[attr]
+            namespace["types_%d" % n] = self.value_types[attr]
+            namespace["type_%d" % n] = data_type
+            lines.append("        v = data.get(%r)" % attr)
+            if attr in self.required:
+                lines.append("        if v is None: error(errors, entry, i, %r, 'missing', 'Must be set')" % attr)
+            else:
+                lines.append("        if v is None: pass")
+            lines.append("        elif type(v) not in types_%d: error(errors, entry, i, %r, 'type', type_message(type_%d, v))"
+                         % (n, attr, n))
+            if isinstance(data_type, FileDataType):
+                lines.append("        elif not file_present(v): error(errors, entry, i, %r, 'file', 'File not found')" % attr)
+        return _compile(name, lines, namespace)
+
+    def validate(self, entries):
+        """Check a list of data entries, or a DataEntryFrame, returning the
+        list of ValidationErrors"""
+        errors = []
+        if isinstance(entries, DataEntryFrame):
+            self._check_frame(entries, errors)
+        else:
+            self.check_entries(entries, errors)
+        return errors
+
+    def _check_frame(self, frame, errors):
+        """Check the frame column by column, the errors are then put in the
+        same order as for a list of entries"""
+        found = []
+        for attr in frame.attributes:
+            if attr not in self.attrs:
+                for i, v in enumerate(frame.column_values(attr)):
+                    if v is not None:
+                        found.append((i, attr, "unknown", "Unknown attribute"))
+        for attr in sorted(self.attrs):
+            data_type = self.attrs[attr]
+            required = attr in self.required
+            if attr not in frame:
+                if required:
+                    found.extend([(i, attr, "missing", "Must be set") for i in xrange(len(frame))])
+                continue
+            column = frame[attr]
+            kind = getattr(column, "typecode", None) or getattr(getattr(column, "dtype", None), "kind", None)
+            if not required and [cls for cls, kinds in _COLUMN_KINDS
+                                 if isinstance(data_type, cls) and kind in kinds]:
+                # The column can only hold valid values
+                continue
+            types = self.value_types[attr]
+            is_file = isinstance(data_type, FileDataType)
+            for i, v in enumerate(frame.column_values(attr)):
+                if v is None:
+                    if required:
+                        found.append((i, attr, "missing", "Must be set"))
+                elif type(v) not in types:
+                    found.append((i, attr, "type", _type_message(data_type, v)))
+                elif is_file and not file_present(v):
+                    found.append((i, attr, "file", "File not found"))
+        found.sort(key=lambda error: error[0])
+        for i, attr, code, message in found:
+            _error(errors, _FrameRow(frame.ids[i]), i, attr, code, message)
+
+class _FrameRow(object):
+    """Stands in for a data entry of a frame when reporting errors"""
+    __slots__ = ["id"]
+    def __init__(self, id):
+        self.id = id
+
+def compile_validator(schema, resolver=None, required=()):
+    """Compile a validator for the data entries of a schema.
+
+    :param schema: a DataEntrySchema or ConcreteSchema
+    :param resolver: a function returning the schema for a schema id, used to
+        add the attributes of the schemas that the schema extends
+    :param required: the attributes every entry must have, or True if all of
+        them are required
+    """
+    concrete = concrete_schema(schema, resolver)
+    if required is True:
+        required = concrete.attrs.keys()
+    return EntryValidator(concrete, required)
@@ -1,4 +1,5 @@
 from jcudc24ingesterapi import APIDomainObject, typed
+from jcudc24ingesterapi.models.frame import DataEntryFrame
 import datetime
 
 
@@ -102,7 +103,7 @@ class SearchResults(APIDomainObject):
     count = typed("_count", int, "Total number of results")
     offset = typed("_dataset", int, "Offset from the start of the results")
     limit = typed("_limit", int, "Maximum number of results to return")
-    results = typed("_results", list, "Actual result objects")
+    results = typed("_results", (list, DataEntryFrame), "Actual result objects, or a frame of data entries")
     
     def __init__(self, results=None, offset=None, limit=None, count=None):
         self.results = results
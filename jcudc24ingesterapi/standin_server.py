@@ -0,0 +1,201 @@
+"""A minimal local stand-in for the ingester platform service.
+
+It answers calls in any of the wire codecs by dispatching them to plain python
+functions, and is used by the tests and benchmarks that need a real HTTP
+server to talk to.
+
+>>> server = StandInServer({"ping": lambda: "PONG"}).start()
+>>> from jcudc24ingesterapi.transport import ServerProxy
+>>> ServerProxy(server.url, "json").ping()
+u'PONG'
+>>> server.stop()
+"""
+__author__ = 'Casey Bajema'
+import socket
+import sys
+import threading
+import time
+import xmlrpclib
+import zlib
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from jcudc24ingesterapi.codec import CODECS
+from jcudc24ingesterapi.transport import gzip_encode, BLOCK_SIZE
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The headers and body are written separately, which would otherwise wait
+    # for delayed acknowledgements on keep-alive connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        # A data entry stream
+        body = self.server.files.get(self.path)
+        self.respond(200 if body != None else 404, body or "")
+
+    def do_POST(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        blocks = self.read_blocks()
+        if self.headers.get("Content-Encoding") == "gzip":
+            blocks = self.decompress(blocks)
+            self.server.compressed_requests += 1
+        if self.headers.get("Content-Type") == "application/octet-stream":
+            # A data file upload of a commit
+            if self.server.keep_uploads:
+                body = "".join(blocks)
+            else:
+                body = sum([len(block) for block in blocks])
+            if self.path in self.server.rejected_uploads:
+                self.respond(403, "")
+                return
+            self.server.uploads.append((self.path, body))
+            self.respond(200, "")
+            return
+        body = "".join(blocks)
+        codec = self.server.codec_for(self.headers.get("Content-Type", "text/xml"))
+        try:
+            methodname, params = codec.loads_request(body)
+            if methodname not in self.server.methods:
+                raise xmlrpclib.Fault(99, "Unknown method %s" % methodname)
+            response = codec.dumps_response(self.server.methods[methodname](*params))
+        except xmlrpclib.Fault, e:
+            response = codec.dumps_fault(e)
+        except Exception, e:
+            response = codec.dumps_fault(xmlrpclib.Fault(10, str(e)))
+        self.respond(200, response, codec.content_type)
+
+    def respond(self, status, body, content_type=None):
+        """Send a response, gzipped if the client accepts that and it is
+        larger than the compress_threshold of the server"""
+        self.send_response(status)
+        if content_type != None:
+            self.send_header("Content-Type", content_type)
+        threshold = self.server.compress_threshold
+        if (threshold != None and len(body) > threshold and
+                "gzip" in self.headers.get("Accept-Encoding", "")):
+            body = gzip_encode(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_blocks(self):
+        """Read the request body in blocks, whether it has a Content-Length
+        or is sent with chunked transfer encoding"""
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            self.server.chunked_requests += 1
+            while True:
+                size = int(self.rfile.readline().split(";")[0], 16)
+                if size == 0:
+                    break
+                yield self.rfile.read(size)
+                self.rfile.readline()
+            # Skip any trailers
+            while self.rfile.readline() not in ("\r\n", "\n", ""):
+                pass
+        else:
+            size = int(self.headers.get("Content-Length", 0))
+            while size > 0:
+                block = self.rfile.read(min(size, BLOCK_SIZE))
+                if not block:
+                    break
+                size -= len(block)
+                yield block
+
+    def decompress(self, blocks):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for block in blocks:
+            yield decompressor.decompress(block)
+        yield decompressor.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """Serves the given methods on a local port, in a background thread.
+    Uploaded files are recorded in uploads as (path, body) pairs, or as
+    (path, size) pairs if keep_uploads is False, except for the paths in
+    rejected_uploads, which are refused. The
+    bodies in files are served for GET requests of their paths. Responses
+    larger than compress_threshold bytes are gzipped for clients that accept
+    that. Each call is answered after latency seconds, to stand in for the
+    round trip time of a network."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, methods=None, port=0, handler=StandInRequestHandler):
+        HTTPServer.__init__(self, ("127.0.0.1", port), handler)
+        self.methods = dict(methods or {})
+        self.methods.setdefault("system.multicall", self.multicall)
+        self.codecs = dict([(cls.content_type, cls()) for cls in CODECS.values()])
+        self.chunked_requests = 0
+        self.compressed_requests = 0
+        self.compress_threshold = None
+        self.latency = 0
+        self.uploads = []
+        self.keep_uploads = True
+        self.files = {}
+        self.rejected_uploads = set()
+        self._thread = None
+        self._connections = {}
+        self._connections_lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://%s:%d/api" % self.server_address
+
+    def multicall(self, calls):
+        """Make each of the calls, returning a list of the one item lists of
+        their results, or of the fault structs of the calls that failed"""
+        results = []
+        for call in calls:
+            try:
+                if call["methodName"] not in self.methods:
+                    raise xmlrpclib.Fault(99, "Unknown method %s" % call["methodName"])
+                results.append([self.methods[call["methodName"]](*call["params"])])
+            except xmlrpclib.Fault, e:
+                results.append({"faultCode": e.faultCode, "faultString": e.faultString})
+            except Exception, e:
+                results.append({"faultCode": 10, "faultString": str(e)})
+        return results
+
+    def codec_for(self, content_type):
+        return self.codecs[content_type.split(";")[0].strip()]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={"poll_interval":0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def handle_error(self, request, client_address):
+        # A client going away, such as after a timeout, is not an error
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        # Keep track of the open connections, so they can be closed by stop
+        with self._connections_lock:
+            self._connections[request] = threading.current_thread()
+        try:
+            ThreadingMixIn.process_request_thread(self, request, client_address)
+        finally:
+            with self._connections_lock:
+                del self._connections[request]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+        # End the keep-alive connections, which the clients may have left open
+        with self._connections_lock:
+            connections = self._connections.items()
+        for connection, thread in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        for connection, thread in connections:
+            thread.join(1)
@@ -1,17 +1,41 @@
 
 import datetime
 import jcudc24ingesterapi
+from jcudc24ingesterapi import track_changes, changed_properties
+from decimal import Decimal
 import os.path
 import unittest
+import xmlrpclib
+import pickle
+import weakref
+import select
+import socket
+import threading
+import time
+import itertools
+import copy
+import mmap
+import tempfile
+from StringIO import StringIO
 
 from jcudc24ingesterapi.models.dataset import Dataset
 from jcudc24ingesterapi.models.locations import Location, Region, LocationOffset
-from jcudc24ingesterapi.schemas.data_types import FileDataType, Double, String, DateTime
+from jcudc24ingesterapi.schemas.data_types import FileDataType, Double, String, DateTime, Integer
 from jcudc24ingesterapi.models.data_sources import PullDataSource, PushDataSource
 from jcudc24ingesterapi.models.data_entry import DataEntry, FileObject
+from jcudc24ingesterapi.models.records import record_class
+from jcudc24ingesterapi.models.frame import DataEntryFrame
 from jcudc24ingesterapi.ingester_platform_api import IngesterPlatformAPI, Marshaller,\
-    UnitOfWork
+    UnitOfWork, ClassRegistry, MARSHALLED_MODULES, translate_exception, InternTable,\
+    IdentityMap, DATA_ENTRY_BATCH
+from jcudc24ingesterapi.codec import CODECS, get_codec, packb, unpackb
+from jcudc24ingesterapi.standin_server import StandInServer
+from jcudc24ingesterapi import transport
+from jcudc24ingesterapi.transport import ConnectionPool, FileBody
+from jcudc24ingesterapi.async_client import AsyncIngesterPlatformAPI, gather
+from jcudc24ingesterapi.response_parser import ObjectUnmarshaller
 from jcudc24ingesterapi.authentication import CredentialsAuthentication
+from jcudc24ingesterapi.models.system import IngesterLog
 from jcudc24ingesterapi.models.metadata import DatasetMetadataEntry, DataEntryMetadataEntry
 from jcudc24ingesterapi.schemas.metadata_schemas import DataEntryMetadataSchema, DatasetMetadataSchema
 from jcudc24ingesterapi.models.sampling import PeriodicSampling #, CustomSampling, RepeatSampling
@@ -20,7 +44,7 @@ from jcudc24ingesterapi.ingester_exceptions import UnsupportedSchemaError, Inval
 from jcudc24ingesterapi.schemas.data_entry_schemas import DataEntrySchema
 from jcudc24ingesterapi.search import DataEntrySearchCriteria,\
     DatasetMetadataSearchCriteria, LocationSearchCriteria, DatasetSearchCriteria,\
-    DataEntrySchemaSearchCriteria, DataEntryMetadataSearchCriteria
+    DataEntrySchemaSearchCriteria, DataEntryMetadataSearchCriteria, SearchResults
 
 
 class SchemaTest(unittest.TestCase):
@@ -467,6 +491,145 @@ class TestIngesterModels(unittest.TestCase):
     def test_ingester_scripts(self):
         pass
 
+    def test_timestamps(self):
+        for value in ("2013-01-10T03:21:52.000Z", "2013-01-10T03:21:52.123Z", "1999-12-31T23:59:59.999Z",
+                      "2013-01-10T03:21:52.5Z", " 2013-01-10T03:21:52.000123Z", "2013-01-10T03:21:52.123"):
+            self.assertEquals(jcudc24ingesterapi._parse_timestamp_generic(value), jcudc24ingesterapi.parse_timestamp(value))
+        for value in (datetime.datetime(2013, 1, 10, 3, 21, 52), datetime.datetime(2013, 1, 10, 3, 21, 52, 999999),
+                      datetime.datetime(2013, 1, 10, 3, 21, 52, 1000, jcudc24ingesterapi.UTC), "Thu, 10 Jan 2013 03:21:52 GMT"):
+            self.assertEquals(jcudc24ingesterapi._format_timestamp_generic(value), jcudc24ingesterapi.format_timestamp(value))
+
+        values = ["2013-01-10T03:21:52.000Z", None, "2013-01-10T03:21:52.000Z"]
+        parsed = jcudc24ingesterapi.parse_timestamps(values)
+        self.assertEquals(None, parsed[1])
+        self.assertTrue(parsed[0] is parsed[2])
+        self.assertEquals(values, jcudc24ingesterapi.format_timestamps(parsed))
+
+    def test_typed_property(self):
+        class Typed(jcudc24ingesterapi.APIDomainObject):
+            number = jcudc24ingesterapi.typed("_number", (int, float), "A number")
+            name = jcudc24ingesterapi.typed("_name", str)
+        self.assertEquals((int, float), Typed.number.valid_types)
+        self.assertEquals("_number", Typed.number.attr)
+        self.assertEquals("A number", Typed.number.__doc__)
+
+        obj = Typed()
+        self.assertEquals(None, obj.number)
+        obj.name = u"unicode"
+        self.assertTrue(type(obj.name) is str)
+        obj.number = Decimal("1.5")
+        self.assertEquals(1.5, obj.number)
+        self.assertRaises(TypeError, setattr, obj, "number", "1")
+        jcudc24ingesterapi.converters[(str, int)] = int
+        try:
+            obj.number = "1"
+            self.assertEquals(1, obj.number)
+        finally:
+            del jcudc24ingesterapi.converters[(str, int)]
+
+        changes = []
+        obj.set_listener(lambda obj, attr, value: changes.append((attr, value)))
+        obj.number = None
+        self.assertEquals([("_number", None)], changes)
+
+    def test_converters(self):
+        class Typed(jcudc24ingesterapi.APIDomainObject):
+            number = jcudc24ingesterapi.typed("_number", float)
+            count = jcudc24ingesterapi.typed("_count", int)
+            when = jcudc24ingesterapi.typed("_when", datetime.datetime)
+        obj = Typed()
+        obj.number = 2L
+        obj.count = 3L
+        obj.when = datetime.date(2013, 1, 10)
+        self.assertEquals((2.0, float), (obj.number, type(obj.number)))
+        self.assertEquals((3, int), (obj.count, type(obj.count)))
+        self.assertEquals(datetime.datetime(2013, 1, 10), obj.when)
+        self.assertRaises(TypeError, setattr, obj, "number", True)
+
+        # Subclasses use the converter of their base class, and resolvers
+        # handle whole families of types
+        class Money(Decimal): pass
+        class Reading(object):
+            def __init__(self, value): self.value = value
+        obj.number = Money("1.5")
+        self.assertEquals(1.5, obj.number)
+        converters = jcudc24ingesterapi.ConverterRegistry(jcudc24ingesterapi.converters)
+        self.assertEquals(None, converters.find(Reading, (float,)))
+        converters.add_resolver(lambda registry, from_type, to_type:
+                                (lambda v: to_type(v.value)) if from_type is Reading else None)
+        self.assertEquals(1.5, converters.convert(Reading(1.5), (float,)))
+        self.assertTrue(converters.find(Reading, (float,)) is converters.find(Reading, (float,)))
+
+        column = jcudc24ingesterapi.converters.convert_column([Decimal("1.5"), 2, None, Money("3")])
+        self.assertEquals([1.5, 2, None, 3.0], column)
+        self.assertEquals([float, int, type(None), float], map(type, column))
+        frame = DataEntryFrame(1, [datetime.datetime(2013, 1, 1)] * 2, {"temp": [Decimal("1.5"), Decimal("2")]})
+        self.assertEquals("d", frame["temp"].typecode)
+
+        entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52), 3)
+        entry["temp"] = Decimal("1.5")
+        self.assertEquals(1.5, Marshaller().obj_to_dict(entry)["data"]["temp"])
+        entry["temp"] = Reading(1)
+        self.assertRaises(ValueError, Marshaller().obj_to_dict, entry)
+
+        # The properties of the models see the converters registered, or
+        # removed, after they were created
+        location = Location()
+        location.latitude = 3
+        self.assertEquals((3.0, float), (location.latitude, type(location.latitude)))
+        self.assertRaises(UnicodeEncodeError, setattr, FileObject(), "mime_type", u"caf\xe9")
+        unicode_to_str = jcudc24ingesterapi.converters[(unicode, str)]
+        int_to_float = jcudc24ingesterapi.converters[(int, float)]
+        try:
+            jcudc24ingesterapi.converters.register(unicode, str, lambda v: v.encode("utf-8"))
+            del jcudc24ingesterapi.converters[(int, float)]
+            file_obj = FileObject()
+            file_obj.mime_type = u"caf\xe9"
+            self.assertEquals("caf\xc3\xa9", file_obj.mime_type)
+            self.assertRaises(TypeError, setattr, location, "latitude", 3)
+        finally:
+            jcudc24ingesterapi.converters.register(unicode, str, unicode_to_str)
+            jcudc24ingesterapi.converters.register(int, float, int_to_float)
+        location.latitude = 3
+        self.assertEquals((3.0, float), (location.latitude, type(location.latitude)))
+
+        try:
+            import numpy
+        except ImportError:
+            return
+        obj.number = numpy.float32(1.5)
+        obj.count = numpy.int16(3)
+        obj.when = numpy.datetime64("2013-01-10T03:21:52")
+        self.assertEquals((1.5, float), (obj.number, type(obj.number)))
+        self.assertEquals((3, int), (obj.count, type(obj.count)))
+        self.assertEquals(datetime.datetime(2013, 1, 10, 3, 21, 52), obj.when)
+        values = numpy.arange(3, dtype="float32")
+        self.assertTrue(jcudc24ingesterapi.converters.convert_column(values) is values)
+        self.assertEquals([True, False], jcudc24ingesterapi.converters.convert_column(numpy.array([True, False])))
+        entry["temp"] = numpy.int32(2)
+        self.assertEquals(2, Marshaller().obj_to_dict(entry)["data"]["temp"])
+
+    def test_compact_objects(self):
+        if jcudc24ingesterapi.COMPACT_OBJECTS:
+            self.assertEquals(("_x", "_y", "_z"), LocationOffset.__slots__)
+            self.assertTrue(set(["_id", "_location", "_schema"]) <= set(Dataset.__slots__))
+        offset = LocationOffset(0, 1)
+        self.assertEquals(None, offset.z)
+        del offset.y
+        self.assertEquals(None, offset.y)
+        changes = []
+        offset.set_listener(lambda obj, attr, value: changes.append((attr, value)))
+        offset.z = 2
+        self.assertEquals([("_z", 2)], changes)
+
+        data_entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52), 3)
+        data_entry.location_offset = LocationOffset(0, 1, 2)
+        data_entry.extra = "extra"
+        for protocol in (0, 2):
+            copied = pickle.loads(pickle.dumps(data_entry, protocol))
+            self.assertEquals((1, 3, 2, "extra"), (copied.dataset, copied.id, copied.location_offset.z, copied.extra))
+        self.assertTrue(weakref.ref(data_entry)() is data_entry)
+
 
 class TestIngesterPersistence(unittest.TestCase):
     """This set of tests checks that the CRUD functionality works as expected
@@ -822,9 +985,813 @@ More"""
         loc.name = "test"
         unit.insert(loc) # Should work now.
 
+        schema = DataEntrySchema("schema")
+        schema.addAttr(Double("temp"))
+        unit.set_schema(1, schema)
+        entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52))
+        entry["temp"] = "warm"
+        unit.insert(entry)
+        unit.insert(DataEntryFrame(1, [entry.timestamp], {"humidity": [50.0]}))
+        unit.insert(DataEntryFrame(2, [entry.timestamp], {"humidity": [50.0]}))
+        self.assertEquals(["data_entry:-2.temp", "data_entry:-3.humidity"],
+                          [e.field for e in unit.validate_data()])
+        client = IngesterPlatformAPI("http://localhost:1")
+        self.assertRaises(InvalidObjectError, client.commit, unit)
+
+    def test_class_plans(self):
+        """Plans are built once per class while scanning"""
+        plan = self.marshaller.plan_for(DataEntry)
+        self.assertTrue(plan is self.marshaller.plan_for(DataEntry))
+        self.assertEquals("data_entry", plan.xmlrpc_class)
+        self.assertTrue(plan.is_data_entry)
+        self.assertTrue("timestamp" in plan.datetime_properties)
+        self.assertTrue("data" in plan.dict_properties)
+
+        plan = self.marshaller.plan_for(DataEntrySchema)
+        self.assertTrue(plan.is_schema)
+        self.assertFalse("attrs" in plan.encode_properties)
+        self.assertFalse("extends" in plan.encode_properties)
+
+    def test_data_entry_batch(self):
+        marshaller = Marshaller(generated=self.marshaller.generated, batch_threshold=2)
+        dt = datetime.datetime(2013, 1, 10, 3, 21, 52, tzinfo=jcudc24ingesterapi.UTC)
+        entries = []
+        for i in range(3):
+            entry = DataEntry(1, dt + datetime.timedelta(seconds=i), id=i+1)
+            entry["temp"] = float(i)
+            entries.append(entry)
+        entries[1].location_offset = LocationOffset(0, 1, 2)
+        entries[2]["image"] = FileObject(f_path="3/image", mime_type="image/jpeg")
+
+        results = marshaller.obj_to_dict(SearchResults(entries, 0, 3, 3))
+        batch = results["results"]
+        self.assertEquals("data_entry_batch", batch["class"])
+        self.assertEquals(1, batch["dataset"])
+        self.assertEquals(["image", "temp"], batch["attributes"])
+        self.assertEquals([1, 2, 3], batch["id"])
+        self.assertEquals([None, None, "image/jpeg"], [f and f["mime_type"] for f in batch["data"][0]])
+        self.assertEquals([0.0, 1.0, 2.0], batch["data"][1])
+
+        results = self.marshaller.dict_to_obj(results)
+        self.assertEquals(3, len(results.results))
+        for entry, entry_return in zip(entries, results.results):
+            self.assertEquals(marshaller.obj_to_dict(entry), marshaller.obj_to_dict(entry_return))
+        self.assertEquals(2, results.results[1].location_offset.z)
+
+        # Mixed datasets, short lists and no threshold are not batched
+        entries[2].dataset = 2
+        self.assertTrue(isinstance(marshaller.obj_to_dict(entries), list))
+        self.assertTrue(isinstance(marshaller.obj_to_dict(entries[:1]), list))
+        self.assertTrue(isinstance(self.marshaller.obj_to_dict(entries[:2]), list))
+
+    def test_records(self):
+        schema = DataEntrySchema("schema")
+        schema.addAttr(Double("temp"))
+        schema.addAttr(FileDataType("image"))
+        Record = record_class(schema)
+        entries = []
+        for cls in (DataEntry, Record):
+            entry = cls(1, datetime.datetime(2013, 1, 10, 3, 21, 52, tzinfo=jcudc24ingesterapi.UTC), 2)
+            entry["temp"] = 1.5
+            entry["image"] = FileObject(f_path="2/image", mime_type="image/jpeg")
+            entry.location_offset = LocationOffset(0, 1, 2)
+            entries.append(entry)
+        self.assertEquals(self.marshaller.obj_to_dict(entries[0]), self.marshaller.obj_to_dict(entries[1]))
+        batch = Marshaller(generated=self.marshaller.generated, batch_threshold=2)
+        self.assertEquals(batch.obj_to_dict(entries[:1] * 2), batch.obj_to_dict(entries[1:] * 2))
+
+        # Decoding a data entry into a record
+        record = self.marshaller.dict_to_obj(self.marshaller.obj_to_dict(entries[0]), Record())
+        self.assertEquals(1.5, record["temp"])
+        self.assertEquals("image/jpeg", record["image"].mime_type)
+        entry_dict = self.marshaller.obj_to_dict(entries[0])
+        entry_dict["data"]["temp"] = "warm"
+        self.assertRaises(TypeError, self.marshaller.dict_to_obj, entry_dict, Record())
+        # Plain data entries are still decoded as data entries
+        self.assertTrue(type(self.marshaller.dict_to_obj(entry_dict)) is DataEntry)
+
+        # Longs and datetimes survive a round trip through a record
+        schema = DataEntrySchema("schema")
+        schema.addAttr(Integer("count"))
+        schema.addAttr(DateTime("when"))
+        Record = record_class(schema)
+        when = datetime.datetime(2013, 1, 10, 3, 21, 52, tzinfo=jcudc24ingesterapi.UTC)
+        record = Record(1, when, 2)
+        record["count"] = 3L
+        record["when"] = when
+        self.assertTrue(type(record["count"]) is int)
+        entry_dict = self.marshaller.obj_to_dict(record)
+        self.assertEquals({"count":3, "when":"2013-01-10T03:21:52.000Z"}, entry_dict["data"])
+        xmlrpclib.dumps((entry_dict,), allow_none=True)
+        decoded = self.marshaller.dict_to_obj(entry_dict, Record())
+        self.assertEquals({"count":3, "when":when}, decoded.data)
+        entry = DataEntry(1, when, 2)
+        entry["count"] = 3L
+        entry["when"] = when
+        self.assertEquals(entry_dict, self.marshaller.obj_to_dict(entry))
+        self.assertEquals(batch.obj_to_dict([record] * 2), batch.obj_to_dict([entry] * 2))
+
+        # Values that do not fit in an int are refused
+        self.assertRaises(OverflowError, record.__setitem__, "count", 2 ** 70)
+        self.assertEquals(3, record["count"])
+        entry["count"] = 2 ** 70
+        self.assertRaises(ValueError, self.marshaller.obj_to_dict, entry)
+        self.assertRaises(ValueError, batch.obj_to_dict, [entry] * 2)
+        codec = get_codec("json")
+        self.assertRaises(ValueError, list, self.marshaller.stream_request(codec, "insert", (entry,)))
+
+    def test_frames(self):
+        dt = datetime.datetime(2013, 1, 10, 3, 21, 52, tzinfo=jcudc24ingesterapi.UTC)
+        entries = []
+        for i in range(3):
+            entry = DataEntry(1, dt + datetime.timedelta(seconds=i), id=i+1)
+            entry["temp"] = float(i)
+            entries.append(entry)
+        entries[1].location_offset = LocationOffset(0, 1, 2)
+        entries[2]["image"] = FileObject(f_path="3/image", mime_type="image/jpeg")
+        frame = DataEntryFrame.from_entries(entries)
+
+        # Without batching a frame is encoded as its rows
+        self.assertEquals(self.marshaller.obj_to_dict(entries), self.marshaller.obj_to_dict(frame))
+        self.assertEquals(self.marshaller.obj_to_dict(entries + [entries[0]]),
+                          self.marshaller.obj_to_dict([frame, entries[0]]))
+        batch = Marshaller(generated=self.marshaller.generated, batch_threshold=100)
+        self.assertEquals(Marshaller(batch_threshold=1).obj_to_dict(entries), batch.obj_to_dict(frame))
+
+        results = batch.obj_to_dict(SearchResults(frame, 0, 3, 3))
+        decoded = self.marshaller.dict_to_obj(results, frames=True).results
+        self.assertTrue(isinstance(decoded, DataEntryFrame))
+        self.assertEquals([1, 2, 3], decoded.ids)
+        self.assertEquals("d", decoded["temp"].typecode)
+        self.assertEquals(self.marshaller.obj_to_dict(entries), self.marshaller.obj_to_dict(decoded))
+        self.assertEquals(3, len(self.marshaller.dict_to_obj(results).results))
+
+        # Each entry of the frame gets its own ID in a unit of work
+        unit = UnitOfWork(None)
+        unit.insert(DataEntry(1, dt))
+        frame.ids = [None] * 3
+        self.assertEquals([-2, -3, -4], unit.insert(frame))
+        self.assertRaises(InvalidObjectError, unit.insert, frame)
+        unit_dict = self.marshaller.obj_to_dict(unit)
+        self.assertEquals([-1, -2, -3, -4], [entry["id"] for entry in unit_dict["to_insert"]])
+
+    def test_partial_updates(self):
+        dataset = Dataset(1, location=1, schema=2, data_source=PullDataSource("http://www.bom.gov.au/radar/IDR733.gif", "file"),
+                          location_offset=LocationOffset(0, 1, 2))
+        dataset.version = 3
+        full = self.marshaller.obj_to_dict(dataset)
+        dataset = self.marshaller.decoding(track=True).dict_to_obj(full)
+        self.assertEquals(set(), jcudc24ingesterapi.changed_properties(dataset))
+        self.assertEquals({"class":"dataset", "id":1, "version":3}, self.marshaller.obj_to_dict(dataset))
+
+        dataset.enabled = True
+        dataset.description = "Radar"
+        self.assertEquals({"class":"dataset", "id":1, "version":3, "enabled":True, "description":"Radar"},
+                          self.marshaller.obj_to_dict(dataset))
+        # Nested objects are sent whole when they change
+        dataset.data_source.pattern = "*.gif"
+        partial = self.marshaller.obj_to_dict(dataset)
+        self.assertEquals(["class", "data_source", "description", "enabled", "id", "version"], sorted(partial))
+        self.assertEquals("*.gif", partial["data_source"]["pattern"])
+        self.assertEquals("http://www.bom.gov.au/radar/IDR733.gif", partial["data_source"]["url"])
+        self.assertEquals(["class", "id", "schema", "version"], sorted(self.marshaller.obj_to_dict(dataset, only=["schema"])))
+
+        unit = UnitOfWork(None)
+        unit.update(dataset)
+        self.assertEquals(partial, self.marshaller.obj_to_dict(unit)["to_update"][0])
+        codec = get_codec("json")
+        self.assertEquals(("precommit", (self.marshaller.obj_to_dict(unit),)),
+                          codec.loads_request("".join(self.marshaller.stream_request(codec, "precommit", (unit,)))))
+
+        # Tracking is not pickled, nor are objects without a version tracked
+        dataset1 = pickle.loads(pickle.dumps(dataset))
+        self.assertEquals(None, jcudc24ingesterapi.changed_properties(dataset1))
+        self.assertEquals(full["location"], self.marshaller.obj_to_dict(dataset1)["location"])
+        self.assertEquals(None, jcudc24ingesterapi.changed_properties(dataset.location_offset))
+
+    def test_identity_map(self):
+        identity_map = IdentityMap()
+        marshaller = self.marshaller.decoding(identity_map=identity_map)
+        location = Location(10, 11)
+        location.id = 1
+        location.version = 1
+        location.name = "Reef"
+        location_dict = self.marshaller.obj_to_dict(location)
+        loaded = marshaller.dict_to_obj(location_dict)
+        self.assertTrue(loaded is marshaller.dict_to_obj(location_dict))
+        self.assertTrue(loaded is marshaller.dict_to_obj([location_dict])[0])
+        self.assertEquals(2, identity_map.reused)
+        self.assertTrue((Location, 1) in identity_map)
+        self.assertFalse((Location, 2) in identity_map)
+
+        # A newer version refreshes the loaded object
+        location_dict["version"] = 2
+        location_dict["name"] = "Reef 2"
+        self.assertTrue(loaded is marshaller.dict_to_obj(location_dict))
+        self.assertEquals("Reef 2", loaded.name)
+
+        # An older version does not roll the loaded object back
+        old_dict = dict(location_dict, version=1, name="Reef")
+        self.assertTrue(loaded is marshaller.dict_to_obj(old_dict))
+        self.assertEquals((2, "Reef 2"), (loaded.version, loaded.name))
+
+        # Data entries are not entities, and objects are only weakly held
+        entry_dict = self.marshaller.obj_to_dict(DataEntry(1, datetime.datetime(2013, 1, 1), 1))
+        self.assertFalse(marshaller.dict_to_obj(entry_dict) is marshaller.dict_to_obj(entry_dict))
+        self.assertEquals(1, len(identity_map))
+        del loaded
+        self.assertEquals(0, len(identity_map))
+
+        # Another thread adds the object between the lookup and the add, its
+        # object is kept, and refreshed if this one is newer
+        class RacingMap(IdentityMap):
+            def get(self, klass, obj_id):
+                if IdentityMap.get(self, klass, obj_id) is None:
+                    self.add((klass, obj_id), first)
+                return None
+        first = Location(10, 11)
+        first.version = 2
+        racing = self.marshaller.decoding(identity_map=RacingMap())
+        self.assertTrue(first is racing.dict_to_obj(location_dict))
+        location_dict["version"] = 3
+        self.assertTrue(first is racing.dict_to_obj(location_dict))
+        self.assertEquals((3, "Reef 2"), (first.version, first.name))
+        # Nor does an older version decoded by the losing thread
+        racing = self.marshaller.decoding(identity_map=RacingMap())
+        self.assertTrue(first is racing.dict_to_obj(dict(location_dict, version=1, name="Reef")))
+        self.assertEquals((3, "Reef 2"), (first.version, first.name))
+
+    def test_interning(self):
+        results = []
+        for i in range(4):
+            entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52, tzinfo=jcudc24ingesterapi.UTC), id=i+1)
+            entry["sensor"] = "T%d" % (i % 2)
+            entry.location_offset = LocationOffset(0, 1, i % 2)
+            results.append(entry)
+        # Build the dicts separately so no strings are shared already
+        results_dicts = [self.marshaller.obj_to_dict(entry) for entry in results]
+        for entry_dict in results_dicts:
+            entry_dict["data"] = dict([("".join(list(k)), "".join(list(v))) for k, v in entry_dict["data"].items()])
+
+        table = InternTable()
+        results_return = self.marshaller.dict_to_obj(results_dicts, intern=table)
+        for entry, entry_return in zip(results, results_return):
+            self.assertEquals(self.marshaller.obj_to_dict(entry), self.marshaller.obj_to_dict(entry_return))
+        self.assertTrue(results_return[0]["sensor"] is results_return[2]["sensor"])
+        self.assertTrue(results_return[0].location_offset is results_return[2].location_offset)
+        self.assertFalse(results_return[0].location_offset is results_return[1].location_offset)
+        self.assertEquals(2, table.shared_objects)
+        self.assertTrue(table.shared_strings >= 2)
+
+        # Shared offsets cannot be changed, but copies of them can
+        offset = results_return[2].location_offset
+        self.assertRaises(AttributeError, setattr, offset, "x", 5)
+        self.assertRaises(AttributeError, setattr, results_return[1].location_offset, "x", 5)
+        self.assertEquals([0, 0, 0, 0], [entry.location_offset.x for entry in results_return])
+        results_return[2].location_offset = copy.copy(offset)
+        results_return[2].location_offset.x = 5
+        self.assertEquals([0, 0, 5, 0], [entry.location_offset.x for entry in results_return])
+        # Changes can be tracked on the objects holding a shared offset
+        track_changes(results_return[0])
+        self.assertEquals(set(), changed_properties(results_return[0]))
+
+        # Without interning nothing is shared
+        results_return = self.marshaller.dict_to_obj(results_dicts)
+        self.assertFalse(results_return[0]["sensor"] is results_return[2]["sensor"])
+        self.assertFalse(results_return[0].location_offset is results_return[2].location_offset)
+        self.assertEquals(None, self.marshaller._interner)
+
     def test_marshaller_data_entry_schema(self):
         schema = {'attributes': [{'units': None, 'description': None, 'name': 'file', 'class': 'file'}], 'id': None, 'class': 'data_entry_schema'}
         schema = self.marshaller.dict_to_obj(schema)
 
+class TestClassRegistry(unittest.TestCase):
+    def test_lazy_scanning(self):
+        registry = ClassRegistry()
+        self.assertEquals(len(MARSHALLED_MODULES), len(registry._pending))
+        self.assertEquals(Location, registry.class_for("location"))
+        self.assertEquals(len(MARSHALLED_MODULES) - 1, len(registry._pending))
+
+        # Encoding only scans the object's own module
+        self.assertTrue(registry.is_registered(DataEntrySchema))
+        self.assertFalse("jcudc24ingesterapi.schemas.data_entry_schemas" in registry._pending)
+        self.assertTrue("jcudc24ingesterapi.models.dataset" in registry._pending)
+
+        self.assertRaises(KeyError, registry.class_for, "not_a_class")
+        self.assertEquals([], registry._pending)
+        self.assertFalse(registry.is_registered(ClassRegistry))
+
+    def test_shared_registry(self):
+        self.assertTrue(Marshaller()._registry is Marshaller()._registry)
+        marshaller = Marshaller(registry=ClassRegistry())
+        self.assertEquals(1, marshaller.dict_to_obj({"class":"location", "id":1}).id)
+
+class TestCodecs(unittest.TestCase):
+    """Round trip calls through each of the wire codecs"""
+    def setUp(self):
+        self.marshaller = Marshaller()
+        self.server = StandInServer({"echo": lambda x: x, "fail": self.fail_call}).start()
+
+    def fail_call(self):
+        raise xmlrpclib.Fault(InvalidObjectError.__xmlrpc_error__, '[{"field":"name", "message":"Name must be set"}]')
+
+    def tearDown(self):
+        self.server.stop()
+
+    def unit_dict(self):
+        unit = UnitOfWork(None)
+        data_entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52))
+        data_entry["temp"] = -1.5
+        data_entry["count"] = 100000
+        data_entry["name"] = u"\u00b0C"
+        unit.insert(data_entry)
+        return self.marshaller.obj_to_dict(unit)
+
+    def test_codecs(self):
+        unit_dict = self.unit_dict()
+        for name in CODECS:
+            codec = get_codec(name)
+            self.assertEquals(("commit", (unit_dict,)), codec.loads_request(codec.dumps_request("commit", (unit_dict,))))
+            self.assertEquals([unit_dict], codec.loads_response(codec.dumps_response([unit_dict])))
+            self.assertRaises(xmlrpclib.Fault, codec.loads_response, codec.dumps_fault(xmlrpclib.Fault(4, "error")))
+
+    def test_msgpack(self):
+        for value in (0, 127, 128, -32, -33, 2**16, -2**31, 2**40, 1.5, "", "a"*40, "a"*70000, [1]*20, dict.fromkeys(range(20)), None, True, False):
+            self.assertEquals(value, unpackb(packb(value)))
+
+    def test_client_codecs(self):
+        unit_dict = self.unit_dict()
+        for name in CODECS:
+            client = IngesterPlatformAPI(self.server.url, codec=name)
+            unit = self.marshaller.dict_to_obj(client.server.echo(unit_dict))
+            self.assertEquals(-1.5, unit._to_insert[0]["temp"])
+            self.assertEquals(u"\u00b0C", unit._to_insert[0]["name"])
+            try:
+                client.server.fail()
+                self.fail("Expected a fault")
+            except Exception, e:
+                self.assertTrue(isinstance(translate_exception(e), InvalidObjectError))
+
+    def test_stream_request(self):
+        unit = self.marshaller.dict_to_obj(self.unit_dict())
+        schema = DataEntrySchema("schema")
+        schema.addAttr(Double("one"))
+        unit.insert(schema)
+        unit.insert(Dataset(location=1, schema=2, location_offset=LocationOffset(0, 1, 2)))
+        for i in range(100):
+            data_entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52))
+            data_entry["temp"] = float(i)
+            unit.insert(data_entry)
+        expected = ("precommit", (self.marshaller.obj_to_dict(unit), 1))
+        for name in CODECS:
+            codec = get_codec(name)
+            chunks = list(self.marshaller.stream_request(codec, "precommit", (unit, 1), chunk_size=100))
+            self.assertTrue(len(chunks) > 1)
+            self.assertEquals(expected, codec.loads_request("".join(chunks)))
+
+        # Batches are written column by column, rather than encoded first
+        entries = unit._to_insert[-10:]
+        entries[-1].location_offset = LocationOffset(0, 1, 2)
+        entries[-1]["name"] = "last"
+        entries[-2].timestamp = datetime.datetime(2013, 1, 10, 3, 21, 53, tzinfo=jcudc24ingesterapi.UTC)
+        entries[-3].dataset = 1
+        frame = DataEntryFrame.from_entries(entries)
+        marshaller = Marshaller(batch_threshold=10)
+        expected = ("insert", (marshaller.obj_to_dict(entries), marshaller.obj_to_dict(frame), 1))
+        self.assertEquals((DATA_ENTRY_BATCH, DATA_ENTRY_BATCH), (expected[1][0]["class"], expected[1][1]["class"]))
+        self.assertTrue("location_offset" in expected[1][0] and "location_offset" in expected[1][1])
+        marshaller._encode_batch = marshaller._encode_frame = None
+        for name in CODECS:
+            codec = get_codec(name)
+            self.assertEquals(expected, codec.loads_request("".join(marshaller.stream_request(codec, "insert", (entries, frame, 1)))))
+
+    def test_client_stream_commits(self):
+        precommits = []
+        self.server.methods["precommit"] = lambda unit: precommits.append(unit) or 1
+        self.server.methods["commit"] = lambda transaction_id: []
+        unit = self.marshaller.dict_to_obj(self.unit_dict())
+        for name in CODECS:
+            client = IngesterPlatformAPI(self.server.url, codec=name, stream_commits=True)
+            client.commit(unit)
+            self.assertEquals(self.unit_dict(), precommits.pop())
+        self.assertEquals(len(CODECS), self.server.chunked_requests)
+
+    def test_client_frames(self):
+        dt = datetime.datetime(2013, 1, 10, 3, 21, 52)
+        frame = DataEntryFrame(1, [dt, dt], {"temp": [1.5, 2.5], "image": [None, FileObject(f_path=__file__)]})
+        unit = UnitOfWork(None)
+        unit.insert(frame)
+        for marshaller in (self.marshaller, Marshaller(batch_threshold=100)):
+            expected = ("precommit", (marshaller.obj_to_dict(unit),))
+            for name in CODECS:
+                codec = get_codec(name)
+                self.assertEquals(expected, codec.loads_request("".join(marshaller.stream_request(codec, "precommit", (unit,)))))
+
+        self.server.methods["precommit"] = lambda unit: 1
+        self.server.methods["commit"] = lambda transaction_id: [{"class":"data_entry", "correlationid":-1, "id":10},
+                                                                {"class":"data_entry", "correlationid":-2, "id":11}]
+        client = IngesterPlatformAPI(self.server.url)
+        client.commit(unit)
+        self.assertEquals([10, 11], frame.ids)
+        self.assertEquals([("/api/1/data_entry:-2/image", open(__file__, "rb").read())], self.server.uploads)
+
+        entries = frame.to_entries()
+        results_dict = self.marshaller.obj_to_dict(SearchResults(entries, 0, 2, 2))
+        batch_dict = Marshaller(batch_threshold=1).obj_to_dict(SearchResults(entries, 0, 2, 2))
+        self.server.methods["search"] = lambda criteria, offset, limit: batch_dict if criteria["dataset"] == 2 else results_dict
+        for name in CODECS:
+            client = IngesterPlatformAPI(self.server.url, codec=name)
+            for dataset in (1, 2):
+                results = client.search(DataEntrySearchCriteria(dataset), 0, 2, frames=True).results
+                self.assertTrue(isinstance(results, DataEntryFrame))
+                self.assertEquals([10, 11], results.ids)
+                self.assertEquals([1.5, 2.5], list(results["temp"]))
+
+    def test_client_partial_updates(self):
+        dataset = Dataset(1, location=1, schema=2, location_offset=LocationOffset(0, 1, 2))
+        dataset.version = 1
+        updates = []
+        self.server.methods["getDataset"] = lambda ds_id: self.marshaller.obj_to_dict(dataset)
+        self.server.methods["update"] = lambda obj: updates.append(obj) or self.marshaller.obj_to_dict(dataset)
+        self.server.methods["precommit"] = lambda unit: updates.append(unit["to_update"][0]) or 1
+        self.server.methods["commit"] = lambda transaction_id: [dict(self.marshaller.obj_to_dict(dataset), correlationid=1, version=2)]
+        client = IngesterPlatformAPI(self.server.url, track_changes=True)
+        loaded = client.getDataset(1)
+        loaded.enabled = True
+        client.update(loaded)
+        self.assertEquals({"class":"dataset", "id":1, "version":1, "enabled":True}, updates.pop())
+        self.assertEquals(set(), jcudc24ingesterapi.changed_properties(loaded))
+
+        loaded.location_offset.z = 5
+        unit = client.createUnitOfWork()
+        unit.update(loaded)
+        unit.commit()
+        self.assertEquals(["class", "id", "location_offset", "version"], sorted(updates.pop()))
+        self.assertEquals(2, loaded.version)
+        self.assertEquals(set(), jcudc24ingesterapi.changed_properties(loaded))
+
+        # Without tracking the whole object is sent
+        IngesterPlatformAPI(self.server.url).update(IngesterPlatformAPI(self.server.url).getDataset(1))
+        self.assertEquals(self.marshaller.obj_to_dict(dataset), updates.pop())
+
+    def test_client_identity_map(self):
+        dataset = Dataset(1, location=1, schema=2)
+        dataset.version = 1
+        self.server.methods["getDataset"] = lambda ds_id: self.marshaller.obj_to_dict(dataset)
+        client = IngesterPlatformAPI(self.server.url, identity_map=True)
+        loaded = client.getDataset(1)
+        self.assertTrue(loaded is client.getDataset(1))
+        self.assertTrue((Dataset, 1) in client.identity_map)
+        dataset.version = 2
+        dataset.description = "Updated"
+        self.assertTrue(loaded is client.getDataset(1))
+        self.assertEquals("Updated", loaded.description)
+        self.assertFalse(loaded is IngesterPlatformAPI(self.server.url).getDataset(1))
+
+    def test_incremental_responses(self):
+        entries = []
+        for i in range(20):
+            data_entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52), i + 1)
+            data_entry["temp"] = float(i)
+            data_entry["image"] = FileObject(f_path="%d/image" % (i + 1), mime_type="image/jpeg")
+            entries.append(data_entry)
+        logs = []
+        for i in range(5):
+            log = IngesterLog()
+            log.dataset_id = 1
+            log.timestamp = datetime.datetime(2013, 1, 10, 3, 21, 52)
+            log.message = "Log %d" % i
+            logs.append(log)
+        results = SearchResults(entries, 0, 20, 20)
+        results_dict = self.marshaller.obj_to_dict(results)
+        batch_dict = Marshaller(batch_threshold=1).obj_to_dict(results)
+        self.server.methods["search"] = lambda criteria, offset, limit: batch_dict if criteria["dataset"] == 2 else results_dict
+        self.server.methods["getIngesterLogs"] = lambda dataset_id: self.fail_call() if dataset_id == "fail" else self.marshaller.obj_to_dict(logs)
+
+        expected = [self.marshaller.obj_to_dict(entry) for entry in entries]
+        for name in CODECS:
+            client = IngesterPlatformAPI(self.server.url, codec=name)
+            for dataset in (1, 2):
+                search_results = client.search(DataEntrySearchCriteria(dataset), 0, 20)
+                self.assertEquals(20, search_results.count)
+                self.assertEquals(expected, [self.marshaller.obj_to_dict(e) for e in search_results.results])
+                self.assertEquals(expected, [self.marshaller.obj_to_dict(e) for e in client.iter_search(DataEntrySearchCriteria(dataset), 0, 20)])
+            self.assertEquals([log.message for log in logs], [log.message for log in client.getIngesterLogs(1)])
+            self.assertEquals([log.message for log in logs], [log.message for log in client.iterIngesterLogs(1)])
+            self.assertRaises(InvalidObjectError, list, client.iterIngesterLogs("fail"))
+
+        # Items are handed out before the whole response has been read
+        unmarshaller = ObjectUnmarshaller(self.marshaller, "results")
+        parser = xmlrpclib.ExpatParser(unmarshaller)
+        data = get_codec("xmlrpc").dumps_response(results_dict)
+        parser.feed(data[:len(data) // 2])
+        self.assertTrue(0 < len(unmarshaller.ready) < 20)
+        self.assertTrue(isinstance(unmarshaller.ready[0], DataEntry))
+
+    def test_connection_pool(self):
+        self.server.methods["precommit"] = lambda unit: 1
+        self.server.methods["commit"] = lambda transaction_id: []
+        self.server.methods["getIngesterLogs"] = lambda dataset_id: []
+        self.server.files["/api/data_entry/1/2/file"] = "data"
+        unit = UnitOfWork(None)
+        data_entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52))
+        data_entry["file"] = FileObject(f_path=__file__)
+        unit.insert(data_entry)
+        pool = ConnectionPool()
+        for name in CODECS:
+            client = IngesterPlatformAPI(self.server.url, codec=name, pool=pool)
+            for i in range(10):
+                self.assertEquals(i, client.server.echo(i))
+            self.assertEquals([], client.getIngesterLogs(1))
+            client.commit(unit)
+            f_in = client.getDataEntryStream(1, 2, "file")
+            self.assertEquals("data", f_in.read())
+            f_in.close()
+            self.assertEquals(None, client.getDataEntryStream(1, 2, "missing"))
+            self.assertRaises(xmlrpclib.Fault, client.server.fail)
+        # Every call, stream and upload reused the one connection
+        self.assertEquals(1, pool.opened)
+        self.assertEquals(len(CODECS), len(self.server.uploads))
+
+        # A connection the server has closed is not reused
+        connection = pool._idle.values()[0][0][0]
+        connection.sock.shutdown(socket.SHUT_WR)
+        select.select([connection.sock], [], [], 5)
+        self.assertEquals(0, client.server.echo(0))
+        self.assertEquals(2, pool.opened)
+
+        # Threads share the pool
+        results = []
+        def calls(n):
+            results.extend([client.server.echo(n) for i in range(20)])
+        threads = [threading.Thread(target=calls, args=(n,)) for n in range(4)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEquals(sorted(range(4) * 20), sorted(results))
+        self.assertTrue(pool.opened <= 6)
+
+        pool.idle_timeout = -1
+        pool.evict_idle()
+        self.assertEquals(0, len(pool))
+
+    def test_compression(self):
+        self.server.compress_threshold = 100
+        self.server.methods["precommit"] = lambda unit: 1
+        self.server.methods["commit"] = lambda transaction_id: []
+        logs = []
+        for i in range(50):
+            log = IngesterLog()
+            log.dataset_id = 1
+            log.timestamp = datetime.datetime(2013, 1, 10, 3, 21, 52)
+            log.message = "Log %d" % i
+            logs.append(log)
+        self.server.methods["getIngesterLogs"] = lambda dataset_id: self.marshaller.obj_to_dict(logs)
+        self.server.files["/api/data_entry/1/2/file"] = open(__file__, "rb").read()
+        unit = UnitOfWork(None)
+        for mime_type in ("text/x-python", "image/jpeg"):
+            data_entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52))
+            data_entry["file"] = FileObject(f_path=__file__, mime_type=mime_type)
+            unit.insert(data_entry)
+        for name in CODECS:
+            for stream_commits in (False, True):
+                self.server.compressed_requests = 0
+                client = IngesterPlatformAPI(self.server.url, codec=name, stream_commits=stream_commits,
+                                             compress_threshold=300, compress_level=1)
+                self.assertEquals(1, client.server.echo(1))
+                self.assertEquals(0, self.server.compressed_requests)
+                self.assertEquals(range(1000), client.server.echo(range(1000)))
+                self.assertEquals(1, self.server.compressed_requests)
+                self.assertEquals([log.message for log in logs], [log.message for log in client.getIngesterLogs(1)])
+                client.commit(unit)
+                # The unit of work and the python file, but not the jpeg
+                self.assertEquals(3, self.server.compressed_requests)
+                self.assertEquals([open(__file__, "rb").read()] * 2, [body for path, body in self.server.uploads])
+                del self.server.uploads[:]
+                f_in = client.getDataEntryStream(1, 2, "file")
+                self.assertEquals("gzip", f_in.getheader("Content-Encoding"))
+                self.assertEquals(open(__file__, "rb").read(), "".join(iter(lambda: f_in.read(1000), "")))
+                f_in.close()
+
+    def test_client_batch(self):
+        location = Location(-19.0, 146.0, "Station", 10.0)
+        location.id = 2
+        location.version = 1
+        def get_location(loc_id):
+            if loc_id != 2:
+                raise xmlrpclib.Fault(UnknownObjectError.__xmlrpc_error__, "Location %s not found" % loc_id)
+            return self.marshaller.obj_to_dict(location)
+        self.server.methods["getLocation"] = get_location
+        self.server.methods["enableDataset"] = lambda dataset_id: True
+        for name in CODECS:
+            client = IngesterPlatformAPI(self.server.url, codec=name)
+            batch = client.createBatch()
+            self.assertEquals([], batch.send())
+            found, enabled = batch.getLocation(2), batch.enableDataset(1)
+            results = batch.send()
+            self.assertEquals(0, len(batch))
+            self.assertTrue(isinstance(results[0], Location))
+            self.assertEquals("Station", found.result().name)
+            self.assertEquals([results[0], True], [found.result(), enabled.result()])
+
+            missing, found, unknown = batch.getLocation(3), batch.getLocation(2), batch._queue("getRegion", (1,))
+            self.assertRaises(ValueError, found.result)
+            self.assertRaises(UnknownObjectError, batch.send)
+            self.assertRaises(UnknownObjectError, missing.result)
+            self.assertEquals(2, found.result().id)
+            self.assertRaises(ValueError, unknown.result)
+
+    def test_async_client(self):
+        calls = {"running": 0, "most": 0}
+        lock = threading.Lock()
+        def slow_echo(x):
+            with lock:
+                calls["running"] += 1
+                calls["most"] = max(calls["most"], calls["running"])
+            time.sleep(0.01)
+            with lock:
+                calls["running"] -= 1
+            return x
+        self.server.methods["echo"] = slow_echo
+        self.server.methods["getDataset"] = lambda ds_id: slow_echo(self.marshaller.obj_to_dict(
+            Dataset(ds_id, location=1, schema=2, location_offset=LocationOffset(0, 1, 2))))
+        self.server.methods["getLocation"] = lambda loc_id: self.fail_call()
+        self.server.methods["precommit"] = lambda unit: 1
+        self.server.methods["commit"] = lambda transaction_id: [{"class":"data_entry", "correlationid":-1, "id":10}]
+        self.server.files["/api/data_entry/1/2/file"] = "data" * 10000
+        for name in CODECS:
+            calls["most"] = 0
+            client = AsyncIngesterPlatformAPI(self.server.url, codec=name, concurrency=3)
+            futures = [client.getDataset(i) for i in range(12)]
+            self.assertEquals(range(12), [dataset.id for dataset in gather(futures)])
+            self.assertTrue(calls["most"] <= 3)
+            self.assertTrue(isinstance(client.getLocation(1).exception(), InvalidObjectError))
+            self.assertRaises(InvalidObjectError, client.getLocation(1).result)
+            done = []
+            client.getDataset(1).add_done_callback(done.append)
+
+            unit = client.createUnitOfWork()
+            data_entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52))
+            data_entry["file"] = FileObject(f_path=__file__)
+            unit.insert(data_entry)
+            self.assertEquals(None, unit.commit().result())
+            self.assertEquals(10, data_entry.id)
+            f_out = StringIO()
+            self.assertEquals(40000, client.downloadDataEntryStream(1, 2, "file", f_out).result())
+            self.assertEquals("data" * 10000, f_out.getvalue())
+            self.assertEquals(None, client.downloadDataEntryStream(1, 2, "missing", f_out).result())
+            client.close()
+            self.assertEquals(1, len(done))
+            self.assertTrue(done[0].done())
+            self.assertRaises(ValueError, client.ping)
+        self.assertEquals(len(CODECS), len(self.server.uploads))
+
+    def test_post_many(self):
+        ids = itertools.count(1)
+        def insert(obj):
+            if obj["name"] == "bad":
+                self.fail_call()
+            time.sleep(0.001)
+            obj["id"] = ids.next()
+            obj["version"] = 1
+            return obj
+        self.server.methods["insert"] = insert
+        self.server.methods["getLocation"] = lambda loc_id: dict(self.marshaller.obj_to_dict(locations[0]), id=loc_id, version=1)
+        locations = [Location(-19.0, 146.0, "bad" if i % 10 == 3 else "Station %d" % i, 10.0) for i in range(50)]
+        for name in CODECS:
+            client = IngesterPlatformAPI(self.server.url, codec=name, identity_map=True)
+            results = client.post_many(locations, workers=8)
+            self.assertEquals(50, len(results))
+            for location, result in zip(locations, results):
+                if location.name == "bad":
+                    self.assertTrue(isinstance(result, InvalidObjectError))
+                else:
+                    self.assertEquals(location.name, result.name)
+            self.assertEquals(45, len(set([result.id for result in results if isinstance(result, Location)])))
+            self.assertEquals([], client.post_many([]))
+
+            # Threads fetching the same object get the same instance
+            fetched = []
+            def fetch():
+                fetched.extend([client.getLocation(1) for i in range(10)])
+            threads = [threading.Thread(target=fetch) for i in range(4)]
+            for thread in threads: thread.start()
+            for thread in threads: thread.join()
+            self.assertEquals(1, len(set(map(id, fetched))))
+
+    def test_parallel_uploads(self):
+        commits = []
+        self.server.methods["precommit"] = lambda unit: 1
+        self.server.methods["commit"] = lambda transaction_id: commits.append(transaction_id) or []
+        unit = UnitOfWork(None)
+        for i in range(10):
+            data_entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52))
+            data_entry["file"] = FileObject(f_handle=StringIO("file %d" % i))
+            unit.insert(data_entry)
+        client = IngesterPlatformAPI(self.server.url, upload_workers=4)
+        client.commit(unit)
+        self.assertEquals([1], commits)
+        self.assertEquals(dict([("/api/1/data_entry:%d/file" % -(i + 1), "file %d" % i) for i in range(10)]),
+                          dict(self.server.uploads))
+
+        # The commit is not made if an upload fails, or times out
+        for data_entry in unit._to_insert:
+            data_entry["file"].f_handle = StringIO("file")
+        self.server.rejected_uploads.add("/api/1/data_entry:-3/file")
+        self.assertRaises(Exception, client.commit, unit)
+        self.assertEquals([1], commits)
+        self.server.rejected_uploads.clear()
+        for data_entry in unit._to_insert:
+            data_entry["file"].f_handle = StringIO("file")
+        self.server.latency = 0.3
+        client = IngesterPlatformAPI(self.server.url, upload_workers=4, upload_timeout=0.1)
+        self.assertRaises(socket.timeout, client.commit, unit)
+        self.assertEquals([1], commits)
+
+    def test_streamed_uploads(self):
+        self.server.methods["precommit"] = lambda unit: 1
+        self.server.methods["commit"] = lambda transaction_id: []
+        data = "".join([chr(i % 251) for i in xrange(300000)])
+        fd, path = tempfile.mkstemp()
+        os.write(fd, data)
+        os.close(fd)
+        # Map several windows, starting part way into the file
+        window = transport.MMAP_WINDOW
+        transport.MMAP_WINDOW = 16 * mmap.ALLOCATIONGRANULARITY
+        try:
+            with open(path, "rb") as f:
+                f.seek(5000)
+                body = FileBody(f, 10000)
+                self.assertEquals(295000, body.length)
+                self.assertTrue(body.repeatable)
+                # The buffers are only valid until the next chunk is produced
+                chunks = [(type(chunk), str(chunk)) for chunk in body]
+                self.assertEquals(data[5000:], "".join([chunk for kind, chunk in chunks]))
+                self.assertEquals(set([buffer]), set([kind for kind, chunk in chunks]))
+                self.assertTrue(max([len(chunk) for kind, chunk in chunks]) <= 10000)
+
+            for compress_threshold in (None, 100):
+                # A regular file, a StringIO and a pipe, of unknown length
+                read_fd, write_fd = os.pipe()
+                os.write(write_fd, "unknown")
+                os.close(write_fd)
+                unit = UnitOfWork(None)
+                for mime_type, f_handle, f_path in (("image/jpeg", None, path),
+                                                    ("text/plain", StringIO("x" * 150), None),
+                                                    ("text/plain", os.fdopen(read_fd, "rb"), None)):
+                    data_entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52))
+                    data_entry["file"] = FileObject(f_handle=f_handle, f_path=f_path, mime_type=mime_type)
+                    unit.insert(data_entry)
+                progress = []
+                client = IngesterPlatformAPI(self.server.url, compress_threshold=compress_threshold,
+                                             upload_chunk_size=10000,
+                                             upload_progress=lambda *args: progress.append(args))
+                del self.server.uploads[:]
+                self.server.chunked_requests = 0
+                client.commit(unit)
+                client.close()
+                self.assertEquals({"/api/1/data_entry:-1/file": data,
+                                   "/api/1/data_entry:-2/file": "x" * 150,
+                                   "/api/1/data_entry:-3/file": "unknown"}, dict(self.server.uploads))
+                sent = [args[2] for args in progress if args[:2] == ("data_entry:-1", "file")]
+                self.assertEquals(sorted(sent), sent)
+                self.assertEquals(300000, sent[-1])
+                self.assertTrue(("data_entry:-1", "file", 300000, 300000) in progress)
+                self.assertTrue(("data_entry:-2", "file", 150, 150) in progress)
+                self.assertTrue(("data_entry:-3", "file", 7, None) in progress)
+                # Only the pipe is sent chunked, unless the text file is compressed
+                self.assertEquals(1 if compress_threshold is None else 2, self.server.chunked_requests)
+        finally:
+            transport.MMAP_WINDOW = window
+            os.remove(path)
+
+        # The server can count the bytes of files rather than keep them
+        self.server.keep_uploads = False
+        del self.server.uploads[:]
+        r = transport.ServerProxy(self.server.url)("open")("POST", "/api/upload", StringIO(data),
+                                                           {"Content-Type": "application/octet-stream"})
+        r.read()
+        r.close()
+        self.assertEquals([("/api/upload", 300000)], self.server.uploads)
+
+class TestGeneratedMarshaller(TestMarshaller):
+    """Run the marshaller tests against the generated encoders and decoders"""
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.marshaller = Marshaller(generated=True)
+
+    def test_same_output(self):
+        dataset = Dataset(location=1, schema=2, data_source=PullDataSource("http://www.bom.gov.au/radar/IDR733.gif", "file", sampling=PeriodicSampling(1000)), location_offset=LocationOffset(0, 1, 2))
+        data_entry = DataEntry(1, datetime.datetime(2013, 1, 10, 3, 21, 52, 123000))
+        data_entry["temp"] = 1.2
+        schema = DataEntrySchema("schema")
+        schema.addAttr(Double("one"))
+        schema.extends = [1]
+
+        plan = Marshaller()
+        for obj in (dataset, data_entry, schema):
+            obj_dict = plan.obj_to_dict(obj)
+            self.assertEquals(obj_dict, self.marshaller.obj_to_dict(obj))
+            self.assertEquals(obj_dict, self.marshaller.obj_to_dict(self.marshaller.dict_to_obj(obj_dict)))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,617 @@
+"""HTTP transport and server proxy used by the IngesterPlatformAPI.
+
+These work like xmlrpclib's Transport and ServerProxy, but encode the calls
+with any of the wire codecs in jcudc24ingesterapi.codec. Connections are kept
+open in a ConnectionPool and reused for the calls, streams and uploads of a
+client. Request bodies can be gzipped, and gzipped responses are decoded as
+they are read. Files are uploaded as a FileBody, streamed in chunks from
+memory maps of the file where possible.
+"""
+__author__ = 'Casey Bajema'
+import errno
+import httplib
+import mmap
+import os
+import select
+import socket
+import stat
+import threading
+import time
+import urllib
+import xmlrpclib
+import zlib
+
+from jcudc24ingesterapi.codec import get_codec
+
+BLOCK_SIZE = 65536
+# The most of a file mapped into memory at once while it is uploaded
+MMAP_WINDOW = 4 * 1024 * 1024
+# zlib window bits for the gzip format
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+def gzip_encode(data, level=6):
+    """Compress a string in the gzip format"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+def _gzip_chunks(chunks, level):
+    """Compress an iterable of strings as they are produced"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _remaining(f):
+    """The number of bytes left to read from a file, or None if that is not
+    known"""
+    try:
+        return os.fstat(f.fileno()).st_size - f.tell()
+    except (AttributeError, EnvironmentError, ValueError):
+        pass
+    if hasattr(f, "getvalue"):
+        return len(f.getvalue()) - f.tell()
+    return None
+
+class GzipDecoder(object):
+    """Decompresses a gzipped response body as it is read"""
+    def __init__(self, response):
+        self._response = response
+        self._decompressor = zlib.decompressobj(_GZIP_WBITS)
+        self._buffer = ""
+        self._done = False
+
+    def _fill(self):
+        data = self._response.read(BLOCK_SIZE)
+        if data:
+            return self._decompressor.decompress(data)
+        self._done = True
+        return self._decompressor.flush()
+
+    def read(self, size=-1):
+        if size < 0:
+            chunks = [self._buffer]
+            while not self._done:
+                chunks.append(self._fill())
+            self._buffer = ""
+            return "".join(chunks)
+        while not self._done and len(self._buffer) < size:
+            self._buffer += self._fill()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        self._buffer = ""
+
+class ChunkedBody(object):
+    """A request body that is sent using chunked transfer encoding. Iterating
+    over it calls chunks() to produce the chunks, so the request can be sent
+    again if the connection had to be reopened.
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        return iter(self.chunks())
+
+class FileBody(ChunkedBody):
+    """A request body streamed from a file in chunks, from its current
+    position to its end. It is sent with a Content-Length when the size of
+    the file is known, and with chunked transfer encoding otherwise.
+
+    Regular files are mapped into memory a window at a time and sent from the
+    mapping, so neither the whole file nor a copy of each chunk is held in
+    memory. Their chunks are buffers, only valid until the next chunk is
+    produced. Other files are read a chunk at a time.
+
+    :param chunk_size: the number of bytes sent at a time
+    :param progress: called with the number of bytes sent so far and the
+        length of the body, or None if that is not known, after each chunk
+    """
+    def __init__(self, f, chunk_size=BLOCK_SIZE, progress=None):
+        ChunkedBody.__init__(self, self._chunks)
+        self.file = f
+        self.chunk_size = chunk_size
+        self.progress = progress
+        try:
+            self.start = f.tell()
+        except (AttributeError, EnvironmentError):
+            self.start = None
+        self.length = _remaining(f) if self.start != None else None
+        # The body can be sent again if the file can be seeked back to the start
+        self.repeatable = self.start != None and hasattr(f, "seek")
+
+    def _chunks(self):
+        if self.start != None:
+            self.file.seek(self.start)
+        if self.length != None and self._mappable():
+            chunks = self._mapped_chunks()
+        else:
+            chunks = self._read_chunks()
+        sent = 0
+        for chunk in chunks:
+            yield chunk
+            sent += len(chunk)
+            if self.progress != None:
+                self.progress(sent, self.length)
+
+    def _mappable(self):
+        try:
+            return stat.S_ISREG(os.fstat(self.file.fileno()).st_mode)
+        except (AttributeError, EnvironmentError, ValueError):
+            return False
+
+    def _read_chunks(self):
+        while True:
+            data = self.file.read(self.chunk_size)
+            if not data:
+                break
+            yield data
+
+    def _mapped_chunks(self):
+        """Yield buffers over windows of the file mapped into memory, each
+        window being unmapped once it has been sent"""
+        fileno = self.file.fileno()
+        position, end = self.start, self.start + self.length
+        while position < end:
+            # Mappings start at a multiple of the allocation granularity
+            offset = position - position % mmap.ALLOCATIONGRANULARITY
+            size = min(MMAP_WINDOW, end - offset)
+            try:
+                mapped = mmap.mmap(fileno, size, access=mmap.ACCESS_READ, offset=offset)
+            except (EnvironmentError, ValueError):
+                # Such as a file that shrank, read what is left of it instead
+                self.file.seek(position)
+                for chunk in self._read_chunks():
+                    yield chunk
+                return
+            try:
+                for i in xrange(position - offset, size, self.chunk_size):
+                    yield buffer(mapped, i, min(self.chunk_size, size - i))
+            finally:
+                mapped.close()
+            position = offset + size
+
+def _usable(connection):
+    """Check that an idle connection can still be used. The socket of a
+    connection closed by the server reads as ready, as does one the server has
+    sent something unexpected on."""
+    if connection.sock is None:
+        return False
+    try:
+        return not select.select([connection.sock], [], [], 0)[0]
+    except (select.error, socket.error, ValueError):
+        return False
+
+class ConnectionPool(object):
+    """A thread safe pool of persistent HTTP/1.1 connections, kept for each
+    (scheme, host). A connection is taken from the pool for a request and put
+    back once its response has been read, so one pool may be shared between
+    transports and threads.
+
+    :param size: the most idle connections kept for each host, more are closed
+        when they are put back
+    :param idle_timeout: the seconds a connection may be idle before it is
+        closed rather than reused
+    """
+    def __init__(self, size=8, idle_timeout=60.0):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.opened = 0
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, connect):
+        """Take the most recently used idle connection for the key that is
+        still usable, or open a new one by calling connect()"""
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                connection, released = idle.pop()
+            if time.time() - released <= self.idle_timeout and _usable(connection):
+                return connection
+            connection.close()
+        connection = connect()
+        with self._lock:
+            self.opened += 1
+        return connection
+
+    def release(self, key, connection):
+        """Put a connection back in the pool, once the whole response has been
+        read from it"""
+        if connection.sock is None:
+            # The server asked for the connection to be closed
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            idle.append((connection, time.time()))
+            closing = self._expired(idle)
+            while len(idle) > self.size:
+                closing.append(idle.pop(0)[0])
+        for connection in closing:
+            connection.close()
+
+    def _expired(self, idle):
+        """Remove the connections that have been idle too long from the front
+        of a list of idle connections, returning them"""
+        now = time.time()
+        expired = []
+        while idle and now - idle[0][1] > self.idle_timeout:
+            expired.append(idle.pop(0)[0])
+        return expired
+
+    def evict_idle(self):
+        """Close the connections that have been idle for longer than the idle
+        timeout"""
+        with self._lock:
+            closing = []
+            for idle in self._idle.values():
+                closing.extend(self._expired(idle))
+        for connection in closing:
+            connection.close()
+
+    def close(self):
+        """Close all the idle connections"""
+        with self._lock:
+            closing = [connection for idle in self._idle.values() for connection, released in idle]
+            self._idle.clear()
+        for connection in closing:
+            connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return sum([len(idle) for idle in self._idle.values()])
+
+class _HTTPConnection(httplib.HTTPConnection):
+    """An HTTPConnection that sends each write at once. Requests with a file
+    or chunked body are written in pieces, which on a keep-alive connection
+    would otherwise wait for the server to acknowledge the previous piece."""
+    def connect(self):
+        httplib.HTTPConnection.connect(self)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+class _HTTPSConnection(httplib.HTTPSConnection):
+    """The HTTPS version of _HTTPConnection"""
+    def connect(self):
+        httplib.HTTPSConnection.connect(self)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+def _is_stale(e):
+    """Check for the errors of a request sent on a connection the server had
+    already closed"""
+    if isinstance(e, httplib.BadStatusLine):
+        return True
+    return isinstance(e, socket.error) and e.errno in (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE)
+
+class CodecTransport(xmlrpclib.Transport):
+    """An xmlrpclib Transport that uses a codec for the request and response
+    bodies, and takes its connections from a ConnectionPool.
+
+    :param pool: a ConnectionPool to share, by default the transport has a
+        pool of its own which is closed with the transport
+    """
+    scheme = "http"
+    # Request bodies larger than encode_threshold bytes are gzipped at this
+    # level, encode_threshold is None to never compress them
+    compress_level = 6
+    # The socket timeout in seconds of the requests, None for the default
+    timeout = None
+
+    def __init__(self, codec=None, use_datetime=0, pool=None):
+        xmlrpclib.Transport.__init__(self, use_datetime)
+        self.codec = get_codec(codec)
+        self._own_pool = pool == None
+        self.pool = pool if pool != None else ConnectionPool()
+
+    def make_connection(self, host):
+        """Open a new connection to the host"""
+        chost, extra_headers, x509 = self.get_host_info(host)
+        return _HTTPConnection(chost)
+
+    def acquire(self, host, timeout=None):
+        """Take a connection to the host from the pool, with its socket
+        timeout set to timeout, or to the timeout of the transport"""
+        connection = self.pool.acquire((self.scheme, host), lambda: self.make_connection(host))
+        if timeout == None:
+            timeout = self.timeout
+        connection.timeout = timeout if timeout != None else socket.getdefaulttimeout()
+        if connection.sock != None:
+            connection.sock.settimeout(connection.timeout)
+        return connection
+
+    def release(self, host, connection):
+        self.pool.release((self.scheme, host), connection)
+
+    def send_host(self, connection, host):
+        # Any credentials come from the host, as a pooled connection may not
+        # have been made by this transport
+        chost, extra_headers, x509 = self.get_host_info(host)
+        for key, value in extra_headers or ():
+            connection.putheader(key, value)
+
+    def single_request(self, host, handler, request_body, verbose=0):
+        """Send a request on a pooled connection, which is put back once the
+        response has been read. request() retries this once if the connection
+        turns out to have been closed by the server."""
+        connection = self.acquire(host)
+        if verbose:
+            connection.set_debuglevel(1)
+        self.verbose = verbose
+        try:
+            self.send_request(connection, handler, request_body)
+            self.send_host(connection, host)
+            self.send_user_agent(connection)
+            self.send_content(connection, request_body)
+            response = connection.getresponse(buffering=True)
+            body = self.read_response(response)
+        except Exception:
+            connection.close()
+            raise
+        self.release(host, connection)
+        if response.status != 200:
+            raise xmlrpclib.ProtocolError(host + handler, response.status,
+                                          response.reason, response.msg)
+        return self.codec.loads_response(body)
+
+    def close(self):
+        """Close the idle connections of the pool, if it is not shared"""
+        if self._own_pool:
+            self.pool.close()
+
+    def send_content(self, connection, request_body):
+        headers = {"Content-Type": self.codec.content_type}
+        request_body = self.compress(request_body, headers)
+        for name, value in headers.iteritems():
+            connection.putheader(name, value)
+        self.send_body(connection, request_body)
+
+    def compress(self, body, headers):
+        """Gzip a request body larger than encode_threshold, adding the
+        Content-Encoding to the headers dict. A ChunkedBody, or a file, is
+        compressed as it is sent."""
+        if self.encode_threshold is None or body is None:
+            return body
+        if isinstance(body, str):
+            if len(body) <= self.encode_threshold:
+                return body
+            headers["Content-Encoding"] = "gzip"
+            return gzip_encode(body, self.compress_level)
+        if not isinstance(body, ChunkedBody):
+            body = FileBody(body)
+        if isinstance(body, FileBody) and body.length != None and body.length <= self.encode_threshold:
+            return body
+        headers["Content-Encoding"] = "gzip"
+        level = self.compress_level
+        compressed = ChunkedBody(lambda: _gzip_chunks(body.chunks(), level))
+        compressed.repeatable = getattr(body, "repeatable", True)
+        return compressed
+
+    def send_body(self, connection, body):
+        """End the headers and send the body, which may be a string, a file,
+        a FileBody, a ChunkedBody sent using chunked transfer encoding, or
+        None"""
+        if body is None or isinstance(body, str):
+            connection.putheader("Content-Length", str(len(body or "")))
+            connection.endheaders(body)
+            return
+        if not isinstance(body, ChunkedBody):
+            body = FileBody(body)
+        if isinstance(body, FileBody) and body.length != None:
+            connection.putheader("Content-Length", str(body.length))
+            connection.endheaders()
+            for chunk in body:
+                connection.send(chunk)
+            return
+        connection.putheader("Transfer-Encoding", "chunked")
+        connection.endheaders()
+        for chunk in body:
+            if not chunk:
+                continue
+            if isinstance(chunk, str):
+                connection.send("%x\r\n%s\r\n" % (len(chunk), chunk))
+            else:
+                # Send a buffer as it is rather than copying it into the frame
+                connection.send("%x\r\n" % len(chunk))
+                connection.send(chunk)
+                connection.send("\r\n")
+        connection.send("0\r\n\r\n")
+
+    def parse_response(self, response):
+        """Read the whole response and decode it with the codec"""
+        return self.codec.loads_response(self.read_response(response))
+
+    def read_response(self, response):
+        """Read the whole body of a response"""
+        if hasattr(response, "getheader") and response.getheader("Content-Encoding", "") == "gzip":
+            stream = GzipDecoder(response)
+        else:
+            stream = response
+        chunks = []
+        while 1:
+            data = stream.read(BLOCK_SIZE)
+            if not data:
+                break
+            if self.verbose:
+                print "body:", repr(data)
+            chunks.append(data)
+        if stream is not response:
+            stream.close()
+        return "".join(chunks)
+
+    def stream_request(self, host, handler, request_body, verbose=0):
+        """Send the request on a pooled connection, returning a ResponseStream
+        to read the response from as it arrives. The caller must close the
+        stream, which puts the connection back if the response was read."""
+        for attempt in (0, 1):
+            connection = self.acquire(host)
+            if verbose:
+                connection.set_debuglevel(1)
+            try:
+                self.send_request(connection, handler, request_body)
+                self.send_host(connection, host)
+                self.send_user_agent(connection)
+                self.send_content(connection, request_body)
+                response = connection.getresponse(buffering=True)
+                break
+            except Exception, e:
+                connection.close()
+                if attempt or not _is_stale(e):
+                    raise
+        stream = ResponseStream(connection, response, lambda connection: self.release(host, connection))
+        if response.status != 200:
+            stream.read()
+            stream.close()
+            raise xmlrpclib.ProtocolError(host + handler, response.status,
+                                          response.reason, response.msg)
+        return stream
+
+    def open_request(self, host, method, path, body=None, headers=None, compress=False, timeout=None):
+        """Make a plain HTTP request on a pooled connection, such as a file
+        upload, returning the ResponseStream of the response whatever its
+        status. The request is sent again on a new connection if the pooled
+        one had been closed by the server, when the body can be sent again.
+
+        :param compress: gzip the body, as for the calls
+        :param timeout: the socket timeout of the request, by default the
+            timeout of the transport
+        """
+        headers = dict(headers or {})
+        chost, extra_headers, x509 = self.get_host_info(host)
+        headers.update(extra_headers or ())
+        if self.accept_gzip_encoding:
+            headers.setdefault("Accept-Encoding", "gzip")
+        if body != None and not isinstance(body, (str, ChunkedBody)):
+            body = FileBody(body)
+        if compress:
+            body = self.compress(body, headers)
+        for attempt in (0, 1):
+            connection = self.acquire(host, timeout)
+            try:
+                connection.putrequest(method, path, skip_accept_encoding=True)
+                for name, value in headers.iteritems():
+                    connection.putheader(name, value)
+                self.send_body(connection, body)
+                response = connection.getresponse(buffering=True)
+                break
+            except Exception, e:
+                connection.close()
+                if attempt or not _is_stale(e) or not getattr(body, "repeatable", True):
+                    raise
+        return ResponseStream(connection, response, lambda connection: self.release(host, connection))
+
+class ResponseStream(object):
+    """The body of a response. Closing it puts the connection back in its pool
+    if the whole response was read, or closes the connection otherwise.
+
+    :param release: called with the connection to put it back in the pool
+    """
+    def __init__(self, connection, response, release=None):
+        self._connection = connection
+        self._response = response
+        self._release = release
+        self.status = response.status
+        self.reason = response.reason
+        if response.getheader("Content-Encoding", "") == "gzip":
+            self._stream = GzipDecoder(response)
+        else:
+            self._stream = response
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def read(self, size=-1):
+        if size < 0:
+            return self._stream.read()
+        return self._stream.read(size)
+
+    def close(self):
+        if self._connection is None:
+            return
+        if self._stream is not self._response:
+            self._stream.close()
+        finished = self._response.isclosed()
+        self._response.close()
+        if finished and self._release != None:
+            self._release(self._connection)
+        else:
+            self._connection.close()
+        self._connection = None
+
+class SafeCodecTransport(CodecTransport, xmlrpclib.SafeTransport):
+    """The HTTPS version of the CodecTransport"""
+    scheme = "https"
+
+    def __init__(self, codec=None, use_datetime=0, context=None, pool=None):
+        CodecTransport.__init__(self, codec, use_datetime, pool)
+        self.context = context
+
+    def make_connection(self, host):
+        chost, extra_headers, x509 = self.get_host_info(host)
+        return _HTTPSConnection(chost, None, context=self.context, **(x509 or {}))
+
+class ServerProxy(object):
+    """A proxy to the remote server, method calls on this object are sent to
+    the server using the codec.
+
+    :param uri: the server URL, credentials may be given as user:password@host
+    :param codec: a Codec or codec name, defaults to XML-RPC
+    :param transport: an optional transport to use instead of the default one
+    :param pool: an optional ConnectionPool for the default transport to share
+    """
+    def __init__(self, uri, codec=None, transport=None, verbose=False, pool=None):
+        protocol, uri = urllib.splittype(uri)
+        if protocol not in ("http", "https"):
+            raise IOError("unsupported protocol")
+        self.__host, self.__handler = urllib.splithost(uri)
+        if not self.__handler:
+            self.__handler = "/RPC2"
+
+        if transport == None:
+            if protocol == "https":
+                transport = SafeCodecTransport(codec, pool=pool)
+            else:
+                transport = CodecTransport(codec, pool=pool)
+        self.__transport = transport
+        self.__codec = transport.codec
+        self.__verbose = verbose
+
+    def __request(self, methodname, params):
+        return self.__send(self.__codec.dumps_request(methodname, params))
+
+    def __send(self, request):
+        return self.__transport.request(self.__host, self.__handler, request,
+                                        verbose=self.__verbose)
+
+    def __stream(self, methodname, params):
+        return self.__transport.stream_request(self.__host, self.__handler,
+                self.__codec.dumps_request(methodname, params), verbose=self.__verbose)
+
+    def __open(self, method, path, body=None, headers=None, compress=False, timeout=None):
+        return self.__transport.open_request(self.__host, method, path, body, headers, compress, timeout)
+
+    def __repr__(self):
+        return "<ServerProxy for %s%s (%s)>" % (self.__host, self.__handler, self.__codec.name)
+
+    def __getattr__(self, name):
+        return xmlrpclib._Method(self.__request, name)
+
+    def __call__(self, attr):
+        """Access the transport or codec of this proxy, send to send an
+        already encoded request, stream to make a call returning the
+        ResponseStream, or open to make a plain HTTP request to the server"""
+        if attr == "transport":
+            return self.__transport
+        elif attr == "codec":
+            return self.__codec
+        elif attr == "send":
+            return self.__send
+        elif attr == "stream":
+            return self.__stream
+        elif attr == "open":
+            return self.__open
+        elif attr == "close":
+            return self.__transport.close
+        raise AttributeError("Attribute %r not found" % (attr,))